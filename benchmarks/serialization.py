@@ -0,0 +1,120 @@
+# compares the frontend serialization helpers of util on realistic list payloads
+# run from the service root (needs the service requirements, no database):
+# python -m submodules.model.benchmarks.serialization [rows] [repeat]
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine, text
+
+# general first like the rest of the package, importing util first runs into the util -> general -> session -> util cycle
+from ..business_objects import general  # noqa: F401
+from .. import util
+from ..models import CognitionMarkdownFile
+
+
+def build_rows(amount: int) -> List[Any]:
+    # real Row objects, sqlite generates them without a postgres connection
+    engine = create_engine("sqlite://")
+    query = f"""
+    WITH RECURSIVE cnt(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM cnt WHERE x < {amount})
+    SELECT
+        x AS record_id,
+        'project_' || (x % 10) AS project_id,
+        'some attribute value ' || x AS attribute_value,
+        x * 0.5 AS confidence_score,
+        x % 2 = 0 AS is_gold_star,
+        datetime('now') AS created_at
+    FROM cnt
+    """
+    with engine.connect() as connection:
+        return connection.execute(text(query)).fetchall()
+
+
+def build_models(amount: int) -> List[CognitionMarkdownFile]:
+    # transient instances, same column values a list endpoint would serialize
+    now = datetime.now()
+    return [
+        CognitionMarkdownFile(
+            id=uuid.uuid4(),
+            organization_id=uuid.uuid4(),
+            dataset_id=uuid.uuid4(),
+            created_by=uuid.uuid4(),
+            created_at=now - timedelta(minutes=idx),
+            started_at=now,
+            finished_at=now,
+            file_name=f"file_{idx}.pdf",
+            category_origin="PDF",
+            state="FINISHED",
+            is_reviewed=idx % 3 == 0,
+            meta_data={"page_count": idx % 50, "source_info": {"file_size": idx}},
+        )
+        for idx in range(amount)
+    ]
+
+
+def build_dicts(amount: int) -> List[Dict[str, Any]]:
+    # already converted results, e.g. from json_agg queries with nested data
+    return [
+        {
+            "conversation_id": uuid.uuid4(),
+            "created_at": datetime.now(),
+            "message_data": [
+                {
+                    "message_id": str(uuid.uuid4()),
+                    "time_elapsed": 1.5,
+                    "has_error": False,
+                }
+                for _ in range(5)
+            ],
+        }
+        for _ in range(amount)
+    ]
+
+
+def get_cases(amount: int) -> List[Tuple[str, Callable, Callable]]:
+    rows = build_rows(amount)
+    models = build_models(amount)
+    dicts = build_dicts(amount)
+    return [
+        (
+            "rows",
+            lambda: util.sql_alchemy_to_dict(rows, for_frontend=True),
+            lambda: util.sql_alchemy_to_frontend_obj(rows),
+        ),
+        (
+            "models",
+            lambda: util.sql_alchemy_to_dict(models, for_frontend=True),
+            lambda: util.sql_alchemy_to_frontend_obj(models),
+        ),
+        (
+            "dicts",
+            lambda: util.to_frontend_obj(dicts),
+            lambda: util.to_frontend_obj_fast(dicts),
+        ),
+        (
+            "rows (json)",
+            lambda: util.json.dumps(util.sql_alchemy_to_dict(rows, for_frontend=True)),
+            lambda: util.to_frontend_json(rows),
+        ),
+    ]
+
+
+def run(amount: int = 5000, repeat: int = 5) -> None:
+    print(f"{amount} items, best of {repeat}, orjson: {util.orjson is not None}")
+    print(f"{'case':<15}{'current (ms)':>15}{'fast (ms)':>15}{'speedup':>10}")
+    for name, current, fast in get_cases(amount):
+        if not name.endswith("(json)") and current() != fast():
+            raise ValueError(f"Results of case {name} differ")
+        current_time = min(timeit.repeat(current, number=1, repeat=repeat)) * 1000
+        fast_time = min(timeit.repeat(fast, number=1, repeat=repeat)) * 1000
+        print(
+            f"{name:<15}{current_time:>15.2f}{fast_time:>15.2f}{current_time / fast_time:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
@@ -4,7 +4,7 @@ from typing import Dict, Any, List, Optional
 from sqlalchemy import func
 from sqlalchemy.orm.attributes import flag_modified
 
-from . import general
+from . import general, tokenization
 from ..enums import AttributeState, AttributeVisibility, DataTypes, RecordCategory
 from ..models import Attribute
 from ..session import session
@@ -246,7 +246,9 @@ def create(
     if finished_at is not None:
         attribute.finished_at = finished_at
 
-    general.add(attribute, with_commit)
+    general.add(attribute)
+    __enqueue_tokenization_work(attribute)
+    general.flush_or_commit(with_commit)
     return attribute
 
 
@@ -292,10 +294,21 @@ def update(
     if finished_at is not None:
         attribute.finished_at = finished_at
 
+    if data_type is not None or state is not None:
+        general.flush()
+        __enqueue_tokenization_work(attribute)
     general.flush_or_commit(with_commit)
     return attribute
 
 
+def __enqueue_tokenization_work(attribute: Attribute) -> None:
+    if attribute.data_type != DataTypes.TEXT.value:
+        return
+    tokenization.enqueue_tokenization_work(
+        str(attribute.project_id), attribute_ids=[attribute.id]
+    )
+
+
 def delete(project_id: str, attribute_id: str, with_commit: bool = False) -> None:
     session.query(Attribute).filter(
         Attribute.project_id == project_id,
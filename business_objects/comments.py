@@ -1,5 +1,4 @@
 from datetime import datetime
-from . import record
 from .. import CommentData
 from . import general, organization
 from .. import enums
@@ -90,21 +89,25 @@ def get_add_info_category(
             {where_add}
             ORDER BY lt.id, t.name )x        
         """
+    elif category == enums.CommentCategory.RECORD:
+        # name resolved in the same query instead of record.get_first_no_text_column
+        where_add = __build_add_info_where(category, project_id, xfkey, "r")
+        query = f"""
+        SELECT row_to_json(x)
+        FROM (
+            SELECT r.id::TEXT, {__RECORD_NAME_SELECT} AS name
+            FROM record r
+            {__RECORD_NAME_JOIN}
+            {where_add}
+            LIMIT 1 )x """
     else:
         table_name = category.get_table_name()
-
-        if category == enums.CommentCategory.RECORD:
-            name_col = record.get_first_no_text_column(project_id, xfkey)
-        else:
-            name_col = category.get_name_col()
+        name_col = category.get_name_col()
 
         if name_col:
             name_col = f", {name_col} AS name"
         if category == enums.CommentCategory.USER:
             table_name = "public.user"
-        limit_add = ""
-        if category == enums.CommentCategory.RECORD:
-            limit_add = "LIMIT 1"
         where_add = __build_add_info_where(category, project_id, xfkey)
 
         query = f"""
@@ -112,11 +115,147 @@ def get_add_info_category(
         FROM (
             SELECT id::TEXT {name_col}
             FROM {table_name}
-            {where_add}
-            {limit_add} )x """
+            {where_add} )x """
     return [r[0] for r in general.execute_all(query)]
 
 
+# same display name as record.get_first_no_text_column => first non text attribute & its value
+__RECORD_NAME_SELECT = "a.name || ': ' || (r.data ->> a.name)"
+__RECORD_NAME_JOIN = f"""
+            LEFT JOIN LATERAL (
+                SELECT a.name
+                FROM attribute a
+                WHERE a.project_id = r.project_id
+                    AND a.data_type NOT IN ('{enums.DataTypes.TEXT.value}', '{enums.DataTypes.CATEGORY.value}')
+                    AND a.state IN ('{enums.AttributeState.AUTOMATICALLY_CREATED.value}', '{enums.AttributeState.UPLOADED.value}', '{enums.AttributeState.USABLE.value}')
+                ORDER BY a.relative_position
+                LIMIT 1
+            ) a
+                ON TRUE"""
+
+
+def get_batch_info(
+    category: enums.CommentCategory,
+    xfkeys: List[str],
+    user_id: str,
+    project_id: Optional[str] = None,
+) -> Dict[str, Dict[str, Any]]:
+    # e.g. all records on a labeling page => {xfkey: {"comments", "has_comments", "name"}}
+    comments = get_by_xfkeys(category, xfkeys, user_id, project_id)
+    existence = has_comments_by_xfkeys(category, xfkeys, project_id)
+    names = get_names_by_xfkeys(category, xfkeys, project_id)
+    return {
+        xfkey: {
+            "comments": comments[xfkey],
+            "has_comments": existence[xfkey],
+            "name": names[xfkey],
+        }
+        for xfkey in comments
+    }
+
+
+def get_by_xfkeys(
+    category: enums.CommentCategory,
+    xfkeys: List[str],
+    user_id: str,
+    project_id: Optional[str] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    # comments visible to the user per xfkey ordered by order_key, [] for xfkeys without comments
+    xfkeys = __prepare_xfkeys(xfkeys)
+    if not xfkeys:
+        return {}
+    user_id = prevent_sql_injection(user_id, isinstance(user_id, str))
+    query = f"""
+    SELECT cd.xfkey::TEXT, json_agg(row_to_json(cd) ORDER BY cd.order_key)
+    FROM public.comment_data cd
+    WHERE cd.xftype = '{category.value}'
+        {__get_xfkeys_where_add(xfkeys, project_id, "cd")}
+        AND (cd.is_private = false OR cd.created_by = '{user_id}')
+    GROUP BY cd.xfkey
+    """
+    result = {xfkey: [] for xfkey in xfkeys}
+    for xfkey, comments in general.execute_all(query):
+        result[xfkey] = comments
+    return result
+
+
+def has_comments_by_xfkeys(
+    category: enums.CommentCategory,
+    xfkeys: List[str],
+    project_id: Optional[str] = None,
+) -> Dict[str, bool]:
+    # same semantic as has_comments (private comments of other users count as well)
+    xfkeys = __prepare_xfkeys(xfkeys)
+    if not xfkeys:
+        return {}
+    query = f"""
+    SELECT DISTINCT cd.xfkey::TEXT
+    FROM public.comment_data cd
+    WHERE cd.xftype = '{category.value}'
+        {__get_xfkeys_where_add(xfkeys, project_id, "cd")}
+    """
+    with_comments = {r[0] for r in general.execute_all(query)}
+    return {xfkey: xfkey in with_comments for xfkey in xfkeys}
+
+
+def get_names_by_xfkeys(
+    category: enums.CommentCategory,
+    xfkeys: List[str],
+    project_id: Optional[str] = None,
+) -> Dict[str, Optional[str]]:
+    # display names like get_add_info_category, None if there is no name (e.g. users)
+    xfkeys = __prepare_xfkeys(xfkeys)
+    if not xfkeys:
+        return {}
+    result = {xfkey: None for xfkey in xfkeys}
+    if category == enums.CommentCategory.LABEL:
+        query = f"""
+        SELECT t.id::TEXT, lt.name || ': ' || t.name
+        FROM labeling_task_label t
+        INNER JOIN labeling_task lt
+            ON t.project_id = lt.project_id AND t.labeling_task_id = lt.id
+        WHERE TRUE {__get_xfkeys_where_add(xfkeys, project_id, "t", "id")}
+        """
+    elif category == enums.CommentCategory.RECORD:
+        query = f"""
+        SELECT r.id::TEXT, {__RECORD_NAME_SELECT}
+        FROM record r
+        {__RECORD_NAME_JOIN}
+        WHERE TRUE {__get_xfkeys_where_add(xfkeys, project_id, "r", "id")}
+        """
+    elif category.get_name_col():
+        if category == enums.CommentCategory.ORGANIZATION:
+            # organizations aren't project bound
+            project_id = None
+        query = f"""
+        SELECT x.id::TEXT, x.{category.get_name_col()}
+        FROM {category.get_table_name()} x
+        WHERE TRUE {__get_xfkeys_where_add(xfkeys, project_id, "x", "id")}
+        """
+    else:
+        return result
+    for xfkey, name in general.execute_all(query):
+        result[xfkey] = name
+    return result
+
+
+def __prepare_xfkeys(xfkeys: List[str]) -> List[str]:
+    return list(dict.fromkeys(prevent_sql_injection(str(k), True) for k in xfkeys))
+
+
+def __get_xfkeys_where_add(
+    xfkeys: List[str],
+    project_id: Optional[str],
+    table_indicator: str,
+    key_column: str = "xfkey",
+) -> str:
+    where_add = f"AND {table_indicator}.{key_column} IN ('" + "','".join(xfkeys) + "')"
+    if project_id:
+        project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+        where_add += f" AND {table_indicator}.project_id = '{project_id}'"
+    return where_add
+
+
 def __build_add_info_where(
     category: enums.CommentCategory,
     project_id: Optional[str] = None,
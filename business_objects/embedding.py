@@ -3,7 +3,7 @@ from datetime import datetime
 from typing import List, Any, Optional, Dict, Iterable, Tuple
 from sqlalchemy import cast, TEXT, sql
 
-from . import general
+from . import general, event_channel
 from .. import models, EmbeddingTensor, Embedding
 from ..session import session
 from .. import enums
@@ -689,6 +689,12 @@ def __update_embedding_state(
     embedding_item = get(project_id, embedding_id)
     if embedding_item and not embedding_item.state == enums.EmbeddingState.FAILED.value:
         embedding_item.state = state
+        event_channel.notify(
+            enums.DBEventType.EMBEDDING_STATE_CHANGED,
+            project_id=project_id,
+            embedding_id=embedding_id,
+            state=state,
+        )
         general.flush_or_commit(with_commit)
 
 
@@ -699,8 +705,27 @@ def delete(project_id: str, embedding_id: str, with_commit: bool = False) -> Non
     general.flush_or_commit(with_commit)
 
 
-def delete_tensors(embedding_id: str, with_commit: bool = False) -> None:
-    session.query(EmbeddingTensor).filter(EmbeddingTensor.id == embedding_id).delete()
+def delete_tensors(
+    embedding_id: str,
+    with_commit: bool = False,
+    batch_size: Optional[int] = None,
+    throttle_seconds: float = 0.0,
+) -> None:
+    if batch_size:
+        # commits after every batch so with_commit isn't relevant
+        embedding_id = prevent_sql_injection(
+            embedding_id, isinstance(embedding_id, str)
+        )
+        general.delete_in_batches(
+            "embedding_tensor",
+            f"t.embedding_id = '{embedding_id}'",
+            batch_size,
+            throttle_seconds,
+        )
+        return
+    session.query(EmbeddingTensor).filter(
+        EmbeddingTensor.embedding_id == embedding_id
+    ).delete()
     general.flush_or_commit(with_commit)
 
 
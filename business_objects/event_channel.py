@@ -0,0 +1,159 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from enum import Enum
+import json
+import select
+import time
+import traceback
+from threading import Event
+from sqlalchemy.sql import text as sql_text
+
+from . import general
+from .. import daemon, enums
+from ..session import engine
+
+CHANNEL = "refinery_model_events"
+# postgres limits NOTIFY payloads to 8000 bytes
+MAX_PAYLOAD_BYTES = 7900
+
+
+def notify(event_type: enums.DBEventType, with_commit: bool = False, **data) -> None:
+    # NOTIFY is transactional => listeners receive the event after the commit (or never on rollback)
+    # keep payloads small (ids & states), listeners should load details themselves
+    # payloads over the size limit are sent without their lists & with truncated=True (listeners should resync)
+    payload = __build_payload(event_type, data)
+    payload_str = json.dumps(payload)
+    if __byte_size(payload_str) > MAX_PAYLOAD_BYTES:
+        payload = {k: v for k, v in payload.items() if not isinstance(v, (list, tuple))}
+        payload["truncated"] = True
+        payload_str = json.dumps(payload)
+    if __byte_size(payload_str) > MAX_PAYLOAD_BYTES:
+        payload_str = json.dumps({"type": event_type.value, "truncated": True})
+    general.execute(
+        sql_text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": payload_str},
+    )
+    general.flush_or_commit(with_commit)
+
+
+def notify_chunked(
+    event_type: enums.DBEventType,
+    list_key: str,
+    values: List[Any],
+    with_commit: bool = False,
+    **data,
+) -> None:
+    # same as notify but data[list_key] = values is split over as many events as needed to fit the size limit
+    base_size = __byte_size(
+        json.dumps({**__build_payload(event_type, data), list_key: []})
+    )
+    chunk, chunk_size = [], base_size
+    for value in values:
+        value = __to_json_value(value)
+        # +2 for the separator
+        value_size = __byte_size(json.dumps(value)) + 2
+        if chunk and chunk_size + value_size > MAX_PAYLOAD_BYTES:
+            notify(event_type, **{**data, list_key: chunk})
+            chunk, chunk_size = [], base_size
+        chunk.append(value)
+        chunk_size += value_size
+    if chunk:
+        notify(event_type, **{**data, list_key: chunk})
+    general.flush_or_commit(with_commit)
+
+
+def listen(
+    callback: Callable[[Dict[str, Any]], None],
+    event_types: Optional[Iterable[enums.DBEventType]] = None,
+    stop_event: Optional[Event] = None,
+    poll_timeout: float = 5.0,
+    max_reconnect_delay: float = 30.0,
+    on_reconnect: Optional[Callable[[], None]] = None,
+) -> None:
+    # blocks & calls callback(payload) per event on a dedicated connection (not part of the pool)
+    # events sent while disconnected are lost, on_reconnect can be used to resync (e.g. one poll)
+    type_filter = {e.value for e in event_types} if event_types else None
+    reconnect_delay = 1.0
+    connected_before = False
+    while not (stop_event and stop_event.is_set()):
+        connection = None
+        try:
+            connection = __get_listen_connection()
+            reconnect_delay = 1.0
+            if connected_before and on_reconnect:
+                on_reconnect()
+            connected_before = True
+            while not (stop_event and stop_event.is_set()):
+                if select.select([connection], [], [], poll_timeout) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    try:
+                        payload = json.loads(notification.payload)
+                    except ValueError:
+                        continue
+                    if type_filter and payload.get("type") not in type_filter:
+                        continue
+                    try:
+                        callback(payload)
+                    except Exception:
+                        print(traceback.format_exc(), flush=True)
+        except Exception:
+            print("event channel listener lost connection, reconnecting", flush=True)
+            print(traceback.format_exc(), flush=True)
+            time.sleep(reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, max_reconnect_delay)
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+
+def start_listener_thread(
+    callback: Callable[[Dict[str, Any]], None],
+    event_types: Optional[Iterable[enums.DBEventType]] = None,
+    on_reconnect: Optional[Callable[[], None]] = None,
+) -> Event:
+    # returns the stop event, set it to end the listener
+    stop_event = Event()
+    daemon.run_without_db_token(
+        listen,
+        callback,
+        event_types=event_types,
+        stop_event=stop_event,
+        on_reconnect=on_reconnect,
+    )
+    return stop_event
+
+
+def __get_listen_connection() -> Any:
+    pooled = engine.raw_connection()
+    # detached => the connection is closed instead of returned to the pool
+    pooled.detach()
+    connection = pooled.connection
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f"LISTEN {CHANNEL};")
+    return connection
+
+
+def __build_payload(event_type: enums.DBEventType, data: Dict[str, Any]) -> Dict:
+    payload = {"type": event_type.value}
+    payload.update({k: __to_json_value(v) for k, v in data.items()})
+    return payload
+
+
+def __byte_size(payload_str: str) -> int:
+    return len(payload_str.encode("utf-8"))
+
+
+def __to_json_value(value: Any) -> Any:
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [__to_json_value(v) for v in value]
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
@@ -1,5 +1,8 @@
 import uuid
-from typing import Any, Dict, List, Optional, Union
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+from sqlalchemy.sql import text as sql_text
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm.session import make_transient as make_transient_original
 from ..session import session, engine
 from ..session import request_id_ctx_var
@@ -7,11 +10,17 @@ from ..session import check_session_and_rollback as check_and_roll
 from ..enums import Tablenames, try_parse_enum_value
 import traceback
 import datetime
+import time
 from .. import daemon
 from threading import Lock
 
 
 __THREAD_LOCK = Lock()
+__SCHEMA_CACHE_LOCK = Lock()
+
+# (table_schema, table_name) -> column names in definition order
+# filled from information_schema on first use, the model metadata is only a fallback (see __load_schema_columns)
+__schema_columns = {}
 
 session_lookup = {}
 
@@ -138,10 +147,77 @@ def execute_first(sql: str) -> Any:
     return session.execute(sql).first()
 
 
+def execute_stream(sql: str, chunk_size: int = 1000) -> Iterator[List[Any]]:
+    # server side cursor so the result isn't fully loaded into memory, rows are returned in chunks
+    # stopping early (break/close) closes the server side cursor
+    result = session.execute(sql_text(sql).execution_options(stream_results=True))
+    try:
+        for partition in result.partitions(chunk_size):
+            yield partition
+    finally:
+        result.close()
+
+
 def execute_distinct_count(count_sql: str) -> int:
     return session.execute(count_sql).first().distinct_count
 
 
+def delete_in_batches(
+    table: str,
+    where_condition: str,
+    batch_size: int = 5000,
+    throttle_seconds: float = 0.0,
+    progress_callback: Optional[Callable[[str, int], None]] = None,
+) -> int:
+    # deletes in bounded batches (keyset over id) & commits in between to keep row locks/WAL small
+    # where_condition is plain sql that is used for the alias t, values need to be masked beforehand
+    # note that this commits the session after every batch
+    query = f"""
+    WITH batch AS (
+        SELECT t.id
+        FROM {table} t
+        WHERE ({where_condition}) @@LAST_ID@@
+        ORDER BY t.id
+        LIMIT {int(batch_size)}
+    ), deleted AS (
+        DELETE FROM {table} d
+        USING batch b
+        WHERE d.id = b.id
+        RETURNING d.id
+    )
+    SELECT COUNT(*) deleted_count, MAX(id::TEXT) last_id
+    FROM deleted
+    """
+    last_id_filter = ""
+    total = 0
+    while True:
+        result = execute_first(query.replace("@@LAST_ID@@", last_id_filter))
+        commit()
+        if not result or not result.deleted_count:
+            break
+        total += result.deleted_count
+        if progress_callback:
+            progress_callback(table, total)
+        if result.deleted_count < batch_size:
+            break
+        # uuid ordering equals the ordering of the text representation
+        last_id_filter = f"AND t.id > '{result.last_id}'"
+        if throttle_seconds:
+            time.sleep(throttle_seconds)
+    return total
+
+
+def estimate_count(sql: str) -> int:
+    # planner estimate instead of an exact COUNT, precise enough for page indicators
+    result = execute_first(f"EXPLAIN (FORMAT JSON) {sql}")
+    if not result or not result[0]:
+        return 0
+    plan = result[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
 def set_seed(seed: float = 0) -> None:
     execute(f"SELECT setseed({seed});")
 
@@ -212,37 +288,17 @@ def construct_select_columns(
     else:
         prefix += "."
 
-    column_exclusion = ""
-    column_inclusion = ""
-    if exclude_columns or include_columns:
-        if exclude_columns:
-            if isinstance(exclude_columns, str):
-                column_exclusion = f"AND c.column_name != '{exclude_columns}'"
-            else:
-                column_exclusion = (
-                    "AND c.column_name NOT IN ('" + "','".join(exclude_columns) + "')"
-                )
-        if include_columns:
-            if isinstance(include_columns, str):
-                column_inclusion = f"AND c.column_name = '{include_columns}'"
-            else:
-                column_inclusion = (
-                    "AND c.column_name IN ('" + "','".join(include_columns) + "')"
-                )
-    else:
+    if not exclude_columns and not include_columns:
         return prefix + "*"
 
-    query = f"""
-    SELECT column_name
-    FROM information_schema.columns As c
-    WHERE table_name = '{table_enum.value}'
-    AND c.table_schema = '{table_schema}'
-    {column_exclusion}
-    {column_inclusion}
-    ORDER BY ordinal_position
-    """
-
-    columns = [prefix + r[0] for r in execute_all(query)]
+    columns = [
+        prefix + c
+        for c in __filter_columns(
+            get_table_columns(table_enum.value, table_schema),
+            exclude_columns,
+            include_columns,
+        )
+    ]
     join_on_me = ",\n"
     join_on_me += INDENT * indent
     return join_on_me.join(columns)
@@ -274,3 +330,115 @@ def simple_selection_builder(
     {where}
     {order_by_s}
     """
+
+
+def get_table_columns(table: str, table_schema: Optional[str] = None) -> List[str]:
+    # column names in definition order, resolved from the in memory schema cache
+    if table_schema is None:
+        table_schema = "public"
+    key = (table_schema, table)
+    with __SCHEMA_CACHE_LOCK:
+        loaded = bool(__schema_columns)
+    if not loaded:
+        refresh_schema_cache()
+    with __SCHEMA_CACHE_LOCK:
+        columns = __schema_columns.get(key)
+    if columns is None:
+        # table unknown to the models (e.g. only created by a migration)
+        columns = __get_schema_columns_from_db(table, table_schema).get(key, [])
+        with __SCHEMA_CACHE_LOCK:
+            __schema_columns[key] = columns
+    return columns
+
+
+def refresh_schema_cache(from_db: bool = True) -> None:
+    # e.g. after migrations, from_db=False only uses the model metadata
+    schema_columns = (
+        __load_schema_columns() if from_db else __get_schema_columns_from_metadata()
+    )
+    with __SCHEMA_CACHE_LOCK:
+        __schema_columns.clear()
+        __schema_columns.update(schema_columns)
+
+
+def __load_schema_columns() -> Dict[Any, List[str]]:
+    # the db state wins (columns of pending/rolled back migrations), the models only fill gaps
+    # or serve as fallback if information_schema can't be read
+    schema_columns = __get_schema_columns_from_metadata()
+    try:
+        schema_columns.update(__get_schema_columns_from_db())
+    except Exception:
+        print(traceback.format_exc(), flush=True)
+    return schema_columns
+
+
+def get_projection_columns(
+    model: Any,
+    exclude_columns: Optional[Union[str, List[str]]] = None,
+    include_columns: Optional[Union[str, List[str]]] = None,
+) -> List[Any]:
+    # column attributes for session.query(*columns) => rows instead of entities
+    return [
+        getattr(model, c)
+        for c in __filter_columns(
+            [c.key for c in model.__mapper__.column_attrs],
+            exclude_columns,
+            include_columns,
+        )
+    ]
+
+
+def get_load_only_option(
+    model: Any,
+    exclude_columns: Optional[Union[str, List[str]]] = None,
+    include_columns: Optional[Union[str, List[str]]] = None,
+) -> Any:
+    # e.g. query.options(get_load_only_option(Model, exclude_columns="content"))
+    # remaining columns are loaded on access
+    return load_only(*get_projection_columns(model, exclude_columns, include_columns))
+
+
+def __filter_columns(
+    columns: List[str],
+    exclude_columns: Optional[Union[str, List[str]]] = None,
+    include_columns: Optional[Union[str, List[str]]] = None,
+) -> List[str]:
+    if isinstance(exclude_columns, str):
+        exclude_columns = [exclude_columns]
+    if isinstance(include_columns, str):
+        include_columns = [include_columns]
+    if exclude_columns:
+        columns = [c for c in columns if c not in exclude_columns]
+    if include_columns:
+        columns = [c for c in columns if c in include_columns]
+    return columns
+
+
+def __get_schema_columns_from_metadata() -> Dict[Any, List[str]]:
+    # import here since the models aren't needed for the rest of general
+    from ..models import Base
+
+    return {
+        (table.schema or "public", table.name): [c.name for c in table.columns]
+        for table in Base.metadata.tables.values()
+    }
+
+
+def __get_schema_columns_from_db(
+    table: Optional[str] = None, table_schema: Optional[str] = None
+) -> Dict[Any, List[str]]:
+    where_add = ""
+    if table:
+        where_add = (
+            f"AND c.table_name = '{table}' AND c.table_schema = '{table_schema}'"
+        )
+    query = f"""
+    SELECT c.table_schema, c.table_name, array_agg(c.column_name::TEXT ORDER BY c.ordinal_position)
+    FROM information_schema.columns As c
+    WHERE c.table_schema NOT IN ('pg_catalog', 'information_schema') {where_add}
+    GROUP BY c.table_schema, c.table_name
+    """
+    # own connection so the (lazy) lookup can't flush or abort the caller's transaction
+    with engine.connect() as connection:
+        rows = connection.execute(sql_text(query)).all()
+    return {(r[0], r[1]): r[2] for r in rows}
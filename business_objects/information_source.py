@@ -1,5 +1,7 @@
+import json
 from datetime import datetime
 from sqlalchemy import cast, TEXT
+from sqlalchemy.orm import defer, selectinload
 from typing import Dict, List, Any, Optional
 
 from submodules.model import enums
@@ -37,14 +39,24 @@ def get_by_name(project_id: str, name: str) -> InformationSource:
     )
 
 
-def get_all(project_id: str) -> List[InformationSource]:
-    return (
-        session.query(InformationSource)
-        .filter(
-            InformationSource.project_id == project_id,
-        )
-        .all()
+def get_all(
+    project_id: str, with_payloads: bool = False, with_payload_data: bool = True
+) -> List[InformationSource]:
+    # with_payloads loads the payloads of all sources in one additional query
+    # with_payload_data=False leaves out their (large) input_data, output_data & logs
+    query = session.query(InformationSource).filter(
+        InformationSource.project_id == project_id,
     )
+    if with_payloads:
+        payload_option = selectinload(InformationSource.payloads)
+        if not with_payload_data:
+            payload_option = payload_option.options(
+                defer(InformationSourcePayload.input_data),
+                defer(InformationSourcePayload.output_data),
+                defer(InformationSourcePayload.logs),
+            )
+        query = query.options(payload_option)
+    return query.all()
 
 
 def get_all_ids_by_labeling_task_id(
@@ -274,6 +286,7 @@ def create(
         created_at=created_at,
         created_by=created_by,
     )
+    __set_source_code_keys(information_source)
     general.add(information_source, with_commit)
     return information_source
 
@@ -375,6 +388,7 @@ def update(
         information_source.description = description
     if source_code is not None:
         information_source.source_code = source_code
+        __set_source_code_keys(information_source)
     if is_selected is not None:
         information_source.is_selected = is_selected
     if version is not None:
@@ -566,3 +580,23 @@ def get_heuristic_id_with_most_recent_payload(project_id: str, heuristic_id: str
     WHERE h.project_id = '{project_id}' AND h.id = '{heuristic_id}'
     """
     return general.execute_first(query)
+
+
+def __set_source_code_keys(information_source: InformationSource) -> None:
+    # annotator heuristics store their settings as json in source_code
+    source_code = information_source.source_code
+    data_slice_id, annotator_id = None, None
+    if source_code and source_code.lstrip().startswith("{"):
+        try:
+            source_dict = json.loads(source_code)
+        except ValueError:
+            source_dict = None
+        if isinstance(source_dict, dict):
+            data_slice_id = source_dict.get("data_slice_id")
+            annotator_id = source_dict.get("annotator_id")
+    information_source.data_slice_id = (
+        str(data_slice_id) if data_slice_id is not None else None
+    )
+    information_source.annotator_id = (
+        str(annotator_id) if annotator_id is not None else None
+    )
@@ -0,0 +1,204 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import OrderedDict, deque
+from threading import Lock
+
+from . import general
+from ..util import prevent_sql_injection
+
+# compiled matchers are cached per knowledge base & matching mode
+INDEX_CACHE_MAX_ENTRIES = 100
+
+__INDEX_CACHE_LOCK = Lock()
+# (knowledge_base_id, case_sensitive, include_blacklisted) -> (term_version, matcher), least recently used first
+__index_cache = OrderedDict()
+
+
+class _Automaton:
+    # aho-corasick automaton, finds all term occurrences in one pass over the text
+
+    def __init__(self, terms: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+        for term in terms:
+            self.__add(term)
+        self.__build_fail_links()
+
+    def __add(self, term: str) -> None:
+        if not term:
+            return
+        state = 0
+        for char in term:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(term)
+
+    def __build_fail_links(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state] = (
+                    self.output[next_state] + self.output[self.fail[next_state]]
+                )
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        # yields (start, end, term)
+        state = 0
+        for idx, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for term in self.output[state]:
+                yield idx - len(term) + 1, idx + 1, term
+
+
+def match(
+    project_id: str,
+    texts: List[str],
+    knowledge_base_ids: Optional[List[str]] = None,
+    whole_words: bool = True,
+    case_sensitive: bool = True,
+    include_blacklisted: bool = False,
+) -> List[List[Dict[str, Any]]]:
+    # per text a list of {"knowledge_base_id", "value", "start", "end"} sorted by position
+    # value is the stored term (not the matched text in case insensitive mode)
+    matchers = __get_matchers(
+        project_id, knowledge_base_ids, case_sensitive, include_blacklisted
+    )
+    results = []
+    for text in texts:
+        text_matches = []
+        if text:
+            search_text, offsets = text, None
+            if not case_sensitive:
+                search_text, offsets = __lower_with_offsets(text)
+            for knowledge_base_id, (automaton, values) in matchers.items():
+                for start, end, term in automaton.iter_matches(search_text):
+                    if whole_words and not __is_whole_word(search_text, start, end):
+                        continue
+                    if offsets is not None:
+                        # positions are reported for the original text
+                        start, end = offsets[start], offsets[end - 1] + 1
+                    for value in values[term]:
+                        text_matches.append(
+                            {
+                                "knowledge_base_id": knowledge_base_id,
+                                "value": value,
+                                "start": start,
+                                "end": end,
+                            }
+                        )
+        text_matches.sort(key=lambda x: (x["start"], x["end"]))
+        results.append(text_matches)
+    return results
+
+
+def invalidate(knowledge_base_id: Optional[str] = None) -> None:
+    # usually not needed since term writes increment the term_version
+    with __INDEX_CACHE_LOCK:
+        if knowledge_base_id is None:
+            __index_cache.clear()
+            return
+        for key in [k for k in __index_cache if k[0] == str(knowledge_base_id)]:
+            del __index_cache[key]
+
+
+def __get_matchers(
+    project_id: str,
+    knowledge_base_ids: Optional[List[str]],
+    case_sensitive: bool,
+    include_blacklisted: bool,
+) -> Dict[str, Tuple[_Automaton, Dict[str, List[str]]]]:
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    where_add = ""
+    if knowledge_base_ids is not None:
+        if len(knowledge_base_ids) == 0:
+            return {}
+        knowledge_base_ids = prevent_sql_injection(
+            [str(x) for x in knowledge_base_ids], True
+        )
+        where_add = "AND kb.id IN ('" + "','".join(knowledge_base_ids) + "')"
+    versions = general.execute_all(
+        f"""
+        SELECT kb.id::TEXT, COALESCE(kb.term_version, 0)
+        FROM knowledge_base kb
+        WHERE kb.project_id = '{project_id}' {where_add}
+        """
+    )
+
+    matchers = {}
+    for knowledge_base_id, term_version in versions:
+        # blacklist state is part of the cached values => separate cache entries
+        key = (knowledge_base_id, case_sensitive, include_blacklisted)
+        with __INDEX_CACHE_LOCK:
+            cached = __index_cache.get(key)
+            if cached and cached[0] == term_version:
+                __index_cache.move_to_end(key)
+                matchers[knowledge_base_id] = cached[1]
+                continue
+        matcher = __compile(knowledge_base_id, case_sensitive, include_blacklisted)
+        with __INDEX_CACHE_LOCK:
+            __index_cache[key] = (term_version, matcher)
+            __index_cache.move_to_end(key)
+            while len(__index_cache) > INDEX_CACHE_MAX_ENTRIES:
+                __index_cache.popitem(last=False)
+        matchers[knowledge_base_id] = matcher
+    return matchers
+
+
+def __compile(
+    knowledge_base_id: str, case_sensitive: bool, include_blacklisted: bool
+) -> Tuple[_Automaton, Dict[str, List[str]]]:
+    where_add = "" if include_blacklisted else "AND NOT COALESCE(kt.blacklisted, FALSE)"
+    rows = general.execute_all(
+        f"""
+        SELECT kt.value
+        FROM knowledge_term kt
+        WHERE kt.knowledge_base_id = '{knowledge_base_id}' {where_add}
+        """
+    )
+    # search term -> stored values (multiple for case insensitive matching)
+    values: Dict[str, List[str]] = {}
+    for (value,) in rows:
+        if not value:
+            continue
+        term = value if case_sensitive else value.lower()
+        values.setdefault(term, []).append(value)
+    return _Automaton(values.keys()), values
+
+
+def __lower_with_offsets(text: str) -> Tuple[str, Optional[List[int]]]:
+    # lower() can change the length for some characters (e.g. "İ")
+    # => offsets[i] is the index in text of the character that produced lowered[i] (None if unchanged)
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered, None
+    parts = []
+    offsets = []
+    for idx, char in enumerate(text):
+        lowered_char = char.lower()
+        parts.append(lowered_char)
+        offsets.extend([idx] * len(lowered_char))
+    return "".join(parts), offsets
+
+
+def __is_whole_word(text: str, start: int, end: int) -> bool:
+    if start > 0 and (text[start - 1].isalnum() or text[start - 1] == "_"):
+        return False
+    if end < len(text) and (text[end].isalnum() or text[end] == "_"):
+        return False
+    return True
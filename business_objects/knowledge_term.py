@@ -1,4 +1,9 @@
-from typing import Iterable, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Tuple
+import csv
+import io
+import uuid
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 
 from . import general
 from ..models import KnowledgeTerm, KnowledgeBase
@@ -11,6 +16,10 @@ from ..business_objects import knowledge_base
 from ..util import prevent_sql_injection
 
 
+# rows per INSERT statement of create_by_value_list
+CREATE_BATCH_SIZE = 1000
+
+
 def get_by_value(knowledge_base_id: str, value: str) -> KnowledgeTerm:
     return (
         session.query(KnowledgeTerm)
@@ -108,7 +117,9 @@ def create(
     )
     if blacklisted:
         term.blacklisted = blacklisted
-    general.add(term, with_commit)
+    general.add(term, with_commit=False)
+    bump_term_version(knowledge_base_id)
+    general.flush_or_commit(with_commit)
     return term
 
 
@@ -118,21 +129,135 @@ def create_by_value_list(
     values: Iterable[str],
     with_commit: bool = False,
 ) -> List[KnowledgeTerm]:
+    # existing & duplicated values are skipped (unique_knowledge_term_value), empty values are ignored
+    # returns only the newly created terms, see bulk_import_values for large lists
     base: KnowledgeBase = knowledge_base.get(project_id, knowledge_base_id)
     if not base:
         raise EntityNotFoundException
-    terms = [
-        KnowledgeTerm(
-            project_id=project_id,
-            knowledge_base_id=knowledge_base_id,
-            value=value,
-            comment="",
+    # dict keeps the input order
+    values = list(dict.fromkeys(value for value in values if value))
+    tbl = KnowledgeTerm.__table__
+    term_ids = []
+    for idx in range(0, len(values), CREATE_BATCH_SIZE):
+        query = (
+            insert(tbl)
+            .values(
+                [
+                    {
+                        "id": uuid.uuid4(),
+                        "project_id": project_id,
+                        "knowledge_base_id": knowledge_base_id,
+                        "value": value,
+                        "comment": "",
+                        "blacklisted": False,
+                    }
+                    for value in values[idx : idx + CREATE_BATCH_SIZE]
+                ]
+            )
+            .on_conflict_do_nothing(constraint="unique_knowledge_term_value")
+            .returning(tbl.c.id)
         )
-        for value in values
-    ]
-    general.add_all(terms, with_commit=with_commit)
+        term_ids += [row.id for row in general.execute(query)]
+    if not term_ids:
+        general.flush_or_commit(with_commit)
+        return []
+    bump_term_version(knowledge_base_id)
+    general.flush_or_commit(with_commit)
+
+    terms = session.query(KnowledgeTerm).filter(KnowledgeTerm.id.in_(term_ids)).all()
+    positions = {value: idx for idx, value in enumerate(values)}
+    return sorted(terms, key=lambda term: positions[term.value])
 
-    return terms
+
+def bulk_import_values(
+    project_id: str,
+    knowledge_base_id: str,
+    values: Iterable[str],
+    comment: str = "",
+    with_commit: bool = False,
+) -> Dict[str, int]:
+    # values are staged via COPY & deduplicated in sql (against themselves & existing terms)
+    # returns the counts of inserted, skipped (duplicates & existing) & empty (not imported) values
+    base: KnowledgeBase = knowledge_base.get(project_id, knowledge_base_id)
+    if not base:
+        raise EntityNotFoundException
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    knowledge_base_id = prevent_sql_injection(
+        knowledge_base_id, isinstance(knowledge_base_id, str)
+    )
+    comment = prevent_sql_injection(comment, isinstance(comment, str))
+
+    staging_table, staged, empty = __stage_values(values)
+    query = f"""
+    WITH inserted AS (
+        INSERT INTO knowledge_term (id, project_id, knowledge_base_id, value, comment, blacklisted)
+        SELECT {general.generate_UUID_sql_string()}, '{project_id}', '{knowledge_base_id}', s.value, '{comment}', FALSE
+        FROM (SELECT DISTINCT value FROM {staging_table}) s
+        ON CONFLICT ON CONSTRAINT unique_knowledge_term_value DO NOTHING
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM inserted
+    """
+    inserted = general.execute_first(query)[0]
+    general.execute(f"DROP TABLE {staging_table}")
+    if inserted:
+        bump_term_version(knowledge_base_id)
+    general.flush_or_commit(with_commit)
+    return {"inserted": inserted, "skipped": staged - inserted, "empty": empty}
+
+
+def bulk_delete_by_value_list(
+    knowledge_base_id: str, value_list: Iterable[str], with_commit: bool = False
+) -> int:
+    # staged counterpart of delete_by_value_list for large lists, returns the deleted count
+    knowledge_base_id = prevent_sql_injection(
+        knowledge_base_id, isinstance(knowledge_base_id, str)
+    )
+    staging_table, _, _ = __stage_values(value_list)
+    query = f"""
+    WITH deleted AS (
+        DELETE FROM knowledge_term kt
+        USING (SELECT DISTINCT value FROM {staging_table}) s
+        WHERE kt.knowledge_base_id = '{knowledge_base_id}' AND kt.value = s.value
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM deleted
+    """
+    deleted = general.execute_first(query)[0]
+    general.execute(f"DROP TABLE {staging_table}")
+    if deleted:
+        bump_term_version(knowledge_base_id)
+    general.flush_or_commit(with_commit)
+    return deleted
+
+
+def __stage_values(values: Iterable[str]) -> Tuple[str, int, int]:
+    # COPY into a temporary table on the session connection (=> same transaction)
+    # returns the table name, the number of staged values & the number of empty (not staged) values
+    staging_table = f"tmp_knowledge_term_{uuid.uuid4().hex}"
+    general.execute(
+        f"CREATE TEMP TABLE {staging_table} (value TEXT NOT NULL) ON COMMIT DROP"
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    staged = 0
+    empty = 0
+    for value in values:
+        if not value:
+            # empty csv fields would be read as NULL, an empty term is never useful anyway
+            empty += 1
+            continue
+        writer.writerow([value])
+        staged += 1
+    buffer.seek(0)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {staging_table} (value) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+    return staging_table, staged, empty
 
 
 def update(
@@ -152,6 +277,7 @@ def update(
 
     term.value = value
     term.comment = comment
+    bump_term_version(term.knowledge_base_id)
     general.flush_or_commit(with_commit)
     return term
 
@@ -159,10 +285,14 @@ def update(
 def blacklist(term_id: str, with_commit: bool = False) -> None:
     term: KnowledgeTerm = get_by_id(term_id)
     term.blacklisted = not term.blacklisted
+    bump_term_version(term.knowledge_base_id)
     general.flush_or_commit(with_commit)
 
 
 def delete(term_id: str, with_commit: bool = False) -> None:
+    term: KnowledgeTerm = get_by_id(term_id)
+    if term:
+        bump_term_version(term.knowledge_base_id)
     session.query(KnowledgeTerm).filter(KnowledgeTerm.id == term_id).delete()
     general.flush_or_commit(with_commit)
 
@@ -174,4 +304,13 @@ def delete_by_value_list(
         KnowledgeTerm.knowledge_base_id == knowledge_base_id,
         KnowledgeTerm.value.in_(value_list),
     ).delete()
+    bump_term_version(knowledge_base_id)
     general.flush_or_commit(with_commit)
+
+
+def bump_term_version(knowledge_base_id: str) -> None:
+    # invalidates compiled matchers of the knowledge base (see knowledge_base_index)
+    session.query(KnowledgeBase).filter(KnowledgeBase.id == knowledge_base_id).update(
+        {KnowledgeBase.term_version: func.coalesce(KnowledgeBase.term_version, 0) + 1},
+        synchronize_session=False,
+    )
@@ -81,7 +81,7 @@ def __get_add_ids_data_slice(project_id: str, slice_id: str) -> List[str]:
     INNER JOIN information_source _is
         ON lal.project_id = _is.project_id AND lal.heuristic_id = _is.id
     WHERE lal.project_id = '{project_id}' 
-        AND _is.source_code::JSON->>'data_slice_id' = '{slice_id}'
+        AND _is.data_slice_id = '{slice_id}'
     """
     add_ids = general.execute_first(query)
     if add_ids:
@@ -107,7 +107,8 @@ def get_by_all_by_user_id(
         FROM labeling_access_link lal
         INNER JOIN information_source _is
             ON lal.project_id = _is.project_id AND lal.heuristic_id = _is.id
-        WHERE _is.source_code::JSON->>'annotator_id' = '{user_id}'
+        WHERE _is.annotator_id = '{user_id}'
+            AND lal.project_id = '{project_id}'
             AND NOT lal.is_locked
         """
         ids = [r[0] for r in general.execute_all(query)]
@@ -1,5 +1,5 @@
 from typing import Any, List, Optional
-from . import general
+from . import general, event_channel
 from .. import enums
 from ..models import TaskQueue, Organization
 from ..util import prevent_sql_injection
@@ -63,6 +63,7 @@ def set_information_source_payloads_to_failed(
     """
     query = __extend_where_for_update(query, project_id, task_id)
     general.execute(query)
+    __notify_failed(enums.Tablenames.INFORMATION_SOURCE_PAYLOAD, project_id, task_id)
     general.flush_or_commit(with_commit)
 
 
@@ -80,6 +81,7 @@ def set_attribute_calculation_to_failed(
     """
     query = __extend_where_for_update(query, project_id, task_id)
     general.execute(query)
+    __notify_failed(enums.Tablenames.ATTRIBUTE, project_id, task_id)
     general.flush_or_commit(with_commit)
 
 
@@ -98,6 +100,7 @@ def set_record_tokenization_task_to_failed(
     """
     query = __extend_where_for_update(query, project_id, task_id)
     general.execute(query)
+    __notify_failed(enums.Tablenames.RECORD_TOKENIZATION_TASK, project_id, task_id)
     general.flush_or_commit(with_commit)
 
 
@@ -115,6 +118,7 @@ def set_embedding_to_failed(
     """
     query = __extend_where_for_update(query, project_id, task_id)
     general.execute(query)
+    __notify_failed(enums.Tablenames.EMBEDDING, project_id, task_id)
     general.flush_or_commit(with_commit)
 
 
@@ -132,6 +136,7 @@ def set_weak_supervision_to_failed(
     """
     query = __extend_where_for_update(query, project_id, task_id)
     general.execute(query)
+    __notify_failed(enums.Tablenames.WEAK_SUPERVISION_TASK, project_id, task_id)
     general.flush_or_commit(with_commit)
 
 
@@ -149,6 +154,7 @@ def set_upload_task_to_failed(
     """
     query = __extend_where_for_update(query, project_id, task_id)
     general.execute(query)
+    __notify_failed(enums.Tablenames.UPLOAD_TASK, project_id, task_id)
     general.flush_or_commit(with_commit)
 
 
@@ -197,6 +203,17 @@ def set_parse_cognition_file_task_to_failed(
     general.commit()
 
 
+def __notify_failed(
+    table: enums.Tablenames, project_id: Optional[str], task_id: Optional[str]
+) -> None:
+    event_channel.notify(
+        enums.DBEventType.STATES_FAILED,
+        table=table.value,
+        project_id=project_id,
+        task_id=task_id,
+    )
+
+
 def __select_running_information_source_payloads(
     project_id: Optional[str] = None,
     only_running: bool = False,
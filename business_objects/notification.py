@@ -1,10 +1,24 @@
 from _operator import or_
 from datetime import datetime, timedelta
-from typing import List
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from threading import Lock
+import time
+
+from sqlalchemy import event, text
 
 from . import general
 from .. import Notification, NotificationState, models, enums
 from ..session import session
+from ..util import prevent_sql_injection
+
+# same window as get_duplicated, checked in memory so creating doesn't need a lookup query
+# note: only covers notifications created by this process
+DEDUP_WINDOW_SECONDS = 2
+DEDUP_MAX_ENTRIES = 10000
+
+__DEDUP_LOCK = Lock()
+# (project_id, notification_type, user_id) -> monotonic time of last creation
+__recently_created = {}
 
 
 def get_duplicated(
@@ -42,17 +56,18 @@ def set_notifications_to_not_initial(
 
 
 def get_notifications_by_user_id(user_id: str) -> List[Notification]:
+    # fetch & mark as read in one statement
+    user_id = prevent_sql_injection(str(user_id), True)
+    query = f"""
+    UPDATE notification n
+    SET state = '{NotificationState.NOT_INITIAL.value}'
+    WHERE n.user_id = '{user_id}'
+        AND n.state = '{NotificationState.INITIAL.value}'
+    RETURNING n.*
+    """
     notifications: List[Notification] = (
-        session.query(Notification)
-        .filter(
-            Notification.user_id == user_id,
-            Notification.state == NotificationState.INITIAL.value,
-        )
-        .all()
+        session.query(Notification).from_statement(text(query)).all()
     )
-
-    for notification in notifications:
-        notification.state = NotificationState.NOT_INITIAL.value
     general.commit()
     return notifications
 
@@ -75,16 +90,12 @@ def get_filtered_notification(
     if project_filter:
         query = query.filter(models.Notification.project_id.in_(project_filter))
     else:
-        projects = (
-            session.query(models.Project)
-            .filter(models.Project.organization_id == user.organization_id)
-            .all()
+        org_project_ids = session.query(models.Project.id).filter(
+            models.Project.organization_id == user.organization_id
         )
         query = query.filter(
             or_(
-                models.Notification.project_id.in_(
-                    [project.id for project in projects]
-                ),
+                models.Notification.project_id.in_(org_project_ids.subquery()),
                 models.Notification.user_id == user.id,
             )
         )
@@ -125,6 +136,120 @@ def create(
     return notification
 
 
+def create_many(
+    notifications: List[Dict[str, Any]],
+    skip_duplicated: bool = True,
+    with_commit: bool = False,
+) -> List[Notification]:
+    # dicts with keys project_id, user_id, message, level & notification_type
+    # duplicates (same project, type & user within DEDUP_WINDOW_SECONDS) are skipped in memory
+    entities = []
+    keys = set()
+    for item in notifications:
+        key = __get_dedup_key(
+            item.get("project_id"), item["notification_type"], item.get("user_id")
+        )
+        if skip_duplicated and (key in keys or is_duplicated(*key)):
+            continue
+        keys.add(key)
+        entities.append(
+            models.Notification(
+                message=item["message"],
+                important=False,
+                state=enums.NotificationState.INITIAL.value,
+                level=item["level"],
+                user_id=item.get("user_id"),
+                project_id=item.get("project_id"),
+                type=item["notification_type"],
+            )
+        )
+    if entities:
+        general.add_all(entities, with_commit)
+        __register_created(keys, with_commit)
+    return entities
+
+
+def create_if_not_duplicated(
+    project_id: str,
+    user_id: str,
+    message: str,
+    level: str,
+    notification_type: str,
+    with_commit: bool = False,
+) -> Optional[Notification]:
+    # replacement for get_duplicated + create without the lookup query
+    if is_duplicated(project_id, notification_type, user_id):
+        return None
+    notification = create(
+        project_id, user_id, message, level, notification_type, with_commit
+    )
+    __register_created(
+        [__get_dedup_key(project_id, notification_type, user_id)], with_commit
+    )
+    return notification
+
+
+def is_duplicated(
+    project_id: Optional[str], notification_type: str, user_id: Optional[str]
+) -> bool:
+    # notifications are registered once they are committed (see __register_created)
+    # uncommitted ones of the current transaction count as well
+    key = __get_dedup_key(project_id, notification_type, user_id)
+    if key in session.info.get("notification_dedup_keys", ()):
+        return True
+    now = time.monotonic()
+    with __DEDUP_LOCK:
+        last_created = __recently_created.get(key)
+        return last_created is not None and now - last_created < DEDUP_WINDOW_SECONDS
+
+
+def __register_created(
+    keys: Iterable[Tuple[Optional[str], str, Optional[str]]], committed: bool
+) -> None:
+    # failed or rolled back inserts are never registered => retries aren't suppressed
+    if not committed:
+        session.info.setdefault("notification_dedup_keys", set()).update(keys)
+        return
+    now = time.monotonic()
+    with __DEDUP_LOCK:
+        for key in keys:
+            __recently_created[key] = now
+        if len(__recently_created) > DEDUP_MAX_ENTRIES:
+            __remove_expired_dedup_entries(now)
+
+
+@event.listens_for(session, "after_commit")
+def __register_created_of_transaction(session_instance) -> None:
+    keys = session_instance.info.pop("notification_dedup_keys", None)
+    if keys:
+        __register_created(keys, True)
+
+
+@event.listens_for(session, "after_rollback")
+def __discard_created_of_transaction(session_instance) -> None:
+    session_instance.info.pop("notification_dedup_keys", None)
+
+
+def __get_dedup_key(
+    project_id: Optional[str], notification_type: str, user_id: Optional[str]
+) -> Tuple[Optional[str], str, Optional[str]]:
+    return (
+        str(project_id) if project_id is not None else None,
+        notification_type,
+        str(user_id) if user_id is not None else None,
+    )
+
+
+def __remove_expired_dedup_entries(now: float) -> None:
+    # caller holds __DEDUP_LOCK
+    for key in [
+        k
+        for k, created in __recently_created.items()
+        if now - created >= DEDUP_WINDOW_SECONDS
+    ]:
+        del __recently_created[key]
+
+
 def remove_project_connection_for_last_x(project_id: str, last_x: int = 5) -> None:
     if last_x <= 0:
         return
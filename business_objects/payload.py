@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from . import general
 from .. import enums
@@ -341,3 +341,159 @@ def get_payload_with_heuristic_type(project_id: str, payload_id: str):
     WHERE isp.project_id = '{project_id}' AND isp.id = '{payload_id}'
     """
     return general.execute_first(query)
+
+
+def get_training_bundle(
+    project_id: str,
+    embedding_id: str,
+    labeling_task_id: str,
+    source_type: str,
+    chunk_size: int = 1000,
+) -> Dict[str, Any]:
+    # aligned data for active learners, tensors & labels are collected in one streamed pass
+    # ordering follows record_id like the get_query_labels_* functions
+    # numpy is only needed by the consuming services so it's imported here
+    import numpy as np
+
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    embedding_id = prevent_sql_injection(embedding_id, isinstance(embedding_id, str))
+    labeling_task_id = prevent_sql_injection(
+        labeling_task_id, isinstance(labeling_task_id, str)
+    )
+    source_type = prevent_sql_injection(source_type, isinstance(source_type, str))
+
+    task_info = general.execute_first(
+        __get_training_bundle_task_info_query(
+            project_id, embedding_id, labeling_task_id
+        )
+    )
+    if not task_info or not task_info.task_type:
+        raise ValueError(f"Labeling task {labeling_task_id} not found")
+
+    label_names = task_info.label_names or []
+    label_lookup = {name: idx for idx, name in enumerate(label_names)}
+    is_extraction = (
+        task_info.task_type == enums.LabelingTaskType.INFORMATION_EXTRACTION.value
+    )
+
+    tensor_count = task_info.tensor_count or 0
+    tensors = None
+    record_ids = []
+    # label index per tensor (per token tensor for extraction), -1 => unlabeled
+    labels = np.full(tensor_count, -1, dtype=np.int32)
+
+    query = __get_training_bundle_query(
+        project_id, embedding_id, labeling_task_id, source_type, is_extraction
+    )
+    idx = 0
+    stream = general.execute_stream(query, chunk_size)
+    for rows in stream:
+        if idx >= tensor_count:
+            # tensors were added after the count was collected => skip the remaining partitions
+            stream.close()
+            break
+        for row in rows:
+            if idx >= tensor_count:
+                break
+            if tensors is None:
+                tensors = np.empty((tensor_count, len(row.data)), dtype=np.float32)
+            tensors[idx] = row.data
+            record_ids.append(row.record_id)
+            if row.label_name is not None:
+                labels[idx] = label_lookup.get(row.label_name, -1)
+            idx += 1
+
+    if tensors is None:
+        tensors = np.empty((0, 0), dtype=np.float32)
+    elif idx < tensor_count:
+        # tensors were removed after the count was collected
+        tensors = tensors[:idx]
+        labels = labels[:idx]
+
+    return {
+        "record_ids": record_ids,
+        "tensors": tensors,
+        "labels": labels,
+        "label_names": label_names,
+    }
+
+
+def __get_training_bundle_task_info_query(
+    project_id: str, embedding_id: str, labeling_task_id: str
+) -> str:
+    return f"""
+    SELECT 
+        lt.task_type,
+        (
+            SELECT array_agg(ltl.name ORDER BY ltl.name)
+            FROM labeling_task_label ltl
+            WHERE ltl.project_id = '{project_id}' AND ltl.labeling_task_id = lt.id
+        ) label_names,
+        (
+            SELECT COUNT(*)
+            FROM embedding_tensor et
+            WHERE et.project_id = '{project_id}' AND et.embedding_id = '{embedding_id}'
+        ) tensor_count
+    FROM labeling_task lt
+    WHERE lt.project_id = '{project_id}' AND lt.id = '{labeling_task_id}'
+    """
+
+
+def __get_training_bundle_query(
+    project_id: str,
+    embedding_id: str,
+    labeling_task_id: str,
+    source_type: str,
+    is_extraction: bool,
+) -> str:
+    base_query = ""
+    rla_source = "record_label_association rla"
+    if source_type == enums.LabelSource.MANUAL.value:
+        # gold /gold star + all where all agree
+        base_query = get_base_query_valid_labels_manual(project_id, labeling_task_id)
+        rla_source = """valid_rla_ids vri
+        INNER JOIN record_label_association rla
+            ON rla.id = vri.rla_id"""
+
+    # one label per record (classification) or per token (extraction)
+    # gold star first, then the most recent association => deterministic for multiple labels
+    if is_extraction:
+        label_query = f"""
+        SELECT DISTINCT ON (rla.record_id, token.token_index)
+            rla.record_id, token.token_index, ltl.name label_name
+        FROM {rla_source}
+        INNER JOIN record_label_association_token token
+            ON rla.id = token.record_label_association_id
+        INNER JOIN labeling_task_label ltl
+            ON rla.labeling_task_label_id = ltl.id
+        WHERE rla.project_id = '{project_id}' AND rla.source_type = '{source_type}'
+            AND ltl.labeling_task_id = '{labeling_task_id}'
+        ORDER BY rla.record_id, token.token_index, rla.is_gold_star DESC NULLS LAST, rla.created_at DESC, rla.id"""
+        # token level tensors use the token index as sub_key
+        label_join = (
+            "et.record_id = labels.record_id AND et.sub_key = labels.token_index"
+        )
+    else:
+        label_query = f"""
+        SELECT DISTINCT ON (rla.record_id)
+            rla.record_id, ltl.name label_name
+        FROM {rla_source}
+        INNER JOIN labeling_task_label ltl
+            ON rla.labeling_task_label_id = ltl.id
+        WHERE rla.project_id = '{project_id}' AND rla.source_type = '{source_type}'
+            AND ltl.labeling_task_id = '{labeling_task_id}'
+        ORDER BY rla.record_id, rla.is_gold_star DESC NULLS LAST, rla.created_at DESC, rla.id"""
+        label_join = "et.record_id = labels.record_id"
+
+    return (
+        base_query
+        + f"""
+    SELECT et.record_id::TEXT record_id, et.data, labels.label_name
+    FROM embedding_tensor et
+    LEFT JOIN ( {label_query}
+    ) labels
+        ON {label_join}
+    WHERE et.project_id = '{project_id}' AND et.embedding_id = '{embedding_id}'
+    ORDER BY et.record_id, et.sub_key
+    """
+    )
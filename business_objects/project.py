@@ -1,4 +1,4 @@
-from typing import List, Optional, Any, Dict, Union, Set
+from typing import Callable, List, Optional, Any, Dict, Union, Set
 from sqlalchemy.sql import func
 from sqlalchemy import cast, Integer
 from sqlalchemy.sql.functions import coalesce
@@ -383,7 +383,14 @@ def delete(project_id: str, with_commit: bool = False) -> None:
     print("finished delete in", (time.time() - start_time))
 
 
-def delete_by_id(project_id: str, with_commit: bool = False) -> None:
+def delete_by_id(
+    project_id: str,
+    with_commit: bool = False,
+    batch_size: Optional[int] = None,
+    throttle_seconds: float = 0.0,
+    progress_callback: Optional[Callable[[str, int], None]] = None,
+) -> None:
+    # with batch_size tables are cleaned in bounded batches with commits in between (throttled by throttle_seconds)
     project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
     base_query = f"""
     DELETE FROM @@TBL@@
@@ -404,7 +411,7 @@ def delete_by_id(project_id: str, with_commit: bool = False) -> None:
         WHERE relations.deep < 20
         )        
         
-    SELECT rel.*,col.column_name
+    SELECT rel.*,col.column_name, col.has_id
     FROM (
         SELECT
             conrelid::REGCLASS::TEXT tbl,
@@ -412,7 +419,12 @@ def delete_by_id(project_id: str, with_commit: bool = False) -> None:
         FROM relations
         GROUP BY conrelid::REGCLASS) rel
     INNER JOIN (
-        SELECT t.table_name,col.column_name
+        SELECT t.table_name,col.column_name, EXISTS (
+            SELECT 1
+            FROM information_schema.columns id_col
+            WHERE id_col.table_name = t.table_name AND id_col.table_schema = t.table_schema
+            AND id_col.column_name = 'id'
+        ) has_id
         FROM information_schema.tables t
         INNER JOIN information_schema.columns col
             ON col.table_name = t.table_name AND col.table_schema = t.table_schema
@@ -422,10 +434,19 @@ def delete_by_id(project_id: str, with_commit: bool = False) -> None:
     ) col
         ON tbl = col.table_name
     UNION ALL 
-    SELECT 'project', -1, 'id'
+    SELECT 'project', -1, 'id', TRUE
     ORDER BY 2 DESC
     """
     for row in general.execute_all(table_query):
+        if batch_size and row[3]:
+            general.delete_in_batches(
+                row[0],
+                f"t.{row[2]} = '{project_id}'",
+                batch_size,
+                throttle_seconds,
+                progress_callback,
+            )
+            continue
         general.execute(
             base_query.replace("@@TBL@@", row[0]).replace("@@COL@@", row[2])
         )
@@ -1,11 +1,12 @@
 from __future__ import with_statement
 from typing import List, Dict, Any, Optional, Tuple, Iterable
+from collections import namedtuple
 from sqlalchemy import cast, Text
 from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.sql.expression import bindparam
 from sqlalchemy import update
 
-from . import attribute, general
+from . import attribute, general, tokenization
 from .. import models, enums
 from ..models import (
     Record,
@@ -18,6 +19,9 @@ from ..models import (
 from ..session import session
 from ..util import prevent_sql_injection
 
+# row like result of get_attribute_data_with_doc_bins_of_records (attribute & index access)
+RecordDocBin = namedtuple("RecordDocBin", ["id", "attribute_data", "bytes"])
+
 
 def get(project_id: str, record_id: str) -> Record:
     return (
@@ -182,13 +186,24 @@ def get_attribute_data_with_doc_bins_of_records(
     SELECT 
         rt.id, 
         r."data" ->> '{attribute_name}' attribute_data, 
-        rt.bytes
+        COALESCE(rt.bytes, rtc.bytes) bytes,
+        CASE WHEN rt.bytes IS NULL THEN rtc.compression END compression
     FROM record r
     INNER JOIN record_tokenized rt
         ON  r.project_id = rt.project_id AND r.id = rt.record_id
+    LEFT JOIN record_tokenized_content rtc
+        ON rt.project_id = rtc.project_id AND rt.content_hash = rtc.content_hash
     WHERE r.project_id = '{project_id}'
     """
-    return general.execute_all(query)
+    # deduplicated entries can be compressed => same (raw) bytes as before the deduplication
+    return [
+        RecordDocBin(
+            row.id,
+            row.attribute_data,
+            tokenization.decompress_doc_bin(row.bytes, row.compression),
+        )
+        for row in general.execute_all(query)
+    ]
 
 
 def update_bytes_of_record_tokenized(
@@ -593,6 +608,9 @@ def create_or_update_token_statistic(
             num_token=amount,
         )
         general.add(tbl_entry)
+    tokenization.complete_tokenization_work_of_record(
+        project_id, record_id, attribute_id
+    )
     general.flush_or_commit(with_commit)
 
 
@@ -625,7 +643,10 @@ def create_records(
         )
         for record_item in records_data
     ]
-    general.add_all(records, with_commit)
+    general.add_all(records)
+    # bulk upload boundary, single records (create) are covered by the regular tokenization task
+    tokenization.enqueue_tokenization_work(project_id, [r.id for r in records])
+    general.flush_or_commit(with_commit)
     return records
 
 
@@ -642,7 +663,11 @@ def create_record_attribute_token_statistics(
         attribute_id=attribute_id,
         num_token=num_token,
     )
-    general.add(stats, with_commit)
+    general.add(stats)
+    tokenization.complete_tokenization_work_of_record(
+        project_id, record_id, attribute_id
+    )
+    general.flush_or_commit(with_commit)
     return stats
 
 
@@ -675,6 +700,14 @@ def update_records(
             records_data_without_db_entries.append(record_item)
             labels_of_records_without_db_entries.append(label_item)
 
+    if updated_records:
+        # changed data needs to be tokenized again even though statistics exist
+        tokenization.enqueue_tokenization_work(
+            str(updated_records[0].project_id),
+            [r.id for r in updated_records],
+            ignore_statistics=True,
+        )
+
     return (
         records_data_without_db_entries,
         labels_of_records_without_db_entries,
@@ -714,7 +747,19 @@ def delete(project_id: str, record_id: str, with_commit: bool = False) -> None:
     general.flush_or_commit(with_commit)
 
 
-def delete_all(project_id: str, with_commit: bool = False) -> None:
+def delete_all(
+    project_id: str,
+    with_commit: bool = False,
+    batch_size: Optional[int] = None,
+    throttle_seconds: float = 0.0,
+) -> None:
+    if batch_size:
+        # commits after every batch so with_commit isn't relevant
+        project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+        general.delete_in_batches(
+            "record", f"t.project_id = '{project_id}'", batch_size, throttle_seconds
+        )
+        return
     session.query(Record).filter(Record.project_id == project_id).delete()
     general.flush_or_commit(with_commit)
 
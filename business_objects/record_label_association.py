@@ -1,9 +1,9 @@
 import time
+import uuid
 from datetime import datetime
 from typing import List, Dict, Optional, Any, Tuple, Iterable
 
 from sqlalchemy import or_
-from sqlalchemy.orm.session import make_transient
 
 from .. import enums
 from ..models import (
@@ -468,43 +468,85 @@ def create_by_record_user_label_dict(
 def create_gold_classification_association(
     rlas: List[Any], current_user_id: str, with_commit: bool = False
 ) -> None:
-    for rla in rlas:
-        general.expunge(rla)
-        make_transient(rla)
-        rla.id = None
-        rla.created_at = None
-        rla.is_gold_star = True
-        rla.created_by = current_user_id
-        general.add(rla, with_commit)
+    if not rlas:
+        return
+    copy_as_gold_star(
+        str(rlas[0].project_id),
+        [str(rla.id) for rla in rlas],
+        current_user_id,
+        with_tokens=False,
+        with_commit=with_commit,
+    )
 
 
 def create_gold_extraction_association(
     rlas: List[Any], current_user_id: str, with_commit: bool = False
 ) -> None:
-    rla_ids = [rla.id for rla in rlas]
-    rla_ids_lookup = {}
-    for rla in rlas:
-        id = rla.id
-        general.expunge(rla)
-        make_transient(rla)
-        rla.id = None
-        rla.created_at = None
-        rla.is_gold_star = True
-        rla.created_by = current_user_id
-        general.add(rla)
-        rla_ids_lookup[id] = rla.id
-
-    tokens = session.query(RecordLabelAssociationToken).filter(
-        RecordLabelAssociationToken.record_label_association_id.in_(rla_ids)
+    if not rlas:
+        return
+    copy_as_gold_star(
+        str(rlas[0].project_id),
+        [str(rla.id) for rla in rlas],
+        current_user_id,
+        with_tokens=True,
+        with_commit=with_commit,
+    )
+
+
+def copy_as_gold_star(
+    project_id: str,
+    rla_ids: List[str],
+    current_user_id: str,
+    with_tokens: bool = True,
+    with_commit: bool = False,
+) -> Dict[str, str]:
+    # server side copy of rlas (& their tokens) as gold star entries
+    # old -> new id mapping is created upfront so tokens can be copied in a single statement as well
+    if not rla_ids:
+        return {}
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    current_user_id = prevent_sql_injection(
+        current_user_id, isinstance(current_user_id, str)
+    )
+    id_mapping = {
+        prevent_sql_injection(str(rla_id), True): str(uuid.uuid4())
+        for rla_id in rla_ids
+    }
+    mapping_values = ",".join(
+        f"('{old_id}'::UUID,'{new_id}'::UUID)" for old_id, new_id in id_mapping.items()
     )
-    for token in tokens:
-        token_rla_id = token.record_label_association_id
-        general.expunge(token)
-        make_transient(token)
-        token.id = None
-        token.record_label_association_id = rla_ids_lookup[token_rla_id]
-        general.add(token)
+
+    query = f"""
+    INSERT INTO record_label_association (
+        id, project_id, record_id, labeling_task_label_id, source_id, weak_supervision_id,
+        source_type, return_type, confidence, created_at, created_by, is_gold_star, is_valid_manual_label)
+    SELECT
+        m.new_id, rla.project_id, rla.record_id, rla.labeling_task_label_id, rla.source_id, rla.weak_supervision_id,
+        rla.source_type, rla.return_type, rla.confidence, NOW(), '{current_user_id}', TRUE, rla.is_valid_manual_label
+    FROM (VALUES {mapping_values}) m (old_id, new_id)
+    INNER JOIN record_label_association rla
+        ON rla.id = m.old_id
+    WHERE rla.project_id = '{project_id}'
+    RETURNING id::TEXT
+    """
+    inserted = {r.id for r in general.execute_all(query)}
+    id_mapping = {
+        old_id: new_id for old_id, new_id in id_mapping.items() if new_id in inserted
+    }
+
+    if with_tokens and id_mapping:
+        query = f"""
+        INSERT INTO record_label_association_token (
+            id, project_id, record_label_association_id, token_index, is_beginning_token)
+        SELECT {general.generate_UUID_sql_string()}, t.project_id, m.new_id, t.token_index, t.is_beginning_token
+        FROM (VALUES {mapping_values}) m (old_id, new_id)
+        INNER JOIN record_label_association_token t
+            ON t.record_label_association_id = m.old_id
+        WHERE t.project_id = '{project_id}'
+        """
+        general.execute(query)
     general.flush_or_commit(with_commit)
+    return id_mapping
 
 
 def create_record_label_associations(
@@ -657,8 +699,25 @@ def update_null_labels(project_id: str, label_reference_error_id: str) -> None:
 
 
 def delete_by_source_id(
-    project_id: str, information_source_id: str, with_commit: bool = False
+    project_id: str,
+    information_source_id: str,
+    with_commit: bool = False,
+    batch_size: Optional[int] = None,
+    throttle_seconds: float = 0.0,
 ) -> None:
+    if batch_size:
+        # commits after every batch so with_commit isn't relevant
+        project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+        information_source_id = prevent_sql_injection(
+            information_source_id, isinstance(information_source_id, str)
+        )
+        general.delete_in_batches(
+            "record_label_association",
+            f"t.project_id = '{project_id}' AND t.source_id = '{information_source_id}'",
+            batch_size,
+            throttle_seconds,
+        )
+        return
     session.query(RecordLabelAssociation).filter(
         RecordLabelAssociation.project_id == project_id,
         RecordLabelAssociation.source_id == information_source_id,
@@ -757,7 +816,10 @@ def delete_by_ids(
 
 
 def delete_by_record_attribute_tuples(
-    project_id: str, to_del: List[Tuple[str, str]], with_commit: bool = False
+    project_id: str,
+    to_del: List[Tuple[str, str]],
+    with_commit: bool = False,
+    batch_size: Optional[int] = None,
 ) -> None:
     project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
     to_del = [
@@ -782,9 +844,7 @@ def delete_by_record_attribute_tuples(
 
     query_add = " OR ".join(query_adds)
 
-    query = f"""
-    DELETE FROM record_label_association
-    WHERE project_id = '{project_id}' AND id IN ( 
+    select_query = f"""
     SELECT rla.id
     FROM record_label_association rla
     INNER JOIN labeling_task_label ltl
@@ -792,7 +852,20 @@ def delete_by_record_attribute_tuples(
     INNER JOIN labeling_task lt
         ON ltl.project_id = lt.project_id AND ltl.labeling_task_id = lt.id
     WHERE lt.task_type = '{enums.LabelingTaskType.INFORMATION_EXTRACTION.value}' AND rla.project_id = '{project_id}'
-    AND ({query_add}) )"""
+    AND ({query_add}) """
+
+    if batch_size:
+        # commits after every batch so with_commit isn't relevant
+        general.delete_in_batches(
+            "record_label_association",
+            f"t.project_id = '{project_id}' AND t.id IN ({select_query})",
+            batch_size,
+        )
+        return
+
+    query = f"""
+    DELETE FROM record_label_association
+    WHERE project_id = '{project_id}' AND id IN ( {select_query} )"""
 
     general.execute(query)
     general.flush_or_commit(with_commit)
@@ -1,13 +1,12 @@
 from typing import List, Optional, Dict, Union
-from sqlalchemy import text
+from sqlalchemy import String, text
 
-from . import general
+from . import general, event_channel
 from .. import enums
 from ..models import TaskQueue, Project
 from ..session import session
 
 from ..util import prevent_sql_injection
-from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql.expression import cast
 from datetime import datetime, timedelta
 
@@ -21,14 +20,13 @@ def get_all_tasks() -> List[TaskQueue]:
 
 
 def get_orphan_tasks() -> List[TaskQueue]:
-    task_project_id = cast(TaskQueue.task_info.op("->>")("project_id"), UUID)
     return (
         session.query(TaskQueue)
         .outerjoin(
             Project,
-            task_project_id == Project.id,
+            TaskQueue.project_id == cast(Project.id, String),
         )
-        .filter(task_project_id != None, Project.id == None)
+        .filter(TaskQueue.project_id != None, Project.id == None)
         .all()
     )
 
@@ -47,7 +45,7 @@ def get_all_waiting_by_type(
     return (
         session.query(TaskQueue)
         .filter(
-            text(f"task_info->>'project_id' = '{project_id}'"),
+            TaskQueue.project_id == str(project_id),
             TaskQueue.task_type == task_type.value,
             TaskQueue.is_active == False,
         )
@@ -62,7 +60,7 @@ def get_waiting_by_attribute_id(project_id: str, attribute_id: str) -> TaskQueue
         .filter(
             TaskQueue.task_type == enums.TaskType.ATTRIBUTE_CALCULATION.value,
             text(f"task_info->>'attribute_id' = '{attribute_id}'"),
-            text(f"task_info->>'project_id' = '{project_id}'"),
+            TaskQueue.project_id == str(project_id),
             TaskQueue.is_active == False,
         )
         .first()
@@ -76,7 +74,7 @@ def get_waiting_by_information_source(project_id: str, source_id: str) -> TaskQu
         .filter(
             TaskQueue.task_type == enums.TaskType.INFORMATION_SOURCE.value,
             text(f"task_info->>'information_source_id' = '{source_id}'"),
-            text(f"task_info->>'project_id' = '{project_id}'"),
+            TaskQueue.project_id == str(project_id),
             TaskQueue.is_active == False,
         )
         .first()
@@ -90,7 +88,7 @@ def get_by_tokenization(project_id: str) -> TaskQueue:
         session.query(TaskQueue)
         .filter(
             TaskQueue.task_type == enums.TaskType.TOKENIZATION.value,
-            text(f"task_info->>'project_id' = '{project_id}'"),
+            TaskQueue.project_id == str(project_id),
         )
         .order_by(TaskQueue.created_at.asc())
         .first()
@@ -112,15 +110,112 @@ def add(
         task_info=task_info,
         priority=priority,
     )
-    general.add(tbl_entry, with_commit)
+    general.add(tbl_entry, with_commit=False)
+    event_channel.notify(
+        enums.DBEventType.TASK_ENQUEUED,
+        task_id=tbl_entry.id,
+        task_type=task_type.value,
+        organization_id=org_id,
+        project_id=task_info.get("project_id") if isinstance(task_info, dict) else None,
+        priority=priority,
+    )
+    general.flush_or_commit(with_commit)
     return tbl_entry
 
 
+def claim_next_tasks(
+    limit: int = 1,
+    task_types: Optional[List[enums.TaskType]] = None,
+    max_active_per_org: Optional[int] = None,
+    scan_limit: Optional[int] = None,
+    with_commit: bool = True,
+) -> List[TaskQueue]:
+    # atomically sets the next waiting tasks (priority first, then oldest) active & returns them
+    # competing dispatchers skip rows locked by others instead of waiting for them
+    # max_active_per_org counts already active tasks of the org against the limit
+    limit = prevent_sql_injection(limit, isinstance(limit, int))
+    if scan_limit is None:
+        scan_limit = max(limit * 10, 100)
+    scan_limit = prevent_sql_injection(scan_limit, isinstance(scan_limit, int))
+
+    where_add = ""
+    if task_types:
+        task_types_str = "','".join(
+            prevent_sql_injection(t.value, True) for t in task_types
+        )
+        where_add += f" AND tq.task_type IN ('{task_types_str}')"
+
+    org_limit_join = ""
+    if max_active_per_org is not None:
+        max_active_per_org = prevent_sql_injection(
+            max_active_per_org, isinstance(max_active_per_org, int)
+        )
+        # active counts are only reliable if dispatchers with limits don't overlap
+        # the lock is held until the end of the transaction (=> commit right away)
+        general.execute(
+            f"SELECT pg_advisory_xact_lock(hashtext('{enums.Tablenames.TASK_QUEUE.value}_dispatch'))"
+        )
+        org_limit_join = f"""
+            LEFT JOIN (
+                SELECT organization_id, COUNT(*) active_count
+                FROM global.task_queue
+                WHERE is_active
+                GROUP BY organization_id
+            ) a
+                ON a.organization_id IS NOT DISTINCT FROM c.organization_id
+            WHERE c.org_rn + COALESCE(a.active_count, 0) <= {max_active_per_org}"""
+
+    query = f"""
+    UPDATE global.task_queue t
+    SET is_active = TRUE
+    WHERE t.id IN (
+        SELECT c.id
+        FROM (
+            SELECT
+                tq.id,
+                tq.organization_id,
+                tq.priority,
+                tq.created_at,
+                ROW_NUMBER() OVER (PARTITION BY tq.organization_id ORDER BY tq.priority DESC, tq.created_at ASC) org_rn
+            FROM (
+                SELECT tq.id, tq.organization_id, tq.priority, tq.created_at
+                FROM global.task_queue tq
+                WHERE NOT tq.is_active {where_add}
+                ORDER BY tq.priority DESC, tq.created_at ASC
+                LIMIT {scan_limit}
+                FOR UPDATE SKIP LOCKED
+            ) tq
+        ) c
+        {org_limit_join}
+        ORDER BY c.priority DESC, c.created_at ASC
+        LIMIT {limit}
+    )
+    RETURNING t.*
+    """
+    tasks = session.query(TaskQueue).from_statement(text(query)).all()
+    if tasks:
+        __notify_state_changed([t.id for t in tasks], is_active=True)
+    general.flush_or_commit(with_commit)
+    return tasks
+
+
+def release_tasks(task_ids: List[str], with_commit: bool = True) -> None:
+    # hands claimed tasks back to the queue (e.g. worker shutdown before start)
+    if not task_ids:
+        return
+    session.query(TaskQueue).filter(
+        TaskQueue.id.in_(task_ids),
+    ).update({"is_active": False}, synchronize_session=False)
+    __notify_state_changed(task_ids, is_active=False)
+    general.flush_or_commit(with_commit)
+
+
 def set_task_active(org_id: str, task_id: str, with_commit: bool = False):
     session.query(TaskQueue).filter(
         TaskQueue.id == task_id,
         TaskQueue.organization_id == org_id,
     ).update({"is_active": True})
+    __notify_state_changed([task_id], is_active=True)
     general.flush_or_commit(with_commit)
 
 
@@ -128,6 +223,8 @@ def set_all_tasks_inactive(with_commit: bool = False):
     session.query(TaskQueue).filter(
         TaskQueue.is_active == True,
     ).update({"is_active": False})
+    # task_ids None => all tasks
+    __notify_state_changed(None, is_active=False)
     general.flush_or_commit(with_commit)
 
 
@@ -150,6 +247,7 @@ def remove_task_from_queue(org_id: str, task_id: str, with_commit: bool = False)
         TaskQueue.id == task_id,
         TaskQueue.organization_id == org_id,
     ).delete()
+    __notify_state_changed([task_id], removed=True)
     general.flush_or_commit(with_commit)
 
 
@@ -157,4 +255,28 @@ def delete_by_task_id(task_id: str, with_commit: bool = False):
     session.query(TaskQueue).filter(
         TaskQueue.id == task_id,
     ).delete()
+    __notify_state_changed([task_id], removed=True)
     general.flush_or_commit(with_commit)
+
+
+def __notify_state_changed(
+    task_ids: Optional[List[str]],
+    is_active: Optional[bool] = None,
+    removed: bool = False,
+) -> None:
+    if task_ids is None:
+        event_channel.notify(
+            enums.DBEventType.TASK_STATE_CHANGED,
+            task_ids=None,
+            is_active=is_active,
+            removed=removed,
+        )
+        return
+    # large claims/releases are split over multiple events
+    event_channel.notify_chunked(
+        enums.DBEventType.TASK_STATE_CHANGED,
+        "task_ids",
+        [str(t) for t in task_ids],
+        is_active=is_active,
+        removed=removed,
+    )
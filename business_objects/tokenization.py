@@ -1,11 +1,20 @@
-from typing import List, Any, Optional, Iterable
+import hashlib
+import json
+from typing import Dict, Iterator, List, Any, Optional, Iterable, Set, Union
 
 
-from sqlalchemy import or_
+from sqlalchemy import or_, sql
+from sqlalchemy.dialects.postgresql import insert
 
-from . import general
+from . import general, event_channel
 from .. import RecordTokenizationTask, enums
-from ..models import RecordAttributeTokenStatistics, RecordTokenized, Record
+from ..models import (
+    RecordAttributeTokenStatistics,
+    RecordTokenized,
+    RecordTokenizedContent,
+    RecordTokenizationQueue,
+    Record,
+)
 from ..session import session
 
 from ..util import prevent_sql_injection
@@ -98,6 +107,7 @@ def get_doc_bin_table_to_json(
         )
     else:
         record_ids = ""
+    # deduplicated entries can be compressed => decompressed below so the output stays raw bytes
     query = f"""
         SELECT      
             json_agg(
@@ -105,16 +115,298 @@ def get_doc_bin_table_to_json(
                 'record_id', rt.record_id,
                 'columns', rt.columns,
                 {missing_columns}
-                'bytes', rt.bytes)
-            )::TEXT AS data
+                'bytes', COALESCE(rt.bytes, rtc.bytes))
+            )::TEXT AS data,
+            json_object_agg(rt.record_id, rtc.compression)
+                FILTER (WHERE rt.bytes IS NULL AND rtc.compression IS NOT NULL) compressed
         FROM record_tokenized rt
         INNER JOIN record r
             ON rt.record_id = r.id AND rt.project_id = rt.project_id
+        LEFT JOIN record_tokenized_content rtc
+            ON rt.project_id = rtc.project_id AND rt.content_hash = rtc.content_hash
         WHERE rt.project_id = '{project_id}'
             AND r.project_id = '{project_id}'
             {record_ids}
     """
-    return general.execute_first(query).data
+    result = general.execute_first(query)
+    if not result.compressed:
+        return result.data
+    return __decompress_doc_bin_json(result.data, result.compressed)
+
+
+def __decompress_doc_bin_json(data: str, compressed: Dict[str, str]) -> str:
+    # compressed: record_id -> compression
+    # bytea values are serialized as hex strings (\\x...) by json_build_object
+    entries = json.loads(data)
+    for entry in entries:
+        compression = compressed.get(entry["record_id"])
+        if compression and entry.get("bytes"):
+            doc_bin = bytes.fromhex(entry["bytes"][2:])
+            entry["bytes"] = "\\x" + decompress_doc_bin(doc_bin, compression).hex()
+    return json.dumps(entries)
+
+
+def stream_doc_bins(
+    project_id: str,
+    record_ids: Optional[List[str]] = None,
+    chunk_size: int = 500,
+) -> Iterator[List[Dict[str, Any]]]:
+    # raw (decompressed) doc bin bytes per record, collected in chunks through a server side cursor
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    record_id_filter = ""
+    if record_ids:
+        record_ids = [
+            prevent_sql_injection(record_id, isinstance(record_id, str))
+            for record_id in record_ids
+        ]
+        record_id_filter = "AND rt.record_id IN ('" + "','".join(record_ids) + "')"
+    query = f"""
+    SELECT 
+        rt.record_id::TEXT record_id,
+        rt.columns,
+        COALESCE(rt.bytes, rtc.bytes) bytes,
+        CASE WHEN rt.bytes IS NULL THEN rtc.compression END compression
+    FROM record_tokenized rt
+    LEFT JOIN record_tokenized_content rtc
+        ON rt.project_id = rtc.project_id AND rt.content_hash = rtc.content_hash
+    WHERE rt.project_id = '{project_id}'
+        {record_id_filter}
+    """
+    for rows in general.execute_stream(query, chunk_size):
+        yield [
+            {
+                "record_id": row.record_id,
+                "columns": row.columns,
+                "bytes": decompress_doc_bin(row.bytes, row.compression),
+            }
+            for row in rows
+        ]
+
+
+def get_content_hash(content: Union[str, bytes]) -> str:
+    # used to find identical texts, hash the text before tokenization to skip spacy for duplicates
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_existing_content_hashes(project_id: str, content_hashes: List[str]) -> Set[str]:
+    if not content_hashes:
+        return set()
+    return {
+        x.content_hash
+        for x in session.query(RecordTokenizedContent.content_hash).filter(
+            RecordTokenizedContent.project_id == project_id,
+            RecordTokenizedContent.content_hash.in_(content_hashes),
+        )
+    }
+
+
+def compress_doc_bin(
+    doc_bin: bytes, compression: Optional[enums.DocBinCompression] = None
+) -> bytes:
+    if compression is None or doc_bin is None:
+        return doc_bin
+    if compression == enums.DocBinCompression.ZSTD:
+        # only services writing compressed doc bins need zstandard installed
+        import zstandard
+
+        return zstandard.ZstdCompressor().compress(doc_bin)
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def decompress_doc_bin(doc_bin: bytes, compression: Optional[str] = None) -> bytes:
+    if compression is None or doc_bin is None:
+        return doc_bin
+    if compression == enums.DocBinCompression.ZSTD.value:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(doc_bin)
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def create_doc_bins(
+    project_id: str,
+    doc_bins: List[Dict[str, Any]],
+    compression: Optional[enums.DocBinCompression] = None,
+    with_commit: bool = False,
+) -> None:
+    # doc_bins entries: record_id, columns, bytes & optional content_hash (e.g. of the record text)
+    # bytes can be None if the content_hash is already known (see get_existing_content_hashes)
+    if not doc_bins:
+        return
+    contents = {}
+    tokenized = []
+    for entry in doc_bins:
+        content_hash = entry.get("content_hash") or get_content_hash(entry["bytes"])
+        if entry.get("bytes") is not None and content_hash not in contents:
+            contents[content_hash] = {
+                "project_id": project_id,
+                "content_hash": content_hash,
+                "bytes": compress_doc_bin(entry["bytes"], compression),
+                "compression": compression.value if compression else None,
+            }
+        tokenized.append(
+            {
+                "project_id": project_id,
+                "record_id": entry["record_id"],
+                "columns": entry["columns"],
+                "content_hash": content_hash,
+            }
+        )
+    if contents:
+        general.execute(
+            insert(RecordTokenizedContent)
+            .values(list(contents.values()))
+            .on_conflict_do_nothing(constraint="unique_record_tokenized_content")
+        )
+    general.execute(insert(RecordTokenized).values(tokenized))
+    general.flush_or_commit(with_commit)
+
+
+def enqueue_tokenization_work(
+    project_id: str,
+    record_ids: Optional[Iterable[str]] = None,
+    attribute_ids: Optional[Iterable[str]] = None,
+    ignore_statistics: bool = False,
+    with_commit: bool = False,
+) -> None:
+    # meant for bulk boundaries (upload, statistics reset), not single record writes
+    # only (record, attribute) pairs without token statistics are queued, existing queue entries are kept
+    # ignore_statistics queues the pairs anyway, e.g. after record data changed
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    record_filter = ""
+    if record_ids is not None:
+        record_ids = [prevent_sql_injection(str(x), True) for x in record_ids]
+        if not record_ids:
+            return
+        record_filter = "AND r.id IN ('" + "','".join(record_ids) + "')"
+    attribute_filter = ""
+    if attribute_ids is not None:
+        attribute_ids = [prevent_sql_injection(str(x), True) for x in attribute_ids]
+        if not attribute_ids:
+            return
+        attribute_filter = "AND att.id IN ('" + "','".join(attribute_ids) + "')"
+    statistics_filter = ""
+    if not ignore_statistics:
+        statistics_filter = """
+    AND NOT EXISTS (
+        SELECT 1
+        FROM record_attribute_token_statistics rats
+        WHERE rats.project_id = r.project_id AND rats.record_id = r.id AND rats.attribute_id = att.id
+    )"""
+
+    query = f"""
+    INSERT INTO record_tokenization_queue (id, project_id, record_id, attribute_id, created_at)
+    SELECT {general.generate_UUID_sql_string()}, r.project_id, r.id, att.id, NOW()
+    FROM record r
+    INNER JOIN attribute att
+        ON r.project_id = att.project_id 
+        AND att.data_type = '{enums.DataTypes.TEXT.value}'
+        AND att.state IN ('{enums.AttributeState.UPLOADED.value}', '{enums.AttributeState.USABLE.value}', '{enums.AttributeState.RUNNING.value}')
+        {attribute_filter}
+    WHERE r.project_id = '{project_id}'
+    {record_filter}
+    {statistics_filter}
+    ON CONFLICT ON CONSTRAINT unique_record_tokenization_queue DO NOTHING
+    """
+    general.execute(query)
+    general.flush_or_commit(with_commit)
+
+
+def claim_tokenization_work(
+    project_id: str,
+    limit: int = 100,
+    claim_timeout_seconds: int = 600,
+    with_commit: bool = True,
+) -> List[Any]:
+    # FOR UPDATE SKIP LOCKED so multiple tokenizer workers can drain the queue in parallel
+    # claims older than claim_timeout_seconds are considered abandoned (e.g. crashed worker) and handed out again
+    # finished entries need to be removed with complete_tokenization_work
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    limit = prevent_sql_injection(limit, isinstance(limit, int))
+    claim_timeout_seconds = prevent_sql_injection(
+        claim_timeout_seconds, isinstance(claim_timeout_seconds, int)
+    )
+    query = f"""
+    WITH claimed AS (
+        UPDATE record_tokenization_queue q
+        SET claimed_at = NOW()
+        WHERE q.id IN (
+            SELECT id
+            FROM record_tokenization_queue
+            WHERE project_id = '{project_id}'
+            AND (claimed_at IS NULL OR claimed_at < NOW() - INTERVAL '{int(claim_timeout_seconds)} seconds')
+            ORDER BY created_at
+            LIMIT {int(limit)}
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING q.id, q.record_id, q.attribute_id
+    ), grouped AS (
+        SELECT record_id, array_agg(attribute_id::TEXT) attribute_ids, array_agg(id::TEXT) queue_ids
+        FROM claimed
+        GROUP BY record_id
+    )
+    SELECT 
+        g.record_id::TEXT record_id,
+        g.attribute_ids,
+        g.queue_ids,
+        r.data,
+        COALESCE(rt.bytes, rtc.bytes) bytes,
+        CASE WHEN rt.bytes IS NULL THEN rtc.compression END compression,
+        rt.columns "columns"
+    FROM grouped g
+    INNER JOIN record r
+        ON r.project_id = '{project_id}' AND r.id = g.record_id
+    LEFT JOIN record_tokenized rt
+        ON rt.project_id = r.project_id AND rt.record_id = r.id
+    LEFT JOIN record_tokenized_content rtc
+        ON rt.project_id = rtc.project_id AND rt.content_hash = rtc.content_hash
+    """
+    rows = general.execute_all(query)
+    general.flush_or_commit(with_commit)
+    return rows
+
+
+def complete_tokenization_work(
+    project_id: str, queue_ids: Iterable[str], with_commit: bool = False
+) -> None:
+    session.query(RecordTokenizationQueue).filter(
+        RecordTokenizationQueue.project_id == project_id,
+        RecordTokenizationQueue.id.in_(queue_ids),
+    ).delete(synchronize_session=False)
+    general.flush_or_commit(with_commit)
+
+
+def complete_tokenization_work_of_record(
+    project_id: str, record_id: str, attribute_id: str, with_commit: bool = False
+) -> None:
+    # called when token statistics are written so tokenized pairs aren't claimed again
+    session.query(RecordTokenizationQueue).filter(
+        RecordTokenizationQueue.project_id == project_id,
+        RecordTokenizationQueue.record_id == record_id,
+        RecordTokenizationQueue.attribute_id == attribute_id,
+    ).delete(synchronize_session=False)
+    general.flush_or_commit(with_commit)
+
+
+def release_tokenization_work(
+    project_id: str, queue_ids: Iterable[str], with_commit: bool = False
+) -> None:
+    # e.g. on worker errors so the entries don't wait for the claim timeout
+    session.query(RecordTokenizationQueue).filter(
+        RecordTokenizationQueue.project_id == project_id,
+        RecordTokenizationQueue.id.in_(queue_ids),
+    ).update({"claimed_at": None}, synchronize_session=False)
+    general.flush_or_commit(with_commit)
+
+
+def count_tokenization_work(project_id: str) -> int:
+    return (
+        session.query(RecordTokenizationQueue)
+        .filter(RecordTokenizationQueue.project_id == project_id)
+        .count()
+    )
 
 
 def create_tokenization_task(
@@ -134,15 +426,67 @@ def create_tokenization_task(
         scope=scope,
         attribute_name=attribute_name,
     )
-    general.add(tbl_entry, with_commit)
+    general.add(tbl_entry, with_commit=False)
+    __notify_task_state(project_id, tbl_entry.id, tbl_entry.state)
+    general.flush_or_commit(with_commit)
     return tbl_entry
 
 
+def update_tokenization_task_state(
+    project_id: str,
+    task_id: str,
+    state: str,
+    progress: Optional[float] = None,
+    with_commit: bool = False,
+) -> Optional[RecordTokenizationTask]:
+    # state of enums.TokenizerTask.STATE_*, emits a state change event for listeners
+    task_item = get(project_id, task_id)
+    if not task_item:
+        return None
+    task_item.state = state
+    if progress is not None:
+        task_item.progress = progress
+    if state in [
+        enums.TokenizerTask.STATE_FINISHED.value,
+        enums.TokenizerTask.STATE_FAILED.value,
+    ]:
+        task_item.finished_at = sql.func.now()
+    __notify_task_state(project_id, task_id, state)
+    general.flush_or_commit(with_commit)
+    return task_item
+
+
+def __notify_task_state(project_id: str, task_id: str, state: str) -> None:
+    event_channel.notify(
+        enums.DBEventType.TOKENIZATION_STATE_CHANGED,
+        project_id=project_id,
+        task_id=task_id,
+        state=state,
+    )
+
+
 def delete_docbins(project_id: str, with_commit: bool = False) -> None:
     project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
     query = f"""
     DELETE FROM record_tokenized
-    WHERE project_id = '{project_id}'
+    WHERE project_id = '{project_id}';
+    DELETE FROM record_tokenized_content
+    WHERE project_id = '{project_id}';
+    """
+    general.execute(query)
+    general.flush_or_commit(with_commit)
+
+
+def delete_unused_doc_bin_contents(project_id: str, with_commit: bool = False) -> None:
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    query = f"""
+    DELETE FROM record_tokenized_content rtc
+    WHERE rtc.project_id = '{project_id}'
+    AND NOT EXISTS (
+        SELECT 1
+        FROM record_tokenized rt
+        WHERE rt.project_id = rtc.project_id AND rt.content_hash = rtc.content_hash
+    )
     """
     general.execute(query)
     general.flush_or_commit(with_commit)
@@ -178,10 +522,13 @@ def delete_token_statistics(records: List[Record], with_commit: bool = False) ->
 def delete_token_statistics_by_id(
     project_id: str, record_ids: Iterable[str], with_commit: bool = False
 ) -> None:
+    record_ids = list(record_ids)
     session.query(RecordAttributeTokenStatistics).filter(
         RecordAttributeTokenStatistics.record_id.in_(record_ids),
         RecordAttributeTokenStatistics.project_id == project_id,
     ).delete()
+    # records need to be tokenized again
+    enqueue_tokenization_work(str(project_id), record_ids)
     general.flush_or_commit(with_commit)
 
 
@@ -194,6 +541,8 @@ def delete_token_statistics_for_project(
     WHERE project_id = '{project_id}'
     """
     general.execute(query)
+    # records need to be tokenized again
+    enqueue_tokenization_work(project_id)
     general.flush_or_commit(with_commit)
 
 
@@ -1,11 +1,25 @@
+import atexit
+import time
+import traceback
 import uuid
 from datetime import date
+from threading import Lock
 from ..enums import StrategyComplexity
 from . import project
 from ..business_objects import general
-from typing import Optional
+from .. import daemon
+from typing import Dict, Optional, Tuple
 from ..util import prevent_sql_injection
 
+# buffered consumption (see log_consumption_buffered) is written at most every x seconds
+FLUSH_INTERVAL_SECONDS = 10
+
+__AGGREGATOR_LOCK = Lock()
+# (org_id, project_id, creation_date, complexity) -> count
+__pending_counts: Dict[Tuple[str, str, str, str], int] = {}
+__project_name_cache: Dict[str, str] = {}
+__flush_thread_started = False
+
 
 def log_consumption(
     org_id: str,
@@ -13,23 +27,108 @@ def log_consumption(
     complexity: StrategyComplexity,
     with_commit: bool = True,
 ):
-    id = str(uuid.uuid4())
-    project_entity = project.get(project_id)
-    project_name = project_entity.name
+    __upsert_counts(
+        {(str(org_id), str(project_id), str(date.today()), complexity.value): 1}
+    )
+    general.flush_or_commit(with_commit)
+
+
+def log_consumption_buffered(
+    org_id: str,
+    project_id: str,
+    complexity: StrategyComplexity,
+) -> None:
+    # counts are aggregated in memory and written by a background thread (& on shutdown)
+    # so concurrent llm calls don't all update the same summary row
+    key = (str(org_id), str(project_id), str(date.today()), complexity.value)
+    with __AGGREGATOR_LOCK:
+        __pending_counts[key] = __pending_counts.get(key, 0) + 1
+    __ensure_flush_thread()
+
+
+def flush(with_commit: bool = True) -> None:
+    # writes all pending buffered counts in a single multi row upsert
+    global __pending_counts
+    with __AGGREGATOR_LOCK:
+        if not __pending_counts:
+            return
+        pending, __pending_counts = __pending_counts, {}
+    try:
+        __upsert_counts(pending)
+        general.flush_or_commit(with_commit)
+    except Exception:
+        general.rollback()
+        # keep the counts for the next try
+        with __AGGREGATOR_LOCK:
+            for key, count in pending.items():
+                __pending_counts[key] = __pending_counts.get(key, 0) + count
+        raise
+
+
+def __upsert_counts(counts: Dict[Tuple[str, str, str, str], int]) -> None:
+    values = []
+    # sorted so concurrent flushes lock the rows in the same order
+    for key in sorted(counts):
+        org_id, project_id, creation_date, complexity = prevent_sql_injection(
+            list(key), True
+        )
+        project_name = prevent_sql_injection(__get_project_name(project_id), True)
+        values.append(
+            f"('{uuid.uuid4()}', '{org_id}', '{project_id}', '{creation_date}', '{project_name}', '{complexity}', {int(counts[key])})"
+        )
 
     query = f"""
     INSERT INTO cognition.consumption_summary (id, organization_id, project_id, creation_date, project_name, complexity, count)
-    VALUES ('{id}', '{org_id}', '{project_id}', '{date.today()}', '{project_name}', '{complexity.value}', 1)
+    VALUES {", ".join(values)}
     ON CONFLICT ON CONSTRAINT unique_summary DO UPDATE
-        SET count = consumption_summary.count + 1;
+        SET count = consumption_summary.count + EXCLUDED.count;
     """
     general.execute(query)
-    general.flush_or_commit(with_commit)
+
+
+def __get_project_name(project_id: str) -> str:
+    project_name = __project_name_cache.get(project_id)
+    if project_name is None:
+        project_entity = project.get(project_id)
+        project_name = project_entity.name if project_entity else ""
+        __project_name_cache[project_id] = project_name
+    return project_name
+
+
+def __ensure_flush_thread() -> None:
+    global __flush_thread_started
+    with __AGGREGATOR_LOCK:
+        if __flush_thread_started:
+            return
+        __flush_thread_started = True
+    daemon.run_with_db_token(__flush_periodically)
+    atexit.register(__flush_on_shutdown)
+
+
+def __flush_periodically() -> None:
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        try:
+            flush()
+        except Exception:
+            print(traceback.format_exc(), flush=True)
+        daemon.reset_session_token_in_thread()
+
+
+def __flush_on_shutdown() -> None:
+    ctx_token = general.get_ctx_token()
+    try:
+        flush()
+    except Exception:
+        print(traceback.format_exc(), flush=True)
+    finally:
+        general.reset_ctx_token(ctx_token, True)
 
 
 def update_project_name(
     project_id: str, project_name: str, with_commit: bool = True
 ) -> None:
+    __project_name_cache[str(project_id)] = project_name
     project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
     project_name = prevent_sql_injection(project_name, isinstance(project_name, str))
     query = f"""
@@ -2,11 +2,17 @@ from typing import Dict, List, Optional, Tuple, Any, Union
 
 from datetime import datetime
 
-from ..cognition_objects import message
+from ..cognition_objects import message, message_rollup, message_pipeline_summary
 from ..business_objects import general
 from ..session import session
 from ..models import CognitionConversation
-from ..util import prevent_sql_injection
+from ..util import (
+    prevent_sql_injection,
+    encode_keyset_cursor,
+    decode_keyset_cursor,
+    get_keyset_filter,
+    get_keyset_order_by,
+)
 
 
 def get(project_id: str, conversation_id: str) -> CognitionConversation:
@@ -20,6 +26,55 @@ def get(project_id: str, conversation_id: str) -> CognitionConversation:
     )
 
 
+def get_all_by_project_id_keyset(
+    project_id: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    order_asc: bool = True,
+    user_id: Optional[str] = None,
+    with_count: bool = True,
+) -> Tuple[Optional[int], Optional[str], List[CognitionConversation]]:
+    # keyset pagination over (created_at, id), returns approximate count, next cursor & items
+    query = session.query(CognitionConversation).filter(
+        CognitionConversation.project_id == project_id
+    )
+    if user_id is not None:
+        query = query.filter(CognitionConversation.created_by == user_id)
+    if cursor:
+        created_at, id = decode_keyset_cursor(cursor)
+        query = query.filter(
+            get_keyset_filter(
+                CognitionConversation.created_at,
+                CognitionConversation.id,
+                created_at,
+                id,
+                order_asc,
+            )
+        )
+    query = query.order_by(
+        *get_keyset_order_by(
+            CognitionConversation.created_at, CognitionConversation.id, order_asc
+        )
+    )
+    items = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_keyset_cursor(items[-1].created_at, items[-1].id)
+
+    approximate_count = None
+    if with_count:
+        project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+        where_add = ""
+        if user_id is not None:
+            user_id = prevent_sql_injection(user_id, isinstance(user_id, str))
+            where_add = f" AND c.created_by = '{user_id}'"
+        approximate_count = general.estimate_count(
+            f"""SELECT 1 FROM cognition.conversation c WHERE c.project_id = '{project_id}' {where_add}"""
+        )
+    return approximate_count, next_cursor, items
+
+
 def get_scoped(project_id: str, conversation_id: str, user_id) -> CognitionConversation:
     return (
         session.query(CognitionConversation)
@@ -75,24 +130,11 @@ def get_overview_list(
         {pagination_add}
     ) x
     INNER JOIN (
-        SELECT jsonb_build_object('message_id',m.id, 'question', m.question, 'has_error',y.has_error, 'time_elapsed',zx.time_elapsed) message_data, m.created_at, m.conversation_id, m.project_id
+        SELECT jsonb_build_object('message_id',m.id, 'question', m.question, 'has_error',mps.has_error, 'time_elapsed',mps.time_elapsed::NUMERIC(10,5)) message_data, m.created_at, m.conversation_id, m.project_id
         FROM cognition.message m
-        LEFT JOIN LATERAL (
-            -- most recent log for message
-            SELECT pl.has_error
-            FROM cognition.pipeline_logs pl
-            WHERE m.project_id = pl.project_id
-                AND m.id = pl.message_id
-            ORDER BY pl.created_at DESC
-            LIMIT 1
-        ) y
-            ON TRUE
-        INNER JOIN (
-            SELECT pl.project_id, pl.message_id , SUM(pl.time_elapsed)::NUMERIC(10,5) time_elapsed
-            FROM cognition.pipeline_logs pl
-            GROUP BY pl.project_id, pl.message_id
-        ) zx
-            ON m.project_id = zx.project_id AND m.id = zx.message_id
+        -- only messages with pipeline logs
+        {message_pipeline_summary.get_join_sql("m", "mps", "INNER")}
+        WHERE m.project_id = '{project_id}'
     ) z
         ON x.project_id = z.project_id AND x.id = z.conversation_id
     GROUP BY x.id
@@ -151,13 +193,10 @@ def has_error(project_id: str, conversation_id: str) -> bool:
         conversation_id, isinstance(conversation_id, str)
     )
     query = f"""
-    SELECT DISTINCT pl.has_error
-    FROM cognition.conversation C
-    INNER JOIN cognition.message M
-        ON c.project_id = m.project_id AND c.id = m.conversation_id
-    INNER JOIN cognition.pipeline_logs pl
-        ON m.project_id = pl.project_id AND m.id = pl.message_id
-    WHERE c.id = '{conversation_id}' AND c.project_id = '{project_id}'
+    SELECT mps.error_count > 0 has_error
+    FROM cognition.message M
+    {message_pipeline_summary.get_join_sql("m", "mps", "INNER")}
+    WHERE m.conversation_id = '{conversation_id}' AND m.project_id = '{project_id}'
     ORDER BY 1 DESC -- true first
     LIMIT 1 """
 
@@ -248,6 +287,10 @@ def update_message(
     with_commit: bool = True,
 ) -> CognitionConversation:
     message_entity = message.get(project_id, message_id)
+    previous_feedback = (
+        message_entity.feedback_value,
+        message_entity.feedback_category,
+    )
     if strategy_id is not None:
         message_entity.strategy_id = strategy_id
     if answer is not None:
@@ -262,12 +305,23 @@ def update_message(
         message_entity.scope_dict_diff_previous_conversation = (
             scope_dict_diff_previous_conversation
         )
+    message_rollup.apply_feedback_change(
+        project_id,
+        message_entity.created_at,
+        *previous_feedback,
+        message_entity.feedback_value,
+        message_entity.feedback_category,
+    )
+    if answer is not None:
+        message.invalidate_history_cache(project_id, conversation_id)
     general.flush_or_commit(with_commit)
     conversation_entity = get(project_id, conversation_id)
     return conversation_entity
 
 
 def delete(project_id: str, conversation_id: str, with_commit: bool = True) -> None:
+    message.invalidate_history_cache(project_id, conversation_id)
+    message_rollup.remove_messages(project_id, conversation_ids=[conversation_id])
     session.query(CognitionConversation).filter(
         CognitionConversation.project_id == project_id,
         CognitionConversation.id == conversation_id,
@@ -278,6 +332,9 @@ def delete(project_id: str, conversation_id: str, with_commit: bool = True) -> N
 def delete_many(
     project_id: str, conversation_ids: List[str], with_commit: bool = True
 ) -> None:
+    for conversation_id in conversation_ids:
+        message.invalidate_history_cache(project_id, conversation_id)
+    message_rollup.remove_messages(project_id, conversation_ids=conversation_ids)
     session.query(CognitionConversation).filter(
         CognitionConversation.project_id == project_id,
         CognitionConversation.id.in_(conversation_ids),
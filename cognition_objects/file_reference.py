@@ -1,7 +1,15 @@
 from ..business_objects import general
 from ..session import session
 from ..models import FileReference
-from typing import Dict, Any, List
+from ..util import (
+    prevent_sql_injection,
+    encode_keyset_cursor,
+    get_keyset_filter,
+    get_keyset_null_filter,
+    get_keyset_order_by,
+    decode_keyset_cursor,
+)
+from typing import Dict, Any, List, Optional, Tuple
 
 
 def get(org_id: str, hash: str, file_size_bytes) -> FileReference:
@@ -40,6 +48,53 @@ def get_all_by_org(org_id: str, offset: int, limit: int) -> List[FileReference]:
     )
 
 
+def get_all_by_org_keyset(
+    org_id: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    with_count: bool = True,
+) -> Tuple[Optional[int], Optional[str], List[FileReference]]:
+    # keyset pagination over (last_used, id) most recent first, returns approximate count, next cursor & items
+    # note that last_used changes on reuse so a file can move between pages
+    # never used files (last_used NULL) come last, they are fetched separately so both parts can seek the index
+    base_query = session.query(FileReference).filter(
+        FileReference.organization_id == org_id,
+    )
+    order_by = get_keyset_order_by(FileReference.last_used, FileReference.id, False)
+    query = base_query
+    last_used = None
+    if cursor:
+        last_used, id = decode_keyset_cursor(cursor)
+        query = query.filter(
+            get_keyset_filter(
+                FileReference.last_used, FileReference.id, last_used, id, False
+            )
+        )
+    items = query.order_by(*order_by).limit(limit + 1).all()
+    if cursor and last_used is not None and len(items) <= limit:
+        # non NULL part used up
+        items += (
+            base_query.filter(
+                get_keyset_null_filter(FileReference.last_used, FileReference.id)
+            )
+            .order_by(*order_by)
+            .limit(limit + 1 - len(items))
+            .all()
+        )
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_keyset_cursor(items[-1].last_used, items[-1].id)
+
+    approximate_count = None
+    if with_count:
+        org_id = prevent_sql_injection(org_id, isinstance(org_id, str))
+        approximate_count = general.estimate_count(
+            f"""SELECT 1 FROM cognition.file_reference fr WHERE fr.organization_id = '{org_id}'"""
+        )
+    return approximate_count, next_cursor, items
+
+
 def get_count_by_org(org_id: str) -> int:
     return (
         session.query(FileReference)
@@ -1,4 +1,14 @@
-from typing import List, Optional, Dict, Any, Iterable, Union
+from typing import (
+    List,
+    Optional,
+    Dict,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Tuple,
+    Union,
+)
 from ..business_objects import general
 from ..session import session
 from ..models import (
@@ -20,10 +30,31 @@ from ..enums import (
     MacroExecutionLinkAction,
     Tablenames,
 )
-from ..util import prevent_sql_injection, is_list_like
-from . import project
-from sqlalchemy import or_, and_
-from sqlalchemy.orm.attributes import flag_modified
+from ..util import (
+    prevent_sql_injection,
+    is_list_like,
+    encode_keyset_cursor,
+    get_keyset_filter_sql,
+    get_keyset_order_by_sql,
+    decode_keyset_cursor,
+)
+from . import project, message, message_rollup, message_pipeline_summary
+from .. import daemon
+from sqlalchemy import or_, and_, func
+from sqlalchemy.dialects.postgresql import insert
+from collections import OrderedDict
+from threading import Lock
+import copy
+import uuid
+
+GRAPH_CACHE_MAX_MACROS = 200
+
+__GRAPH_CACHE_LOCK = Lock()
+# macro_id -> (graph_version, edges, nodes), least recently used first
+__graph_cache = OrderedDict()
+
+NODE_FIELDS = ["is_root", "config"]
+EDGE_FIELDS = ["from_node_id", "to_node_id", "config"]
 
 
 def get(id: str) -> CognitionMacro:
@@ -37,12 +68,31 @@ def get(id: str) -> CognitionMacro:
 
 
 def get_with_nodes_and_edges(macro_id: str) -> Dict[str, Any]:
+    # nodes & edges are cached per macro and reused as long as the graph_version matches
     macro_id = prevent_sql_injection(macro_id, isinstance(macro_id, str))
     query = f"""
-    SELECT row_to_json(x)
-    FROM (
-        SELECT M.*,  COALESCE(me.edges, '{{}}'::json[]) AS edges, COALESCE(mn.nodes, '{{}}'::json[]) AS nodes
-        FROM cognition.macro M,
+    SELECT row_to_json(m.*)
+    FROM cognition.macro M
+    WHERE m.id = '{macro_id}' """
+    result = general.execute_first(query)
+    if not result or not result[0]:
+        with __GRAPH_CACHE_LOCK:
+            __graph_cache.pop(str(macro_id), None)
+        return None
+    macro_data = result[0]
+    graph_version = macro_data.get("graph_version") or 0
+
+    with __GRAPH_CACHE_LOCK:
+        cached = __graph_cache.get(str(macro_id))
+        if cached and cached[0] == graph_version:
+            __graph_cache.move_to_end(str(macro_id))
+            edges, nodes = cached[1], cached[2]
+        else:
+            cached = None
+    if not cached:
+        query = f"""
+        SELECT COALESCE(me.edges, '{{}}'::json[]) AS edges, COALESCE(mn.nodes, '{{}}'::json[]) AS nodes
+        FROM
         (
             SELECT array_agg(row_to_json(me.*)) edges
             FROM cognition.macro_edge me
@@ -52,12 +102,17 @@ def get_with_nodes_and_edges(macro_id: str) -> Dict[str, Any]:
             SELECT array_agg(row_to_json(mn.*)) nodes
             FROM cognition.macro_node mn
             WHERE mn.macro_id = '{macro_id}'
-        ) mn
-        WHERE m.id = '{macro_id}' )x """
-    result = general.execute_first(query)
-    if result and result[0]:
-        return result[0]
-    return None
+        ) mn """
+        edges, nodes = general.execute_first(query)
+        with __GRAPH_CACHE_LOCK:
+            __graph_cache[str(macro_id)] = (graph_version, edges, nodes)
+            __graph_cache.move_to_end(str(macro_id))
+            while len(__graph_cache) > GRAPH_CACHE_MAX_MACROS:
+                __graph_cache.popitem(last=False)
+
+    macro_data["edges"] = copy.deepcopy(edges)
+    macro_data["nodes"] = copy.deepcopy(nodes)
+    return macro_data
 
 
 def get_overview_for_all_for_me(
@@ -234,7 +289,9 @@ def create_node(
         config=config,
     )
 
-    general.add(node, with_commit)
+    general.add(node, with_commit=False)
+    __bump_graph_version(macro_id)
+    general.flush_or_commit(with_commit)
 
     return node
 
@@ -257,7 +314,9 @@ def create_edge(
         config=config,
     )
 
-    general.add(edge, with_commit)
+    general.add(edge, with_commit=False)
+    __bump_graph_version(macro_id)
+    general.flush_or_commit(with_commit)
 
     return edge
 
@@ -295,53 +354,52 @@ def delete_macros(
     return [str(obj.id) for obj in objs]
 
 
-# creates, updates, deletes nodes based on the updated_nodes list
-def match_nodes(
+# creates, updates, deletes nodes & edges in bulk
+# only changed items are written, returns True if anything changed
+def save_graph(
     user_id: str,
     macro_id: str,
     update_nodes: List[Dict[str, Any]],
+    update_edges: List[Dict[str, Any]],
     with_commit: bool = False,
-) -> None:
-
-    current: List[CognitionMacroNode] = (
-        session.query(CognitionMacroNode)
-        .filter(
-            CognitionMacroNode.macro_id == macro_id,
-        )
-        .all()
+) -> bool:
+    node_upserts, node_deletes = __diff_graph_items(
+        CognitionMacroNode, macro_id, update_nodes, NODE_FIELDS
+    )
+    edge_upserts, edge_deletes = __diff_graph_items(
+        CognitionMacroEdge, macro_id, update_edges, EDGE_FIELDS
+    )
+    # order matters: new edges can point to new nodes & node deletion cascades to edges
+    __upsert_graph_items(
+        CognitionMacroNode, user_id, macro_id, node_upserts, NODE_FIELDS
     )
+    __delete_graph_items(CognitionMacroEdge, macro_id, edge_deletes)
+    __upsert_graph_items(
+        CognitionMacroEdge, user_id, macro_id, edge_upserts, EDGE_FIELDS
+    )
+    __delete_graph_items(CognitionMacroNode, macro_id, node_deletes)
 
-    # dict to get values
-    wanted = {n["id"]: n for n in update_nodes}
-    # set for faster lookup
-    found = {str(n.id) for n in current}
-    # lists for faster generation
-    to_delete = [id for id in found if id not in wanted]
-    to_update = [n for n in current if str(n.id) in wanted]
-    to_create = [n for n in update_nodes if n["id"] not in found]
-
-    session.query(CognitionMacroNode).filter(
-        CognitionMacroNode.id.in_(to_delete),
-    ).delete(synchronize_session=False)
+    changed = bool(node_upserts or node_deletes or edge_upserts or edge_deletes)
+    if changed:
+        __bump_graph_version(macro_id)
+    general.flush_or_commit(with_commit)
+    return changed
 
-    for node in to_update:
-        update_values = wanted.get(str(node.id))
-        if not update_values:
-            raise ValueError(f"Node with id {node.id} not found in update_nodes")
-        node.is_root = update_values["is_root"]
-        node.config = update_values["config"]
-        flag_modified(node, "config")
-
-    for node in to_create:
-        create_node(
-            macro_id=macro_id,
-            created_by=node.get("created_by", user_id),
-            is_root=node["is_root"],
-            config=node["config"],
-            id=node["id"],
-            with_commit=False,
-        )
 
+# creates, updates, deletes nodes based on the updated_nodes list
+def match_nodes(
+    user_id: str,
+    macro_id: str,
+    update_nodes: List[Dict[str, Any]],
+    with_commit: bool = False,
+) -> None:
+    to_upsert, to_delete = __diff_graph_items(
+        CognitionMacroNode, macro_id, update_nodes, NODE_FIELDS
+    )
+    __delete_graph_items(CognitionMacroNode, macro_id, to_delete)
+    __upsert_graph_items(CognitionMacroNode, user_id, macro_id, to_upsert, NODE_FIELDS)
+    if to_upsert or to_delete:
+        __bump_graph_version(macro_id)
     general.flush_or_commit(with_commit)
 
 
@@ -352,47 +410,91 @@ def match_edges(
     update_edges: List[Dict[str, Any]],
     with_commit: bool = False,
 ) -> None:
-    current: List[CognitionMacroEdge] = (
-        session.query(CognitionMacroEdge)
-        .filter(
-            CognitionMacroEdge.macro_id == macro_id,
-        )
+    to_upsert, to_delete = __diff_graph_items(
+        CognitionMacroEdge, macro_id, update_edges, EDGE_FIELDS
+    )
+    __upsert_graph_items(CognitionMacroEdge, user_id, macro_id, to_upsert, EDGE_FIELDS)
+    __delete_graph_items(CognitionMacroEdge, macro_id, to_delete)
+    if to_upsert or to_delete:
+        __bump_graph_version(macro_id)
+    general.flush_or_commit(with_commit)
+
+
+def __diff_graph_items(
+    model: Any, macro_id: str, wanted: List[Dict[str, Any]], fields: List[str]
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    # compares against the stored values, returns items to create/update & ids to delete
+    current = {
+        str(row.id): {f: __normalize_graph_value(getattr(row, f)) for f in fields}
+        for row in session.query(model.id, *[getattr(model, f) for f in fields])
+        .filter(model.macro_id == macro_id)
         .all()
+    }
+    wanted_ids = set()
+    to_upsert = []
+    for item in wanted:
+        item_id = str(item["id"])
+        wanted_ids.add(item_id)
+        values = {f: __normalize_graph_value(item[f]) for f in fields}
+        if current.get(item_id) != values:
+            to_upsert.append(item)
+    to_delete = [item_id for item_id in current if item_id not in wanted_ids]
+    return to_upsert, to_delete
+
+
+def __normalize_graph_value(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def __upsert_graph_items(
+    model: Any,
+    user_id: str,
+    macro_id: str,
+    items: List[Dict[str, Any]],
+    fields: List[str],
+) -> None:
+    if not items:
+        return
+    tbl = model.__table__
+    query = insert(tbl).values(
+        [
+            {
+                "id": item["id"],
+                "macro_id": macro_id,
+                "created_by": item.get("created_by", user_id),
+                **{f: item[f] for f in fields},
+            }
+            for item in items
+        ]
     )
-    # dict to get values
-    wanted = {e["id"]: e for e in update_edges}
-    # set for faster lookup
-    found = {str(e.id) for e in current}
-    # lists for faster generation
-    to_delete = [id for id in found if id not in wanted]
-    to_update = [e for e in current if str(e.id) in wanted]
-    to_create = [e for e in update_edges if e["id"] not in found]
-
-    for edge in to_update:
-        update_values = wanted.get(str(edge.id))
-        if not update_values:
-            raise ValueError(f"Edge with id {edge.id} not found in update_edges")
-        edge.from_node_id = update_values["from_node_id"]
-        edge.to_node_id = update_values["to_node_id"]
-        edge.config = update_values["config"]
-        flag_modified(edge, "config")
-
-    for edge in to_create:
-        create_edge(
-            macro_id=macro_id,
-            from_node_id=edge["from_node_id"],
-            to_node_id=edge["to_node_id"],
-            created_by=edge.get("created_by", user_id),
-            config=edge["config"],
-            id=edge["id"],
-            with_commit=False,
-        )
+    query = query.on_conflict_do_update(
+        index_elements=[tbl.c.id],
+        set_={f: query.excluded[f] for f in fields},
+        # ids are generated by the frontend, don't touch items of other macros
+        where=tbl.c.macro_id == macro_id,
+    )
+    general.execute(query)
+
 
-    session.query(CognitionMacroEdge).filter(
-        CognitionMacroEdge.id.in_(to_delete),
+def __delete_graph_items(model: Any, macro_id: str, ids: List[str]) -> None:
+    if not ids:
+        return
+    session.query(model).filter(
+        model.macro_id == macro_id,
+        model.id.in_(ids),
     ).delete(synchronize_session=False)
 
-    general.flush_or_commit(with_commit)
+
+def __bump_graph_version(macro_id: str) -> None:
+    session.query(CognitionMacro).filter(CognitionMacro.id == macro_id).update(
+        {
+            CognitionMacro.graph_version: func.coalesce(CognitionMacro.graph_version, 0)
+            + 1
+        },
+        synchronize_session=False,
+    )
 
 
 def create_macro_execution(
@@ -474,16 +576,7 @@ def get_macro_execution_overview_message_queue(
     ]:
         raise ValueError(f"Macro with id {macro_id} not found or wrong type")
 
-    where_add = ""
-    if only_user_id:
-        where_add += f"AND me.created_by = '{only_user_id}'"
-
-    if only_org_id:
-        only_org_id = prevent_sql_injection(only_org_id, isinstance(only_org_id, str))
-        where_add += f" AND me.organization_id = '{only_org_id}'"
-    if only_prj_id:
-        only_prj_id = prevent_sql_injection(only_prj_id, isinstance(only_prj_id, str))
-        where_add += f" AND (me.meta_info->>'project_id') = '{only_prj_id}'"
+    where_add = __get_message_queue_where_add(only_org_id, only_prj_id, only_user_id)
     query = f"""
     SELECT array_agg(to_jsonb(x) || to_jsonb(y))
     FROM (
@@ -533,6 +626,220 @@ def get_macro_execution_overview_message_queue(
     return []
 
 
+def get_macro_execution_overview_message_queue_paginated(
+    macro_id: str,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    only_org_id: Optional[str] = None,
+    only_prj_id: Optional[str] = None,
+    only_user_id: Optional[str] = None,
+) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    # newest groups first, project metadata is joined via the generated project_id column
+    # returns next cursor & entries (one per group & project like the unpaginated version)
+    macro_id = prevent_sql_injection(macro_id, isinstance(macro_id, str))
+    __check_message_queue_macro(macro_id)
+    limit = prevent_sql_injection(limit, isinstance(limit, int))
+
+    where_add = __get_message_queue_where_add(only_org_id, only_prj_id, only_user_id)
+    having_add = ""
+    if cursor:
+        group_start, group_id = decode_keyset_cursor(cursor)
+        having_add = "HAVING " + get_keyset_filter_sql(
+            "MIN(me.created_at)", "me.execution_group_id", group_start, group_id, False
+        )
+
+    query = f"""
+    WITH groups AS (
+        SELECT me.execution_group_id group_id, MIN(me.created_at) group_start
+        FROM cognition.macro_execution me
+        WHERE me.macro_id = '{macro_id}' {where_add}
+        GROUP BY me.execution_group_id
+        {having_add}
+        ORDER BY {get_keyset_order_by_sql("2", "1", False)}
+        LIMIT {limit + 1}
+    )
+    SELECT jsonb_build_object(
+        'macro_id', '{macro_id}',
+        'project_id', me.project_id,
+        'group_id', g.group_id,
+        'group_start', g.group_start,
+        'created_by', (array_agg(me.created_by::TEXT ORDER BY me.created_at))[1],
+        'project_name', p.name,
+        'organization_id', p.organization_id,
+        'executions', array_agg(
+            jsonb_build_object(
+                'state',me.state,
+                'executionId',me.id)
+            || me.meta_info::jsonb ORDER BY me.created_at)
+    ), g.group_start, g.group_id
+    FROM groups g
+    INNER JOIN cognition.macro_execution me
+        ON me.macro_id = '{macro_id}' AND me.execution_group_id = g.group_id
+    LEFT JOIN cognition.project p
+        ON p.id::TEXT = me.project_id
+    WHERE TRUE {where_add}
+    GROUP BY g.group_id, g.group_start, me.project_id, p.name, p.organization_id
+    ORDER BY {get_keyset_order_by_sql("g.group_start", "g.group_id", False)}
+    """
+    rows = general.execute_all(query)
+    group_ids = []
+    for row in rows:
+        if not group_ids or group_ids[-1][1] != row[2]:
+            group_ids.append((row[1], row[2]))
+    next_cursor = None
+    if len(group_ids) > limit:
+        last_start, last_id = group_ids[limit - 1]
+        next_cursor = encode_keyset_cursor(last_start, last_id)
+        rows = [row for row in rows if row[2] != group_ids[limit][1]]
+    return next_cursor, [row[0] for row in rows]
+
+
+def stream_macro_execution_overview_message_queue(
+    macro_id: str,
+    page_size: int = 100,
+    only_org_id: Optional[str] = None,
+    only_prj_id: Optional[str] = None,
+    only_user_id: Optional[str] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    # yields the overview page by page
+    cursor = None
+    while True:
+        cursor, items = get_macro_execution_overview_message_queue_paginated(
+            macro_id, page_size, cursor, only_org_id, only_prj_id, only_user_id
+        )
+        if items:
+            yield items
+        if not cursor:
+            return
+
+
+def get_macro_execution_data_for_message_queue_paginated(
+    macro_id: str,
+    group_ids: List[str],
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    only_org_id: Optional[str] = None,
+) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    # executions ordered by (created_at, id), same entry format as the unpaginated version
+    if len(group_ids) == 0:
+        return None, []
+    macro_id = prevent_sql_injection(macro_id, isinstance(macro_id, str))
+    __check_message_queue_macro(macro_id)
+    limit = prevent_sql_injection(limit, isinstance(limit, int))
+    group_ids = [prevent_sql_injection(g, isinstance(g, str)) for g in group_ids]
+    group_ids_str = "'" + "','".join(group_ids) + "'"
+
+    where_add = __get_message_queue_where_add(only_org_id)
+    if cursor:
+        created_at, execution_id = decode_keyset_cursor(cursor)
+        where_add += " AND " + get_keyset_filter_sql(
+            "me.created_at", "me.id", created_at, execution_id
+        )
+
+    query = f"""
+    SELECT
+        jsonb_build_object(
+            'id', me.id,
+            'conversation_id', c.id,
+            'created_by', me.created_by,
+            'state', me.state,
+            'execution_group_id', me.execution_group_id,
+            'meta_info', (me.meta_info::jsonb - 'project_id') || jsonb_build_object('conversationCreated', c.created_at, 'project_name', p.name),
+            'project_id', me.project_id,
+            'facts_grouping_attribute', p.facts_grouping_attribute,
+            'message_data', message_data.message_data
+        ),
+        me.created_at,
+        me.id
+    FROM (
+        SELECT me.*
+        FROM cognition.macro_execution me
+        WHERE me.macro_id = '{macro_id}'
+            AND me.execution_group_id IN ({group_ids_str})
+            {where_add}
+            -- filtered before the limit so pages aren't shortened by the joins below
+            AND EXISTS (
+                SELECT 1
+                FROM cognition.macro_execution_link mel
+                INNER JOIN cognition.conversation c
+                    ON c.id = mel.other_id
+                WHERE me.organization_id = mel.organization_id AND me.id = mel.execution_id AND mel.other_id_target = '{Tablenames.CONVERSATION.value}'
+            )
+            AND EXISTS (
+                SELECT 1
+                FROM cognition.macro_execution_link mel
+                INNER JOIN cognition.message m
+                    ON mel.other_id = m.id
+                WHERE mel.execution_id = me.id AND mel.other_id_target = '{Tablenames.MESSAGE.value}'
+            )
+        ORDER BY me.created_at, me.id
+        LIMIT {limit + 1}
+    ) me
+    INNER JOIN cognition.macro_execution_link mel_c
+        ON me.organization_id = mel_c.organization_id AND me.id = mel_c.execution_id AND mel_c.other_id_target = '{Tablenames.CONVERSATION.value}'
+    INNER JOIN cognition.conversation C
+        ON c.id = mel_c.other_id
+    LEFT JOIN cognition.project p
+        ON p.id::TEXT = me.project_id
+    INNER JOIN LATERAL (
+        SELECT array_agg(to_jsonb(i) ORDER BY i.rn) message_data
+        FROM (
+            SELECT
+                mel_m.execution_id,
+                mel_m.execution_node_id,
+                M.created_at message_creation,
+                m.question,
+                m.facts,
+                m.answer,
+                mps.has_error,
+                ROW_NUMBER () OVER(PARTITION BY m.conversation_id ORDER BY m.created_at ASC) rn
+            FROM cognition.macro_execution_link mel_m
+            INNER JOIN cognition.message M
+                ON mel_m.other_id = m.id
+            {message_pipeline_summary.get_join_sql("m", "mps")}
+            WHERE mel_m.execution_id = me.id AND mel_m.other_id_target = '{Tablenames.MESSAGE.value}'
+        ) i
+    ) message_data
+        ON TRUE
+    ORDER BY {get_keyset_order_by_sql("me.created_at", "me.id")}
+    """
+    rows = general.execute_all(query)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_keyset_cursor(rows[-1][1], rows[-1][2])
+    return next_cursor, [row[0] for row in rows]
+
+
+def __check_message_queue_macro(macro_id: str) -> None:
+    macro_item = get(macro_id)
+    if not macro_item or macro_item.macro_type not in [
+        MacroType.DOCUMENT_MESSAGE_QUEUE.value,
+        MacroType.FOLDER_MESSAGE_QUEUE.value,
+    ]:
+        raise ValueError(f"Macro with id {macro_id} not found or wrong type")
+
+
+def __get_message_queue_where_add(
+    only_org_id: Optional[str] = None,
+    only_prj_id: Optional[str] = None,
+    only_user_id: Optional[str] = None,
+) -> str:
+    where_add = ""
+    if only_user_id:
+        only_user_id = prevent_sql_injection(
+            only_user_id, isinstance(only_user_id, str)
+        )
+        where_add += f" AND me.created_by = '{only_user_id}'"
+    if only_org_id:
+        only_org_id = prevent_sql_injection(only_org_id, isinstance(only_org_id, str))
+        where_add += f" AND me.organization_id = '{only_org_id}'"
+    if only_prj_id:
+        only_prj_id = prevent_sql_injection(only_prj_id, isinstance(only_prj_id, str))
+        where_add += f" AND me.project_id = '{only_prj_id}'"
+    return where_add
+
+
 def get_macro_execution_data_for_message_queue(
     macro_id: str, group_ids: List[str], only_org_id: Optional[str] = None
 ) -> List[Dict[str, Any]]:
@@ -581,21 +888,13 @@ def get_macro_execution_data_for_message_queue(
                 m.question,
                 m.facts,
                 m.answer,
-                y.has_error,
+                mps.has_error,
                 ROW_NUMBER () OVER(PARTITION BY m.conversation_id ORDER BY m.created_at ASC) rn
             FROM cognition.macro_execution_link mel_m
             INNER JOIN cognition.message M
                 ON mel_m.other_id = m.id
-            LEFT JOIN LATERAL (
-                -- most recent log for message
-                SELECT pl.has_error
-                FROM cognition.pipeline_logs pl
-                WHERE m.project_id = pl.project_id
-                    AND m.id = pl.message_id
-                ORDER BY pl.created_at DESC
-                LIMIT 1
-            ) y
-            ON TRUE
+            -- has_error of the most recent log for message
+            {message_pipeline_summary.get_join_sql("m", "mps")}
             WHERE mel_m.other_id_target = '{Tablenames.MESSAGE.value}'
         ) i
         GROUP BY 1
@@ -641,3 +940,109 @@ def delete_by_exec_groups(
     query.delete(synchronize_session=False)
     general.flush_or_commit(with_commit)
     return True
+
+
+def purge_exec_groups(
+    macro_id: Optional[str] = None,
+    group_ids: Optional[List[str]] = None,
+    org_id: Optional[str] = None,
+    older_than_days: Optional[int] = None,
+    include_conversations: bool = False,
+    batch_size: int = 1000,
+    throttle_seconds: float = 0.0,
+    progress_callback: Optional[Callable[[str, int], None]] = None,
+) -> Dict[str, int]:
+    # batched alternative to delete_by_exec_groups for large cleanups, leaf tables are deleted first
+    # older_than_days only selects groups without executions in the last x days (retention)
+    # include_conversations also removes the conversations (incl. messages & logs) created by the executions
+    # commits after every batch, returns the deleted row count per table
+    macro_id = prevent_sql_injection(macro_id, isinstance(macro_id, str))
+    org_id = prevent_sql_injection(org_id, isinstance(org_id, str))
+    older_than_days = prevent_sql_injection(
+        older_than_days, isinstance(older_than_days, int)
+    )
+    if not macro_id and group_ids is None and older_than_days is None:
+        raise ValueError(
+            "At least one of macro_id, group_ids or older_than_days needed"
+        )
+
+    where_add = ""
+    if macro_id:
+        where_add += f" AND me.macro_id = '{macro_id}'"
+    if org_id:
+        where_add += f" AND me.organization_id = '{org_id}'"
+    if group_ids is not None:
+        if len(group_ids) == 0:
+            return {}
+        group_ids = [prevent_sql_injection(g, isinstance(g, str)) for g in group_ids]
+        group_ids_str = "'" + "','".join(group_ids) + "'"
+        where_add += f" AND me.execution_group_id IN ({group_ids_str})"
+    if older_than_days is not None:
+        where_add += f"""
+        AND me.execution_group_id IN (
+            SELECT mei.execution_group_id
+            FROM cognition.macro_execution mei
+            GROUP BY mei.execution_group_id
+            HAVING MAX(mei.created_at) < now() - INTERVAL '{int(older_than_days)} days'
+        )"""
+    execution_ids_sql = (
+        f"SELECT me.id FROM cognition.macro_execution me WHERE TRUE {where_add}"
+    )
+    conversation_ids_sql = f"""
+        SELECT mel.other_id
+        FROM cognition.macro_execution_link mel
+        WHERE mel.other_id_target = '{Tablenames.CONVERSATION.value}'
+            AND mel.execution_id IN ({execution_ids_sql})"""
+
+    steps = []
+    project_ids = []
+    if include_conversations:
+        project_ids = [
+            str(row[0])
+            for row in general.execute_all(
+                f"SELECT DISTINCT c.project_id FROM cognition.conversation c WHERE c.id IN ({conversation_ids_sql})"
+            )
+        ]
+        steps += [
+            (
+                "cognition.pipeline_logs",
+                f"t.message_id IN (SELECT m.id FROM cognition.message m WHERE m.conversation_id IN ({conversation_ids_sql}))",
+            ),
+            (
+                "cognition.message",
+                f"t.conversation_id IN ({conversation_ids_sql})",
+            ),
+            ("cognition.conversation", f"t.id IN ({conversation_ids_sql})"),
+        ]
+    steps += [
+        (
+            "cognition.macro_execution_link",
+            f"t.execution_id IN ({execution_ids_sql})",
+        ),
+        (
+            "cognition.macro_execution",
+            f"t.id IN ({execution_ids_sql})",
+        ),
+    ]
+
+    deleted = {}
+    for table, where_condition in steps:
+        deleted[table] = general.delete_in_batches(
+            table,
+            where_condition,
+            batch_size=batch_size,
+            throttle_seconds=throttle_seconds,
+            progress_callback=progress_callback,
+        )
+
+    for project_id in project_ids:
+        # analytics & caches of the removed conversations
+        message_rollup.rebuild(project_id, with_commit=True)
+        message.invalidate_history_cache(project_id)
+    return deleted
+
+
+def purge_exec_groups_in_background(**kwargs) -> None:
+    # same arguments as purge_exec_groups, e.g. for a retention schedule:
+    # purge_exec_groups_in_background(older_than_days=30, include_conversations=True)
+    daemon.run_with_db_token(purge_exec_groups, **kwargs)
@@ -5,7 +5,13 @@ from ..business_objects import general
 from ..session import session
 from ..models import CognitionMarkdownDataset, Project
 from ..enums import Tablenames, MarkdownFileCategoryOrigin
-from ..util import prevent_sql_injection
+from ..util import (
+    prevent_sql_injection,
+    encode_keyset_cursor,
+    get_keyset_filter_sql,
+    get_keyset_order_by_sql,
+    decode_keyset_cursor,
+)
 
 
 def get(org_id: str, id: str) -> CognitionMarkdownDataset:
@@ -24,7 +30,10 @@ def __get_enriched_query(
     id: Optional[str] = None,
     category_origin: Optional[str] = None,
     query_add: Optional[str] = "",
+    order_by: Optional[str] = None,
 ) -> str:
+    # query_add (e.g. ORDER BY & LIMIT) is applied before the file counts are aggregated
+    # so only the selected datasets are counted, order_by is the order of the final result
     where_add = ""
     if id:
         id = prevent_sql_injection(id, isinstance(id, str))
@@ -32,16 +41,21 @@ def __get_enriched_query(
     elif category_origin:
         where_add += f" AND md.category_origin = '{category_origin}'"
     org_id = prevent_sql_injection(org_id, isinstance(org_id, str))
+    order_by_add = f"ORDER BY {order_by}" if order_by else ""
     return f"""
-        SELECT md.*, COALESCE(mf.num_files, 0) AS num_files, COALESCE(mf.num_reviewed_files, 0) AS num_reviewed_files
-        FROM cognition.{Tablenames.MARKDOWN_DATASET.value} md
-        LEFT JOIN (
-            SELECT dataset_id, COUNT(*) as num_files, COUNT(CASE WHEN is_reviewed = TRUE THEN 1 END) AS num_reviewed_files
-            FROM cognition.{Tablenames.MARKDOWN_FILE.value}
-            GROUP BY dataset_id
-        ) mf ON md.id = mf.dataset_id
-        WHERE md.organization_id = '{org_id}' {where_add}
-        {query_add}
+        SELECT md.*, mf.num_files, mf.num_reviewed_files
+        FROM (
+            SELECT md.*
+            FROM cognition.{Tablenames.MARKDOWN_DATASET.value} md
+            WHERE md.organization_id = '{org_id}' {where_add}
+            {query_add}
+        ) md
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) as num_files, COUNT(CASE WHEN is_reviewed = TRUE THEN 1 END) AS num_reviewed_files
+            FROM cognition.{Tablenames.MARKDOWN_FILE.value} f
+            WHERE f.dataset_id = md.id
+        ) mf ON TRUE
+        {order_by_add}
     """
 
 
@@ -82,13 +96,66 @@ def get_all_paginated_for_category_origin(
         OFFSET {(page - 1) * limit}
     """
     enriched_query = __get_enriched_query(
-        org_id=org_id, category_origin=category_origin, query_add=query_add
+        org_id=org_id,
+        category_origin=category_origin,
+        query_add=query_add,
+        order_by="md.created_at",
     )
     query_results = general.execute_all(enriched_query)
 
     return total_count, num_pages, query_results
 
 
+def get_all_keyset_for_category_origin(
+    org_id: str,
+    limit: int,
+    category_origin: Optional[str] = None,
+    cursor: Optional[str] = None,
+    with_count: bool = True,
+) -> Tuple[Optional[int], Optional[str], List[Any]]:
+    # keyset pagination over (created_at, id), returns approximate count, next cursor & items
+    org_id = prevent_sql_injection(org_id, isinstance(org_id, str))
+    category_origin = prevent_sql_injection(
+        category_origin, isinstance(category_origin, str)
+    )
+    limit = prevent_sql_injection(limit, isinstance(limit, int))
+    cursor_add = ""
+    if cursor:
+        # decoded values are validated so they can be used directly
+        created_at, id = decode_keyset_cursor(cursor)
+        cursor_add = "AND " + get_keyset_filter_sql(
+            "md.created_at", "md.id", created_at, id
+        )
+
+    order_by = get_keyset_order_by_sql("md.created_at", "md.id")
+    query_add = f"""
+        {cursor_add}
+        ORDER BY {order_by}
+        LIMIT {int(limit) + 1}
+    """
+    enriched_query = __get_enriched_query(
+        org_id=org_id,
+        category_origin=category_origin,
+        query_add=query_add,
+        order_by=order_by,
+    )
+    items = general.execute_all(enriched_query)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_keyset_cursor(items[-1].created_at, items[-1].id)
+
+    approximate_count = None
+    if with_count:
+        where_add = ""
+        if category_origin:
+            where_add = f" AND md.category_origin = '{category_origin}'"
+        approximate_count = general.estimate_count(
+            f"""SELECT 1 FROM cognition.{Tablenames.MARKDOWN_DATASET.value} md WHERE md.organization_id = '{org_id}' {where_add}"""
+        )
+    return approximate_count, next_cursor, items
+
+
 def get_dataset_count_dict(org_id: str) -> Dict[str, int]:
     # no need to access with get since all possible values are known (or at least should be)
     org_id = prevent_sql_injection(org_id, isinstance(org_id, str))
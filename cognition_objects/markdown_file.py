@@ -1,11 +1,18 @@
 from typing import List, Optional, Tuple, Dict, Any
 from datetime import datetime
+from sqlalchemy.orm import defer
 
 from .. import enums
 from ..business_objects import general
 from ..session import session
 from ..models import CognitionMarkdownFile
-from ..util import prevent_sql_injection
+from ..util import (
+    prevent_sql_injection,
+    encode_keyset_cursor,
+    get_keyset_filter_sql,
+    get_keyset_order_by_sql,
+    decode_keyset_cursor,
+)
 
 
 def get(org_id: str, md_file_id: str) -> CognitionMarkdownFile:
@@ -31,11 +38,15 @@ def get_all_for_dataset_id(
     dataset_id: str,
     only_finished: bool,
     only_reviewed: bool,
+    with_content: bool = True,
 ) -> List[CognitionMarkdownFile]:
+    # with_content=False leaves out the (large) content, it's loaded per file on access
     query = session.query(CognitionMarkdownFile).filter(
         CognitionMarkdownFile.organization_id == org_id,
         CognitionMarkdownFile.dataset_id == dataset_id,
     )
+    if not with_content:
+        query = query.options(defer(CognitionMarkdownFile.content))
 
     if only_finished:
         query = query.filter(
@@ -118,6 +129,50 @@ def get_all_paginated_for_dataset(
     return total_count, num_pages, query_results
 
 
+def get_all_keyset_for_dataset(
+    org_id: str,
+    dataset_id: str,
+    limit: int,
+    exclude_content: bool,
+    cursor: Optional[str] = None,
+    with_count: bool = True,
+) -> Tuple[Optional[int], Optional[str], List[Any]]:
+    # keyset pagination over (created_at, id) newest first, returns approximate count, next cursor & items
+    org_id = prevent_sql_injection(org_id, isinstance(org_id, str))
+    dataset_id = prevent_sql_injection(dataset_id, isinstance(dataset_id, str))
+    limit = prevent_sql_injection(limit, isinstance(limit, int))
+    cursor_add = ""
+    if cursor:
+        # decoded values are validated so they can be used directly
+        created_at, id = decode_keyset_cursor(cursor)
+        cursor_add = "AND " + get_keyset_filter_sql(
+            "mf.created_at", "mf.id", created_at, id, False
+        )
+    query_add = f"""
+    {cursor_add}
+    ORDER BY {get_keyset_order_by_sql("mf.created_at", "mf.id", False)}
+    LIMIT {int(limit) + 1}
+    """
+    enriched_query = __get_enriched_query(
+        org_id=org_id,
+        dataset_id=dataset_id,
+        query_add=query_add,
+        exclude_content=exclude_content,
+    )
+    items = general.execute_all(enriched_query)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_keyset_cursor(items[-1].created_at, items[-1].id)
+
+    approximate_count = None
+    if with_count:
+        approximate_count = general.estimate_count(
+            f"""SELECT 1 FROM cognition.markdown_file mf WHERE mf.organization_id = '{org_id}' AND mf.dataset_id = '{dataset_id}'"""
+        )
+    return approximate_count, next_cursor, items
+
+
 def can_access_file(org_id: str, file_id: str) -> bool:
     # since org specific files dont have a project_id but we still need to check the access rights
     # we collect from the requested file and match with org id from middleware/internal routing
@@ -1,23 +1,42 @@
 from typing import Any, Dict, List, Optional, Union, Tuple
+from collections import OrderedDict
 from datetime import datetime
+from threading import Lock
+import copy
+import math
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import defer
 from ..business_objects import general
 from ..session import session
 from ..models import CognitionMessage
 from ..util import prevent_sql_injection
+from . import message_rollup, message_pipeline_summary
+
+# rough estimate used for the history token budget (no tokenizer dependency here)
+CHARS_PER_TOKEN = 4
+HISTORY_CACHE_MAX_CONVERSATIONS = 1000
+# the cache is per process, writes of other workers are picked up after x seconds
+HISTORY_CACHE_TTL_SECONDS = 30
+
+__HISTORY_CACHE_LOCK = Lock()
+# (project_id, conversation_id) -> (List[Dict] (oldest first), cached_at), least recently used first
+__history_cache = OrderedDict()
+# incremented on every invalidation so loads that overlap a write aren't cached
+__history_cache_generation = 0
 
 
 def get_all_by_conversation_id(
-    project_id: str, conversation_id: str
+    project_id: str, conversation_id: str, with_facts: bool = True
 ) -> List[CognitionMessage]:
-    return (
-        session.query(CognitionMessage)
-        .filter(
-            CognitionMessage.project_id == project_id,
-            CognitionMessage.conversation_id == conversation_id,
-        )
-        .order_by(CognitionMessage.created_at.asc())
-        .all()
+    # with_facts=False leaves out the (large) facts, they are loaded per message on access
+    query = session.query(CognitionMessage).filter(
+        CognitionMessage.project_id == project_id,
+        CognitionMessage.conversation_id == conversation_id,
     )
+    if not with_facts:
+        query = query.options(defer(CognitionMessage.facts))
+    return query.order_by(CognitionMessage.created_at.asc()).all()
 
 
 def get_last_by_conversation_id(
@@ -49,6 +68,114 @@ def get_last_n_by_conversation_id(
     )
 
 
+def get_history_by_conversation_id(
+    project_id: str,
+    conversation_id: str,
+    token_budget: Optional[int] = None,
+    max_messages: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    # lightweight history for llm context (id, question, answer, created_at), oldest first
+    # only the newest messages fitting into max_messages/token_budget are returned
+    history = __get_cached_history(str(project_id), str(conversation_id))
+    if max_messages is not None:
+        history = history[-max_messages:] if max_messages > 0 else []
+    if token_budget is None:
+        return copy.deepcopy(history)
+
+    used_tokens = 0
+    start_idx = len(history)
+    for idx in range(len(history) - 1, -1, -1):
+        used_tokens += history[idx]["tokens"]
+        if used_tokens > token_budget:
+            break
+        start_idx = idx
+    return copy.deepcopy(history[start_idx:])
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def invalidate_history_cache(
+    project_id: str, conversation_id: Optional[str] = None
+) -> None:
+    # conversation_id None => all conversations of the project
+    # dropped now (reads in the same transaction) & again once the transaction ends
+    # since other sessions could have cached the old state until then
+    key = (
+        str(project_id),
+        str(conversation_id) if conversation_id is not None else None,
+    )
+    session.info.setdefault("history_cache_invalidations", set()).add(key)
+    __drop_cached_history([key])
+
+
+def __drop_cached_history(keys: List[Tuple[str, Optional[str]]]) -> None:
+    global __history_cache_generation
+    with __HISTORY_CACHE_LOCK:
+        __history_cache_generation += 1
+        for project_id, conversation_id in keys:
+            if conversation_id is not None:
+                __history_cache.pop((project_id, conversation_id), None)
+                continue
+            for key in [k for k in __history_cache if k[0] == project_id]:
+                del __history_cache[key]
+
+
+@event.listens_for(session, "after_commit")
+@event.listens_for(session, "after_rollback")
+def __drop_cached_history_of_transaction(session_instance) -> None:
+    keys = session_instance.info.pop("history_cache_invalidations", None)
+    if keys:
+        __drop_cached_history(list(keys))
+
+
+def __get_cached_history(project_id: str, conversation_id: str) -> List[Dict[str, Any]]:
+    key = (project_id, conversation_id)
+    with __HISTORY_CACHE_LOCK:
+        cached = __history_cache.get(key)
+        if cached and time.time() - cached[1] < HISTORY_CACHE_TTL_SECONDS:
+            __history_cache.move_to_end(key)
+            return cached[0]
+        generation = __history_cache_generation
+
+    rows = (
+        session.query(
+            CognitionMessage.id,
+            CognitionMessage.question,
+            CognitionMessage.answer,
+            CognitionMessage.created_at,
+        )
+        .filter(
+            CognitionMessage.project_id == project_id,
+            CognitionMessage.conversation_id == conversation_id,
+        )
+        .order_by(CognitionMessage.created_at.asc())
+        .all()
+    )
+    history = [
+        {
+            "id": str(row.id),
+            "question": row.question,
+            "answer": row.answer,
+            "created_at": row.created_at,
+            "tokens": estimate_tokens(row.question) + estimate_tokens(row.answer),
+        }
+        for row in rows
+    ]
+    with __HISTORY_CACHE_LOCK:
+        if generation != __history_cache_generation:
+            # invalidated while loading, the result might already be outdated
+            return history
+        __history_cache[key] = (history, time.time())
+        __history_cache.move_to_end(key)
+        while len(__history_cache) > HISTORY_CACHE_MAX_CONVERSATIONS:
+            __history_cache.popitem(last=False)
+    return history
+
+
 def get(project_id: str, message_id: str) -> CognitionMessage:
     return (
         session.query(CognitionMessage)
@@ -97,7 +224,7 @@ def get_message_feedback_overview(
 
     query = f"""
     SELECT
-        COALESCE(feedback_value, CASE WHEN y.has_error THEN 'ERROR_IN_NEWEST_LOG' ELSE NULL END) feedback_value_or_error, 
+        COALESCE(feedback_value, CASE WHEN mps.error_count > 0 THEN 'ERROR_IN_NEWEST_LOG' ELSE NULL END) feedback_value_or_error, 
         feedback_message, 
         CASE WHEN feedback_value='negative' THEN feedback_category ELSE NULL END feedback_category,
         REGEXP_REPLACE(question, \'[\\000-\\010]|[\\013-\\014]|[\\016-\\037]\',\'\',\'\') question,
@@ -108,8 +235,8 @@ def get_message_feedback_overview(
             'conversation_id',mo.conversation_id,
             'user_id',mo.created_by,
             'message_created', mo.created_at,
-            'newest_log_has_error', COALESCE(y.has_error,FALSE),
-            'has_error_log_content', ARRAY_TO_STRING( y.content,'\n')
+            'newest_log_has_error', COALESCE(mps.error_count > 0,FALSE),
+            'has_error_log_content', ARRAY_TO_STRING( mps.last_error_content,'\n')
         )::TEXT message_data
     FROM cognition.message mo
     INNER JOIN cognition.conversation C
@@ -129,15 +256,7 @@ def get_message_feedback_overview(
         GROUP BY project_id, conversation_id
     ) x
         ON c.project_id = x.project_id AND c.id = x.conversation_id
-    LEFT JOIN LATERAL(
-        SELECT pl.has_error, pl.content
-        FROM cognition.pipeline_logs pl
-        WHERE pl.project_id = mo.project_id
-            AND pl.message_id = mo.id
-            AND pl.has_error
-        ORDER BY pl.created_at DESC
-        LIMIT 1
-    )y ON TRUE
+    {message_pipeline_summary.get_join_sql("mo", "mps")}
     WHERE mo.project_id = '{project_id}'
     {where_add}
     ORDER BY mo.created_at DESC
@@ -164,7 +283,12 @@ def create(
         facts=[],
     )
 
-    general.add(message, with_commit)
+    general.add(message, with_commit=False)
+    __change_conversation_message_count(project_id, conversation_id, 1)
+    invalidate_history_cache(project_id, conversation_id)
+    message_rollup.apply_delta(
+        project_id, created_at, message_count=1, with_commit=with_commit
+    )
 
     return message
 
@@ -181,6 +305,7 @@ def update(
     with_commit: bool = True,
 ) -> CognitionMessage:
     message = get(project_id, message_id)
+    previous_feedback = (message.feedback_value, message.feedback_category)
     if answer is not None:
         message.answer = answer
     if facts is not None:
@@ -194,42 +319,68 @@ def update(
     if feedback_message is not None:
         message.feedback_message = feedback_message
 
+    # response times are maintained by the pipeline summary
+    message_rollup.apply_feedback_change(
+        project_id,
+        message.created_at,
+        *previous_feedback,
+        message.feedback_value,
+        message.feedback_category,
+    )
+    if answer is not None:
+        invalidate_history_cache(project_id, message.conversation_id)
     general.flush_or_commit(with_commit)
 
     return message
 
 
 def delete(project_id: str, message_id: str, with_commit: bool = True) -> None:
+    message = get(project_id, message_id)
+    if not message:
+        return
+    conversation_id = message.conversation_id
+    message_rollup.remove_messages(project_id, message_ids=[message_id])
     session.query(CognitionMessage).filter(
         CognitionMessage.project_id == project_id,
         CognitionMessage.id == message_id,
     ).delete()
+    __change_conversation_message_count(project_id, conversation_id, -1)
+    invalidate_history_cache(project_id, conversation_id)
     general.flush_or_commit(with_commit)
 
 
+def __change_conversation_message_count(
+    project_id: str, conversation_id: str, change: int
+) -> None:
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    conversation_id = prevent_sql_injection(
+        conversation_id, isinstance(conversation_id, str)
+    )
+    change = prevent_sql_injection(change, isinstance(change, int))
+    query = f"""
+    UPDATE cognition.conversation
+    SET message_count = GREATEST(COALESCE(message_count, 0) + {change}, 0)
+    WHERE project_id = '{project_id}' AND id = '{conversation_id}'
+    """
+    general.execute(query)
+
+
 def get_response_time_messages(project_id: str) -> List[Dict[str, Any]]:
+    # answered from the hourly rollups (see message_rollup), rounded in ,5 steps
     project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
 
     query = f"""
-    -- round in ,5 steps
-    SELECT ROUND(SUM(x) * 2) /2  AS time_seconds, COUNT(*)
-    FROM (
-        SELECT m.id, SUM(pl.time_elapsed)
-        FROM cognition.message m
-        INNER JOIN cognition.conversation c 
-            ON c.id = m.conversation_id AND c.project_id = m.project_id
-        INNER JOIN cognition.pipeline_logs pl 
-            ON m.id = pl.message_id 
-        WHERE m.project_id = '{project_id}'
-        GROUP BY m.id
-    ) x
-    GROUP BY time_seconds
-    ORDER BY time_seconds
+    SELECT h.key::NUMERIC AS time_seconds, SUM(h.value::INT) count
+    FROM cognition.message_rollup r, json_each_text(r.response_time_histogram) h
+    WHERE r.project_id = '{project_id}'
+    GROUP BY 1
+    ORDER BY 1
     """
     return general.execute_all(query)
 
 
 def get_conversations_messages_count(project_id: str) -> List[Dict[str, Any]]:
+    # based on the maintained conversation.message_count instead of counting messages
     project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
     query = f"""
     SELECT 
@@ -237,14 +388,10 @@ def get_conversations_messages_count(project_id: str) -> List[Dict[str, Any]]:
         num_conversations,
         num_conversations / conv_count.c * 100 percentage
     FROM (
-        SELECT COUNT(*) num_conversations, num_messages
-        FROM (
-            SELECT conversation_id, COUNT(*) num_messages
-            FROM cognition.message as m
-            WHERE m.project_id = '{project_id}'
-            GROUP BY conversation_id
-        ) x
-        GROUP BY num_messages 
+        SELECT COUNT(*) num_conversations, message_count num_messages
+        FROM cognition.conversation c
+        WHERE c.project_id = '{project_id}' AND c.message_count > 0
+        GROUP BY message_count
     )x,
     (SELECT COUNT(*)::FLOAT c FROM cognition.conversation WHERE project_id = '{project_id}') conv_count
     ORDER BY 1
@@ -255,35 +402,22 @@ def get_conversations_messages_count(project_id: str) -> List[Dict[str, Any]]:
 def get_feedback_distribution(
     project_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None
 ) -> List[Tuple[str, Any]]:
-    where_add = ""
-
-    if start_date and end_date:
-        start_date = prevent_sql_injection(start_date, isinstance(start_date, str))
-        end_date = prevent_sql_injection(end_date, isinstance(end_date, str))
-        where_add += f"AND created_at BETWEEN '{start_date}' AND '{end_date}'"
-    elif start_date:
-        start_date = prevent_sql_injection(start_date, isinstance(start_date, str))
-        where_add += f"AND created_at >= '{start_date}'"
-    elif end_date:
-        end_date = prevent_sql_injection(end_date, isinstance(end_date, str))
-        where_add += f"AND created_at <= '{end_date}'"
+    # answered from the hourly rollups (see message_rollup)
+    where_add = message_rollup.get_bucket_where_add(start_date, end_date)
 
     project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
     query = f"""
+    WITH feedbacks AS (
+        SELECT f.key feedback_value, SUM(f.value::INT) feedbacks
+        FROM cognition.message_rollup r, json_each_text(r.feedback_counts) f
+        WHERE r.project_id = '{project_id}' {where_add}
+        GROUP BY 1
+    )
     SELECT
         feedback_value,
         feedbacks,
-        feedbacks / percentage_count.c * 100 percentage
-        FROM (
-            SELECT COUNT(*) feedbacks, feedback_value
-            FROM (
-                SELECT feedback_value
-                FROM cognition.message
-                WHERE project_id = '{project_id}' AND feedback_value IS NOT NULL {where_add}
-    )x
-    GROUP BY feedback_value
-    )x,
-    (SELECT COUNT(*)::FLOAT c FROM cognition.message WHERE project_id = '{project_id}' AND feedback_value IS NOT NULL {where_add} ) percentage_count
+        feedbacks / SUM(feedbacks) OVER () * 100 percentage
+    FROM feedbacks
     """
     return general.execute_all(query)
 
@@ -327,16 +461,16 @@ def get_feedback_line_chart_data(
             raise ValueError("Invalid interval format")
         group_size = ALLOWED_INTERVALS.get(group_size, group_size)
 
+    # answered from the hourly rollups (see message_rollup)
     query = f"""
     WITH base_select AS (
         SELECT
-            date_trunc('{group_size}', created_at) time_group,
-            feedback_value,
-            COUNT(*) c
-        FROM cognition.message M
-        WHERE project_id = '{project_id}'
-        AND created_at >= CURRENT_TIMESTAMP - INTERVAL '{interval}'
-        AND feedback_value IS NOT NULL
+            date_trunc('{group_size}', r.bucket_start) time_group,
+            f.key feedback_value,
+            SUM(f.value::INT) c
+        FROM cognition.message_rollup r, json_each_text(r.feedback_counts) f
+        WHERE r.project_id = '{project_id}'
+        AND r.bucket_start >= date_trunc('hour', CURRENT_TIMESTAMP - INTERVAL '{interval}')
         GROUP BY 1,2
     )
     SELECT jsonb_object_agg(time_group, vals)
@@ -0,0 +1,251 @@
+from typing import List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+
+from ..business_objects import general
+from ..session import session
+from ..models import CognitionMessagePipelineSummary, CognitionPipelineLogs
+from ..util import prevent_sql_injection
+from . import message_rollup
+
+
+def get(project_id: str, message_id: str) -> CognitionMessagePipelineSummary:
+    return (
+        session.query(CognitionMessagePipelineSummary)
+        .filter(
+            CognitionMessagePipelineSummary.project_id == project_id,
+            CognitionMessagePipelineSummary.message_id == message_id,
+        )
+        .first()
+    )
+
+
+def add_log(
+    project_id: str,
+    message_id: str,
+    has_error: bool,
+    time_elapsed: Optional[float],
+    content: Optional[List[str]],
+    created_at: Optional[datetime] = None,
+    with_commit: bool = False,
+) -> None:
+    has_error = bool(has_error)
+    __upsert(
+        project_id,
+        message_id,
+        created_at,
+        has_error,
+        1 if has_error else 0,
+        content if has_error else None,
+        time_elapsed or 0,
+        1,
+    )
+    general.flush_or_commit(with_commit)
+
+
+def add_logs(
+    project_id: str,
+    message_id: str,
+    logs: List[CognitionPipelineLogs],
+    with_commit: bool = False,
+) -> None:
+    # aggregated version of add_log for multiple logs of the same message (e.g. buffered writes)
+    if not logs:
+        return
+    logs = sorted(logs, key=lambda x: x.created_at)
+    error_logs = [log for log in logs if log.has_error]
+    __upsert(
+        project_id,
+        message_id,
+        logs[-1].created_at,
+        bool(logs[-1].has_error),
+        len(error_logs),
+        error_logs[-1].content if error_logs else None,
+        sum(log.time_elapsed or 0 for log in logs),
+        len(logs),
+    )
+    general.flush_or_commit(with_commit)
+
+
+def __upsert(
+    project_id: str,
+    message_id: str,
+    last_log_at: Optional[datetime],
+    has_error: bool,
+    error_count: int,
+    last_error_content: Optional[List[str]],
+    time_elapsed: float,
+    step_count: int,
+) -> None:
+    # logs created out of order don't overwrite newer "latest" values
+    tbl = CognitionMessagePipelineSummary.__table__
+    # the row is locked first so the previous response time (=> histogram bin) is the stored value
+    previous_time_elapsed = __lock_summary(project_id, message_id)
+    if previous_time_elapsed is None:
+        # placeholder row (committed together with the values below) to lock, a concurrent first log
+        # of the same message waits here & then sees the committed row
+        created = general.execute(
+            insert(tbl)
+            .values(
+                message_id=message_id,
+                project_id=project_id,
+                error_count=0,
+                time_elapsed=0,
+                step_count=0,
+            )
+            .on_conflict_do_nothing(index_elements=[tbl.c.message_id])
+            .returning(tbl.c.message_id)
+        ).first()
+        if not created:
+            previous_time_elapsed = __lock_summary(project_id, message_id)
+    query = insert(tbl).values(
+        message_id=message_id,
+        project_id=project_id,
+        last_log_at=last_log_at if last_log_at is not None else func.now(),
+        has_error=has_error,
+        error_count=error_count,
+        last_error_content=last_error_content,
+        time_elapsed=time_elapsed,
+        step_count=step_count,
+    )
+    is_newer = query.excluded.last_log_at >= func.coalesce(
+        tbl.c.last_log_at, query.excluded.last_log_at
+    )
+    query = query.on_conflict_do_update(
+        index_elements=[tbl.c.message_id],
+        set_={
+            "last_log_at": func.greatest(tbl.c.last_log_at, query.excluded.last_log_at),
+            "has_error": case(
+                (is_newer, query.excluded.has_error), else_=tbl.c.has_error
+            ),
+            "error_count": tbl.c.error_count + query.excluded.error_count,
+            "last_error_content": case(
+                (
+                    (query.excluded.error_count > 0) & is_newer,
+                    query.excluded.last_error_content,
+                ),
+                else_=tbl.c.last_error_content,
+            ),
+            "time_elapsed": tbl.c.time_elapsed + query.excluded.time_elapsed,
+            "step_count": tbl.c.step_count + query.excluded.step_count,
+        },
+    ).returning(tbl.c.time_elapsed)
+    row = general.execute(query).first()
+    if row:
+        # the response time histogram follows the summary
+        message_rollup.apply_response_time_change(
+            project_id,
+            str(message_id),
+            previous_time_elapsed[0] if previous_time_elapsed else None,
+            row.time_elapsed,
+        )
+
+
+def __lock_summary(project_id: str, message_id: str) -> Optional[Tuple[float]]:
+    # (time_elapsed,) of the locked summary row, None if there is none yet
+    return (
+        session.query(CognitionMessagePipelineSummary.time_elapsed)
+        .filter(
+            CognitionMessagePipelineSummary.project_id == project_id,
+            CognitionMessagePipelineSummary.message_id == message_id,
+        )
+        .with_for_update()
+        .first()
+    )
+
+
+def get_join_sql(
+    message_alias: str = "m", alias: str = "mps", join_type: str = "LEFT"
+) -> str:
+    # summary columns (has_error, error_count, time_elapsed, step_count) for a message query
+    # messages logged before the summary existed (until rebuild ran) fall back to the pipeline logs
+    # INNER => only messages with pipeline logs
+    return f"""
+    {join_type} JOIN LATERAL (
+        SELECT s.has_error, s.error_count, s.time_elapsed, s.step_count
+        FROM cognition.message_pipeline_summary s
+        WHERE s.project_id = {message_alias}.project_id AND s.message_id = {message_alias}.id
+        UNION ALL
+        SELECT
+            (array_agg(pl.has_error ORDER BY pl.created_at DESC))[1],
+            COUNT(*) FILTER (WHERE pl.has_error),
+            COALESCE(SUM(pl.time_elapsed), 0),
+            COUNT(*)
+        FROM cognition.pipeline_logs pl
+        WHERE pl.project_id = {message_alias}.project_id AND pl.message_id = {message_alias}.id
+            AND NOT EXISTS (
+                SELECT 1
+                FROM cognition.message_pipeline_summary s
+                WHERE s.project_id = {message_alias}.project_id AND s.message_id = {message_alias}.id
+            )
+        HAVING COUNT(*) > 0
+        LIMIT 1
+    ) {alias}
+        ON TRUE"""
+
+
+def rebuild(
+    project_id: Optional[str] = None,
+    message_id: Optional[str] = None,
+    with_commit: bool = True,
+) -> None:
+    # recalculates the summary from the pipeline logs, e.g. for existing data or after log deletion
+    # for a single message the response time histogram is moved along, otherwise see message_rollup.rebuild
+    previous_time_elapsed = None
+    if project_id and message_id:
+        previous_time_elapsed = __get_time_elapsed(project_id, message_id)
+    where_add = ""
+    if project_id:
+        project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+        where_add += f" AND pl.project_id = '{project_id}'"
+    if message_id:
+        message_id = prevent_sql_injection(message_id, isinstance(message_id, str))
+        where_add += f" AND pl.message_id = '{message_id}'"
+
+    query = f"""
+    DELETE FROM cognition.message_pipeline_summary pl
+    WHERE TRUE {where_add};
+
+    INSERT INTO cognition.message_pipeline_summary (
+        message_id, project_id, last_log_at, has_error, error_count, last_error_content, time_elapsed, step_count)
+    SELECT
+        pl.message_id,
+        pl.project_id,
+        MAX(pl.created_at),
+        (array_agg(pl.has_error ORDER BY pl.created_at DESC))[1],
+        COUNT(*) FILTER (WHERE pl.has_error),
+        (
+            SELECT ple.content
+            FROM cognition.pipeline_logs ple
+            WHERE ple.project_id = pl.project_id AND ple.message_id = pl.message_id AND ple.has_error
+            ORDER BY ple.created_at DESC
+            LIMIT 1
+        ),
+        COALESCE(SUM(pl.time_elapsed), 0),
+        COUNT(*)
+    FROM cognition.pipeline_logs pl
+    WHERE pl.message_id IS NOT NULL {where_add}
+    GROUP BY pl.project_id, pl.message_id
+    """
+    general.execute(query)
+    if project_id and message_id:
+        message_rollup.apply_response_time_change(
+            project_id,
+            message_id,
+            previous_time_elapsed,
+            __get_time_elapsed(project_id, message_id),
+        )
+    general.flush_or_commit(with_commit)
+
+
+def __get_time_elapsed(project_id: str, message_id: str) -> Optional[float]:
+    summary = (
+        session.query(CognitionMessagePipelineSummary.time_elapsed)
+        .filter(
+            CognitionMessagePipelineSummary.project_id == project_id,
+            CognitionMessagePipelineSummary.message_id == message_id,
+        )
+        .first()
+    )
+    return summary.time_elapsed if summary else None
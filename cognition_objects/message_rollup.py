@@ -0,0 +1,361 @@
+from typing import Dict, List, Optional
+from datetime import datetime
+
+from ..business_objects import general
+from ..util import prevent_sql_injection
+
+# response times are stored in fixed bins so hourly buckets can be merged by summing
+RESPONSE_TIME_BIN_SECONDS = 0.5
+
+
+def apply_delta(
+    project_id: str,
+    bucket_time: Optional[datetime] = None,
+    message_count: int = 0,
+    feedback_counts: Optional[Dict[str, int]] = None,
+    feedback_category_counts: Optional[Dict[str, int]] = None,
+    with_commit: bool = False,
+) -> None:
+    # increments the hourly bucket containing bucket_time (None => current hour) in place
+    # so concurrent writes don't overwrite each other & the cost doesn't depend on the bucket size
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    message_count = prevent_sql_injection(message_count, isinstance(message_count, int))
+    if bucket_time is None:
+        bucket_start = "date_trunc('hour', now()::TIMESTAMP)"
+    else:
+        bucket_time = prevent_sql_injection(
+            bucket_time, isinstance(bucket_time, datetime)
+        )
+        bucket_start = f"date_trunc('hour', '{bucket_time.isoformat()}'::TIMESTAMP)"
+    feedback_delta = __get_json_delta_sql(feedback_counts)
+    category_delta = __get_json_delta_sql(feedback_category_counts)
+
+    query = f"""
+    INSERT INTO cognition.message_rollup (
+        project_id, bucket_start, message_count, feedback_counts, feedback_category_counts, response_time_histogram, updated_at)
+    VALUES (
+        '{project_id}',
+        {bucket_start},
+        GREATEST({message_count}, 0),
+        {__get_json_merge_sql("'{}'::JSON", feedback_delta)},
+        {__get_json_merge_sql("'{}'::JSON", category_delta)},
+        '{{}}',
+        now()
+    )
+    ON CONFLICT (project_id, bucket_start) DO UPDATE
+    SET
+        message_count = GREATEST(message_rollup.message_count + {message_count}, 0),
+        feedback_counts = {__get_json_merge_sql("message_rollup.feedback_counts", feedback_delta)},
+        feedback_category_counts = {__get_json_merge_sql("message_rollup.feedback_category_counts", category_delta)},
+        updated_at = now()
+    """
+    general.execute(query)
+    general.flush_or_commit(with_commit)
+
+
+def apply_feedback_change(
+    project_id: str,
+    bucket_time: Optional[datetime],
+    previous_feedback_value: Optional[str],
+    previous_feedback_category: Optional[str],
+    feedback_value: Optional[str],
+    feedback_category: Optional[str],
+    with_commit: bool = False,
+) -> None:
+    # moves the message from its previous feedback counts to the new ones
+    feedback_counts = {}
+    feedback_category_counts = {}
+    for value, category, change in [
+        (previous_feedback_value, previous_feedback_category, -1),
+        (feedback_value, feedback_category, 1),
+    ]:
+        if value is not None:
+            feedback_counts[value] = feedback_counts.get(value, 0) + change
+        if value == "negative" and category is not None:
+            feedback_category_counts[category] = (
+                feedback_category_counts.get(category, 0) + change
+            )
+    feedback_counts = {k: v for k, v in feedback_counts.items() if v != 0}
+    feedback_category_counts = {
+        k: v for k, v in feedback_category_counts.items() if v != 0
+    }
+    if not feedback_counts and not feedback_category_counts:
+        return
+    apply_delta(
+        project_id,
+        bucket_time,
+        feedback_counts=feedback_counts,
+        feedback_category_counts=feedback_category_counts,
+        with_commit=with_commit,
+    )
+
+
+def apply_response_time_change(
+    project_id: str,
+    message_id: str,
+    previous_time_elapsed: Optional[float],
+    time_elapsed: Optional[float],
+    with_commit: bool = False,
+) -> None:
+    # called from the pipeline summary writes since the response time grows with every log
+    # (the message itself is usually written before its logs)
+    if previous_time_elapsed == time_elapsed:
+        return
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    message_id = prevent_sql_injection(message_id, isinstance(message_id, str))
+    delta_parts = []
+    for time_value, change in [(previous_time_elapsed, -1), (time_elapsed, 1)]:
+        if time_value is None:
+            continue
+        time_value = prevent_sql_injection(
+            float(time_value), isinstance(time_value, (int, float))
+        )
+        # duplicate keys are summed up by the merge
+        delta_parts.append(f"{__get_bin_sql(f'{time_value}::FLOAT')}::TEXT, {change}")
+    histogram_delta = f"json_build_object({', '.join(delta_parts)})"
+
+    query = f"""
+    INSERT INTO cognition.message_rollup (
+        project_id, bucket_start, message_count, feedback_counts, feedback_category_counts, response_time_histogram, updated_at)
+    SELECT
+        m.project_id,
+        date_trunc('hour', m.created_at),
+        0,
+        '{{}}',
+        '{{}}',
+        {__get_json_merge_sql("'{}'::JSON", histogram_delta)},
+        now()
+    FROM cognition.message m
+    WHERE m.project_id = '{project_id}' AND m.id = '{message_id}' AND m.created_at IS NOT NULL
+    ON CONFLICT (project_id, bucket_start) DO UPDATE
+    SET
+        response_time_histogram = {__get_json_merge_sql("message_rollup.response_time_histogram", histogram_delta)},
+        updated_at = now()
+    """
+    general.execute(query)
+    general.flush_or_commit(with_commit)
+
+
+def remove_messages(
+    project_id: str,
+    message_ids: Optional[List[str]] = None,
+    conversation_ids: Optional[List[str]] = None,
+) -> None:
+    # subtracts the messages (incl. response times) from their buckets, needs to run before the delete
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    where_add = f" AND m.project_id = '{project_id}'"
+    if message_ids is not None:
+        if not message_ids:
+            return
+        message_ids = prevent_sql_injection([str(x) for x in message_ids], True)
+        message_ids_sql = "','".join(message_ids)
+        where_add += f" AND m.id IN ('{message_ids_sql}')"
+    if conversation_ids is not None:
+        if not conversation_ids:
+            return
+        conversation_ids = prevent_sql_injection(
+            [str(x) for x in conversation_ids], True
+        )
+        conversation_ids_sql = "','".join(conversation_ids)
+        where_add += f" AND m.conversation_id IN ('{conversation_ids_sql}')"
+    general.execute(__get_upsert_query(where_add, subtract=True))
+
+
+def rebuild(project_id: Optional[str] = None, with_commit: bool = True) -> None:
+    # recalculates all buckets & conversation message counts, e.g. for existing data
+    where_add = ""
+    rollup_where_add = ""
+    conversation_where_add = ""
+    if project_id:
+        project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+        where_add = f" AND m.project_id = '{project_id}'"
+        rollup_where_add = f" AND r.project_id = '{project_id}'"
+        conversation_where_add = f" AND c.project_id = '{project_id}'"
+
+    query = f"""
+    DELETE FROM cognition.message_rollup r
+    WHERE TRUE {rollup_where_add};
+
+    {__get_upsert_query(where_add)};
+
+    UPDATE cognition.conversation c
+    SET message_count = (
+        SELECT COUNT(*)
+        FROM cognition.message m
+        WHERE m.project_id = c.project_id AND m.conversation_id = c.id
+    )
+    WHERE TRUE {conversation_where_add}
+    """
+    general.execute(query)
+    general.flush_or_commit(with_commit)
+
+
+def get_response_time_percentiles(
+    project_id: str,
+    percentiles: Optional[List[float]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> Dict[float, Optional[float]]:
+    # percentiles from the merged histograms, precision is RESPONSE_TIME_BIN_SECONDS
+    if percentiles is None:
+        percentiles = [50, 90, 99]
+    histogram = get_response_time_histogram(project_id, start_date, end_date)
+    total = sum(count for _, count in histogram)
+    result = {}
+    for percentile in percentiles:
+        if total == 0:
+            result[percentile] = None
+            continue
+        threshold = total * percentile / 100
+        running = 0
+        for time_seconds, count in histogram:
+            running += count
+            if running >= threshold:
+                result[percentile] = time_seconds
+                break
+    return result
+
+
+def get_response_time_histogram(
+    project_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> List[List[float]]:
+    # [[time_seconds, count], ...] sorted by time_seconds
+    project_id = prevent_sql_injection(project_id, isinstance(project_id, str))
+    where_add = get_bucket_where_add(start_date, end_date)
+    query = f"""
+    SELECT h.key::NUMERIC time_seconds, SUM(h.value::INT) count
+    FROM cognition.message_rollup r, json_each_text(r.response_time_histogram) h
+    WHERE r.project_id = '{project_id}' {where_add}
+    GROUP BY 1
+    ORDER BY 1
+    """
+    return [
+        [float(time_seconds), int(count)]
+        for time_seconds, count in general.execute_all(query)
+    ]
+
+
+def get_bucket_where_add(
+    start_date: Optional[str] = None, end_date: Optional[str] = None
+) -> str:
+    # buckets are hourly, so the dates are effectively rounded down to the hour
+    where_add = ""
+    if start_date:
+        start_date = prevent_sql_injection(start_date, isinstance(start_date, str))
+        where_add += (
+            f" AND r.bucket_start >= date_trunc('hour', '{start_date}'::TIMESTAMP)"
+        )
+    if end_date:
+        end_date = prevent_sql_injection(end_date, isinstance(end_date, str))
+        where_add += f" AND r.bucket_start <= '{end_date}'::TIMESTAMP"
+    return where_add
+
+
+def __get_upsert_query(where_add: str, subtract: bool = False) -> str:
+    # subtract => the aggregated messages are removed from the existing buckets instead of replacing them
+    sign = -1 if subtract else 1
+    bucket_where_add = ""
+    if subtract:
+        # missing buckets have nothing to subtract from
+        bucket_where_add = """
+    WHERE EXISTS (
+        SELECT 1
+        FROM cognition.message_rollup r
+        WHERE r.project_id = b.project_id AND r.bucket_start = b.bucket_start
+    )"""
+        conflict_set = f"""
+        message_count = GREATEST(message_rollup.message_count - EXCLUDED.message_count, 0),
+        feedback_counts = {__get_json_merge_sql("message_rollup.feedback_counts", "EXCLUDED.feedback_counts", sign)},
+        feedback_category_counts = {__get_json_merge_sql("message_rollup.feedback_category_counts", "EXCLUDED.feedback_category_counts", sign)},
+        response_time_histogram = {__get_json_merge_sql("message_rollup.response_time_histogram", "EXCLUDED.response_time_histogram", sign)},
+        updated_at = EXCLUDED.updated_at"""
+    else:
+        conflict_set = """
+        message_count = EXCLUDED.message_count,
+        feedback_counts = EXCLUDED.feedback_counts,
+        feedback_category_counts = EXCLUDED.feedback_category_counts,
+        response_time_histogram = EXCLUDED.response_time_histogram,
+        updated_at = EXCLUDED.updated_at"""
+    return f"""
+    WITH base AS (
+        SELECT
+            m.project_id,
+            date_trunc('hour', m.created_at) bucket_start,
+            m.feedback_value,
+            CASE WHEN m.feedback_value = 'negative' THEN m.feedback_category ELSE NULL END feedback_category,
+            {__get_bin_sql("mps.time_elapsed")} response_time
+        FROM cognition.message m
+        LEFT JOIN cognition.message_pipeline_summary mps
+            ON m.project_id = mps.project_id AND m.id = mps.message_id
+        WHERE m.created_at IS NOT NULL {where_add}
+    ), counts AS (
+        SELECT project_id, bucket_start, 'feedback_value' count_type, feedback_value count_key, COUNT(*) c
+        FROM base
+        WHERE feedback_value IS NOT NULL
+        GROUP BY 1, 2, 4
+        UNION ALL
+        SELECT project_id, bucket_start, 'feedback_category', feedback_category, COUNT(*)
+        FROM base
+        WHERE feedback_category IS NOT NULL
+        GROUP BY 1, 2, 4
+        UNION ALL
+        SELECT project_id, bucket_start, 'response_time', response_time::TEXT, COUNT(*)
+        FROM base
+        WHERE response_time IS NOT NULL
+        GROUP BY 1, 2, 4
+    )
+    INSERT INTO cognition.message_rollup (
+        project_id, bucket_start, message_count, feedback_counts, feedback_category_counts, response_time_histogram, updated_at)
+    SELECT
+        b.project_id,
+        b.bucket_start,
+        b.message_count,
+        COALESCE(json_object_agg(c.count_key, c.c) FILTER (WHERE c.count_type = 'feedback_value'), '{{}}'),
+        COALESCE(json_object_agg(c.count_key, c.c) FILTER (WHERE c.count_type = 'feedback_category'), '{{}}'),
+        COALESCE(json_object_agg(c.count_key, c.c) FILTER (WHERE c.count_type = 'response_time'), '{{}}'),
+        now()
+    FROM (
+        SELECT project_id, bucket_start, COUNT(*) message_count
+        FROM base
+        GROUP BY 1, 2
+    ) b
+    LEFT JOIN counts c
+        ON b.project_id = c.project_id AND b.bucket_start = c.bucket_start
+    {bucket_where_add}
+    GROUP BY b.project_id, b.bucket_start, b.message_count
+    ON CONFLICT (project_id, bucket_start) DO UPDATE
+    SET {conflict_set}"""
+
+
+def __get_bin_sql(time_sql: str) -> str:
+    bin_factor = 1 / RESPONSE_TIME_BIN_SECONDS
+    return f"(ROUND({time_sql}::NUMERIC * {bin_factor}) / {bin_factor})::NUMERIC(10,1)"
+
+
+def __get_json_delta_sql(counts: Optional[Dict[str, int]]) -> str:
+    if not counts:
+        return "'{}'::JSON"
+    parts = []
+    for key, change in counts.items():
+        key = prevent_sql_injection(key, isinstance(key, str))
+        change = prevent_sql_injection(change, isinstance(change, int))
+        parts.append(f"'{key}', {change}")
+    return f"json_build_object({', '.join(parts)})"
+
+
+def __get_json_merge_sql(column_sql: str, delta_sql: str, sign: int = 1) -> str:
+    # {key: count} + sign * delta, keys without a positive count are dropped
+    return f"""(
+            SELECT COALESCE(json_object_agg(x.key, x.count) FILTER (WHERE x.count > 0), '{{}}')
+            FROM (
+                SELECT y.key, SUM(y.count) count
+                FROM (
+                    SELECT key, value::INT count FROM json_each_text(COALESCE({column_sql}, '{{}}'))
+                    UNION ALL
+                    SELECT key, {sign} * value::INT FROM json_each_text({delta_sql})
+                ) y
+                GROUP BY y.key
+            ) x
+        )"""
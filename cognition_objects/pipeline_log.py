@@ -1,9 +1,33 @@
+import atexit
+import traceback
 from typing import List, Optional, Dict, Any
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import defer
 from ..business_objects import general
 from ..session import session
 from ..models import CognitionPipelineLogs
 from datetime import datetime
-from .. import enums
+from threading import Lock
+import time
+from .. import enums, daemon
+from . import message_pipeline_summary
+
+# buffered writes (see create_buffered) are flushed if one of the limits is reached
+BUFFER_MAX_LOGS = 50
+BUFFER_MAX_SECONDS = 2.0
+# cached iteration counters of messages without new logs are dropped after x seconds
+COUNTER_MAX_IDLE_SECONDS = 600
+# buffered logs use the db clock (like the now() default), the offset to the local clock is refreshed every x seconds
+DB_CLOCK_REFRESH_SECONDS = 300
+
+__BUFFER_LOCK = Lock()
+# message_id -> {"project_id": str, "logs": List[CognitionPipelineLogs], "buffered_at": float}
+__log_buffer = {}
+# message_id -> {"count": number of ROUTE_STRATEGY logs (written & buffered), "touched_at": float}
+__route_strategy_counter = {}
+__flush_thread_started = False
+# (offset db clock - local clock, checked_at)
+__db_clock_offset = None
 
 
 def get_all_by_message_id(
@@ -27,17 +51,31 @@ def get_all_by_message_id_until_step(
     strategy_step_type: str,
     strategy_step_id: Optional[str] = None,
     iteration_number: Optional[int] = None,
+    compute_in_sql: bool = False,
+    include_diffs: bool = True,
 ) -> List[CognitionPipelineLogs]:
-
-    pipeline_logs: List[CognitionPipelineLogs] = (
-        session.query(CognitionPipelineLogs)
-        .filter(
-            CognitionPipelineLogs.project_id == project_id,
-            CognitionPipelineLogs.message_id == message_id,
+    # compute_in_sql only loads the logs up to the cutoff (ROW_NUMBER over created_at)
+    # include_diffs=False defers the (large) record/scope dict diff columns, they are loaded on access
+    if compute_in_sql:
+        return __get_all_by_message_id_until_step_sql(
+            project_id,
+            message_id,
+            pipeline_step_type,
+            strategy_step_type,
+            strategy_step_id,
+            iteration_number,
+            include_diffs,
         )
-        .order_by(CognitionPipelineLogs.created_at.asc())
-        .all()
+
+    query = session.query(CognitionPipelineLogs).filter(
+        CognitionPipelineLogs.project_id == project_id,
+        CognitionPipelineLogs.message_id == message_id,
     )
+    if not include_diffs:
+        query = query.options(*__defer_diff_columns())
+    pipeline_logs: List[CognitionPipelineLogs] = query.order_by(
+        CognitionPipelineLogs.created_at.asc()
+    ).all()
 
     pipeline_logs_until_step = []
     for pipeline_log in pipeline_logs:
@@ -58,6 +96,75 @@ def get_all_by_message_id_until_step(
     return pipeline_logs_until_step
 
 
+def __get_all_by_message_id_until_step_sql(
+    project_id: str,
+    message_id: str,
+    pipeline_step_type: str,
+    strategy_step_type: str,
+    strategy_step_id: Optional[str],
+    iteration_number: Optional[int],
+    include_diffs: bool,
+) -> List[CognitionPipelineLogs]:
+    # same stop condition as the python loop, the first matching log is still included
+    same_iteration = CognitionPipelineLogs.iteration_number.is_not_distinct_from(
+        iteration_number
+    )
+    if strategy_step_id:
+        is_stop = case(
+            (
+                same_iteration,
+                and_(
+                    CognitionPipelineLogs.strategy_step_type == strategy_step_type,
+                    CognitionPipelineLogs.strategy_step_id == strategy_step_id,
+                ),
+            ),
+            else_=and_(
+                CognitionPipelineLogs.pipeline_step_type == pipeline_step_type,
+                same_iteration,
+            ),
+        )
+    else:
+        is_stop = and_(
+            CognitionPipelineLogs.pipeline_step_type == pipeline_step_type,
+            same_iteration,
+        )
+
+    numbered = (
+        session.query(
+            CognitionPipelineLogs.id,
+            func.row_number()
+            .over(order_by=CognitionPipelineLogs.created_at.asc())
+            .label("rn"),
+            is_stop.label("is_stop"),
+        )
+        .filter(
+            CognitionPipelineLogs.project_id == project_id,
+            CognitionPipelineLogs.message_id == message_id,
+        )
+        .cte("numbered")
+    )
+    cutoff = (
+        session.query(func.min(numbered.c.rn))
+        .filter(numbered.c.is_stop == True)
+        .scalar_subquery()
+    )
+    query = (
+        session.query(CognitionPipelineLogs)
+        .join(numbered, numbered.c.id == CognitionPipelineLogs.id)
+        .filter(or_(cutoff.is_(None), numbered.c.rn <= cutoff))
+    )
+    if not include_diffs:
+        query = query.options(*__defer_diff_columns())
+    return query.order_by(numbered.c.rn).all()
+
+
+def __defer_diff_columns() -> List[Any]:
+    return [
+        defer(CognitionPipelineLogs.record_dict_diff_previous_message),
+        defer(CognitionPipelineLogs.scope_dict_diff_previous_message),
+    ]
+
+
 def get_all_by_message_id_and_pipeline_step_type(
     project_id: str,
     message_id: str,
@@ -94,20 +201,245 @@ def create(
     count_strategy_step_id: Optional[bool] = False,
 ) -> CognitionPipelineLogs:
 
-    if count_pipeline_step_type or count_strategy_step_id:
-        number_logs = len(
-            get_all_by_message_id_and_pipeline_step_type(
-                project_id, message_id, enums.PipelineStep.ROUTE_STRATEGY.value
-            )
+    log = __build_log(
+        message_id,
+        project_id,
+        user_id,
+        content,
+        pipeline_step_type,
+        strategy_step_type,
+        strategy_step_id,
+        has_error,
+        time_elapsed,
+        record_dict_diff_previous,
+        scope_dict_diff_previous,
+        skipped_step,
+        created_at,
+        count_pipeline_step_type,
+        count_strategy_step_id,
+        False,
+    )
+
+    general.add(log)
+    if message_id:
+        message_pipeline_summary.add_log(
+            project_id, message_id, has_error, time_elapsed, content, created_at
+        )
+    general.flush_or_commit(with_commit)
+
+    return log
+
+
+def create_buffered(
+    message_id: str,
+    project_id: str,
+    user_id: str,
+    content: str,
+    pipeline_step_type: str,
+    strategy_step_type: str,
+    strategy_step_id: str,
+    has_error: bool,
+    time_elapsed: float,
+    record_dict_diff_previous: Dict[str, Any],
+    scope_dict_diff_previous: Dict[str, Any],
+    skipped_step: Optional[bool] = None,
+    created_at: Optional[datetime] = None,
+    count_pipeline_step_type: Optional[bool] = False,
+    count_strategy_step_id: Optional[bool] = False,
+    with_commit: bool = False,
+) -> CognitionPipelineLogs:
+    # same as create but the log is only written once the buffer of the message is flushed
+    # (buffer limits, error logs or an explicit flush e.g. on message completion)
+    # limit flushes are part of the caller's transaction (commit only with with_commit=True)
+    if created_at is None:
+        # the buffered entry should keep the creation time not the flush time
+        created_at = __get_db_now()
+    log = __build_log(
+        message_id,
+        project_id,
+        user_id,
+        content,
+        pipeline_step_type,
+        strategy_step_type,
+        strategy_step_id,
+        has_error,
+        time_elapsed,
+        record_dict_diff_previous,
+        scope_dict_diff_previous,
+        skipped_step,
+        created_at,
+        count_pipeline_step_type,
+        count_strategy_step_id,
+        True,
+    )
+    with __BUFFER_LOCK:
+        entry = __log_buffer.get(message_id)
+        if entry is None:
+            entry = {"project_id": project_id, "logs": [], "buffered_at": time.time()}
+            __log_buffer[message_id] = entry
+        entry["logs"].append(log)
+        needs_flush = (
+            has_error
+            or len(entry["logs"]) >= BUFFER_MAX_LOGS
+            or time.time() - entry["buffered_at"] >= BUFFER_MAX_SECONDS
+        )
+    if needs_flush:
+        flush(message_id, release_counter=False, with_commit=with_commit)
+    else:
+        # logs that aren't followed by another one are written by the background thread
+        __ensure_flush_thread()
+    return log
+
+
+def flush(
+    message_id: str, release_counter: bool = True, with_commit: bool = True
+) -> None:
+    # should be called on message completion or error, release_counter drops the cached iteration counter
+    with __BUFFER_LOCK:
+        entry = __log_buffer.pop(message_id, None)
+        if release_counter:
+            __route_strategy_counter.pop(message_id, None)
+    if not entry or not entry["logs"]:
+        return
+    general.add_all(entry["logs"])
+    if message_id:
+        message_pipeline_summary.add_logs(
+            entry["project_id"], message_id, entry["logs"]
+        )
+    general.flush_or_commit(with_commit)
+
+
+def flush_all(with_commit: bool = True) -> None:
+    # e.g. on shutdown
+    with __BUFFER_LOCK:
+        message_ids = list(__log_buffer.keys())
+    for message_id in message_ids:
+        flush(message_id, with_commit=with_commit)
+
+
+def flush_expired(with_commit: bool = True) -> None:
+    # writes buffers older than the time window & drops idle iteration counters
+    now = time.time()
+    with __BUFFER_LOCK:
+        message_ids = [
+            message_id
+            for message_id, entry in __log_buffer.items()
+            if now - entry["buffered_at"] >= BUFFER_MAX_SECONDS
+        ]
+        for message_id, counter in list(__route_strategy_counter.items()):
+            if (
+                message_id not in __log_buffer
+                and now - counter["touched_at"] >= COUNTER_MAX_IDLE_SECONDS
+            ):
+                del __route_strategy_counter[message_id]
+    for message_id in message_ids:
+        flush(message_id, release_counter=False, with_commit=with_commit)
+
+
+def __ensure_flush_thread() -> None:
+    global __flush_thread_started
+    with __BUFFER_LOCK:
+        if __flush_thread_started:
+            return
+        __flush_thread_started = True
+    daemon.run_with_db_token(__flush_periodically)
+    atexit.register(__flush_on_shutdown)
+
+
+def __flush_periodically() -> None:
+    while True:
+        time.sleep(BUFFER_MAX_SECONDS)
+        try:
+            flush_expired()
+        except Exception:
+            general.rollback()
+            print(traceback.format_exc(), flush=True)
+        daemon.reset_session_token_in_thread()
+
+
+def __flush_on_shutdown() -> None:
+    ctx_token = general.get_ctx_token()
+    try:
+        flush_all()
+    except Exception:
+        print(traceback.format_exc(), flush=True)
+    finally:
+        general.reset_ctx_token(ctx_token, True)
+
+
+def __get_db_now() -> datetime:
+    # same value the now() column default would write without a query per log
+    global __db_clock_offset
+    if (
+        __db_clock_offset is None
+        or time.time() - __db_clock_offset[1] >= DB_CLOCK_REFRESH_SECONDS
+    ):
+        db_now = general.execute_first("SELECT NOW()::TIMESTAMP")[0]
+        __db_clock_offset = (db_now - datetime.now(), time.time())
+    return datetime.now() + __db_clock_offset[0]
+
+
+def __get_route_strategy_count(project_id: str, message_id: str) -> int:
+    with __BUFFER_LOCK:
+        if message_id in __route_strategy_counter:
+            return __route_strategy_counter[message_id]["count"]
+    return (
+        session.query(CognitionPipelineLogs.id)
+        .filter(
+            CognitionPipelineLogs.project_id == project_id,
+            CognitionPipelineLogs.message_id == message_id,
+            CognitionPipelineLogs.pipeline_step_type
+            == enums.PipelineStep.ROUTE_STRATEGY.value,
         )
+        .count()
+    )
+
+
+def __build_log(
+    message_id: str,
+    project_id: str,
+    user_id: str,
+    content: str,
+    pipeline_step_type: str,
+    strategy_step_type: str,
+    strategy_step_id: str,
+    has_error: bool,
+    time_elapsed: float,
+    record_dict_diff_previous: Dict[str, Any],
+    scope_dict_diff_previous: Dict[str, Any],
+    skipped_step: Optional[bool],
+    created_at: Optional[datetime],
+    count_pipeline_step_type: Optional[bool],
+    count_strategy_step_id: Optional[bool],
+    keep_counter: bool,
+) -> CognitionPipelineLogs:
+    iteration_number = None
+    number_logs = None
+    is_route_strategy = pipeline_step_type == enums.PipelineStep.ROUTE_STRATEGY.value
+    if (
+        count_pipeline_step_type
+        or count_strategy_step_id
+        or (keep_counter and is_route_strategy)
+    ):
+        number_logs = __get_route_strategy_count(project_id, message_id)
         if count_pipeline_step_type:
             iteration_number = number_logs
         if count_strategy_step_id:
             iteration_number = number_logs - 1
-    else:
-        iteration_number = None
+    with __BUFFER_LOCK:
+        if keep_counter and number_logs is not None:
+            # counter is kept in memory after the first COUNT so later logs don't query again
+            __route_strategy_counter[message_id] = {
+                "count": number_logs + (1 if is_route_strategy else 0),
+                "touched_at": time.time(),
+            }
+        elif message_id in __route_strategy_counter:
+            counter = __route_strategy_counter[message_id]
+            counter["touched_at"] = time.time()
+            if is_route_strategy:
+                counter["count"] += 1
 
-    log = CognitionPipelineLogs(
+    return CognitionPipelineLogs(
         project_id=project_id,
         message_id=message_id,
         created_by=user_id,
@@ -124,10 +456,6 @@ def create(
         iteration_number=iteration_number,
     )
 
-    general.add(log, with_commit)
-
-    return log
-
 
 def delete_all_by_message_id(
     project_id: str,
@@ -138,6 +466,10 @@ def delete_all_by_message_id(
         CognitionPipelineLogs.project_id == project_id,
         CognitionPipelineLogs.message_id == message_id,
     ).delete()
+    with __BUFFER_LOCK:
+        __log_buffer.pop(message_id, None)
+        __route_strategy_counter.pop(message_id, None)
+    message_pipeline_summary.rebuild(project_id, message_id, with_commit=False)
 
     general.flush_or_commit(with_commit)
 
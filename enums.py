@@ -91,7 +91,9 @@ class Tablenames(Enum):
     EMBEDDING_TENSOR = "embedding_tensor"
     RECORD = "record"
     RECORD_TOKENIZED = "record_tokenized"
+    RECORD_TOKENIZED_CONTENT = "record_tokenized_content"
     RECORD_TOKENIZATION_TASK = "record_tokenization_task"
+    RECORD_TOKENIZATION_QUEUE = "record_tokenization_queue"
     RECORD_LABEL_ASSOCIATION = "record_label_association"
     RECORD_LABEL_ASSOCIATION_TOKEN = "record_label_association_token"
     RECORD_ATTRIBUTE_TOKEN_STATISTICS = "record_attribute_token_statistics"
@@ -121,6 +123,8 @@ class Tablenames(Enum):
     RETRIEVER_PART = "retriever_part"
     ENVIRONMENT_VARIABLE = "environment_variable"
     PIPELINE_LOGS = "pipeline_logs"
+    MESSAGE_PIPELINE_SUMMARY = "message_pipeline_summary"
+    MESSAGE_ROLLUP = "message_rollup"
     MARKDOWN_FILE = "markdown_file"
     PYTHON_STEP = "python_step"
     LLM_STEP = "llm_step"
@@ -267,6 +271,10 @@ class TokenizerTask(Enum):
     STATE_FAILED = "FAILED"
 
 
+class DocBinCompression(Enum):
+    ZSTD = "ZSTD"
+
+
 class NotificationType(Enum):
     # TASK STATES
     IMPORT_STARTED = "IMPORT_STARTED"
@@ -792,3 +800,12 @@ class FileCachingProcessingScope(Enum):
     EXTRACT_TRANSFORM = "EXTRACT_TRANSFORM"
     TRANSFORM = "TRANSFORM"
     CACHE = "CACHE"
+
+
+class DBEventType(Enum):
+    # payload types of the postgres NOTIFY channel (see business_objects.event_channel)
+    TASK_ENQUEUED = "TASK_ENQUEUED"
+    TASK_STATE_CHANGED = "TASK_STATE_CHANGED"
+    EMBEDDING_STATE_CHANGED = "EMBEDDING_STATE_CHANGED"
+    TOKENIZATION_STATE_CHANGED = "TOKENIZATION_STATE_CHANGED"
+    STATES_FAILED = "STATES_FAILED"
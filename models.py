@@ -25,12 +25,14 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     LargeBinary,
     String,
     sql,
     UniqueConstraint,
     BigInteger,
+    Computed,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
@@ -108,6 +110,15 @@ class AppVersion(Base):
 
 class CommentData(Base):
     __tablename__ = Tablenames.COMMENT_DATA.value
+    __table_args__ = (
+        # comment lookups are always for a set of keys of one type within a project
+        Index(
+            "idx_comment_data_project_id_xftype_xfkey",
+            "project_id",
+            "xftype",
+            "xfkey",
+        ),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     project_id = Column(
         UUID(as_uuid=True),
@@ -652,6 +663,29 @@ class RecordTokenized(Base):
     )
     bytes = Column(LargeBinary)
     columns = Column(ARRAY(String))
+    # set if the doc bin is stored (deduplicated) in record_tokenized_content, bytes is NULL in that case
+    content_hash = Column(String)
+
+
+class RecordTokenizedContent(Base):
+    # deduplicated doc bin storage, identical texts share one entry
+    __tablename__ = Tablenames.RECORD_TOKENIZED_CONTENT.value
+    __table_args__ = (
+        UniqueConstraint(
+            "project_id",
+            "content_hash",
+            name="unique_record_tokenized_content",
+        ),
+    )
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(f"{Tablenames.PROJECT.value}.id", ondelete="CASCADE"),
+        index=True,
+    )
+    content_hash = Column(String)
+    bytes = Column(LargeBinary)
+    compression = Column(String)  # of type enums.DocBinCompression.*.value or NULL
 
 
 class RecordTokenizationTask(Base):
@@ -677,6 +711,37 @@ class RecordTokenizationTask(Base):
     finished_at = Column(DateTime)
 
 
+class RecordTokenizationQueue(Base):
+    # pending (record, attribute) tokenization work, filled on writes & drained by the tokenizer
+    __tablename__ = Tablenames.RECORD_TOKENIZATION_QUEUE.value
+    __table_args__ = (
+        UniqueConstraint(
+            "record_id",
+            "attribute_id",
+            name="unique_record_tokenization_queue",
+        ),
+    )
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(f"{Tablenames.PROJECT.value}.id", ondelete="CASCADE"),
+        index=True,
+    )
+    record_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(f"{Tablenames.RECORD.value}.id", ondelete="CASCADE"),
+        index=True,
+    )
+    attribute_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(f"{Tablenames.ATTRIBUTE.value}.id", ondelete="CASCADE"),
+        index=True,
+    )
+    created_at = Column(DateTime, default=sql.func.now())
+    # set when a worker claimed the entry, entries are removed once done
+    claimed_at = Column(DateTime)
+
+
 class RecordLabelAssociation(Base):
     __tablename__ = Tablenames.RECORD_LABEL_ASSOCIATION.value
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -859,6 +924,10 @@ class InformationSource(Base):  # renamed from LabelFunction
         ForeignKey(f"{Tablenames.USER.value}.id", ondelete="SET NULL"),
         index=True,
     )
+    # extracted from the json source_code of annotator heuristics on write, so lookups can use an index
+    # (no generated column since source_code of other types isn't json)
+    data_slice_id = Column(String, index=True)
+    annotator_id = Column(String, index=True)
 
     source_statistics = parent_to_child_relationship(
         Tablenames.INFORMATION_SOURCE,
@@ -995,6 +1064,8 @@ class KnowledgeBase(Base):
     )
     name = Column(String)
     description = Column(String)
+    # incremented on term writes, used to invalidate compiled matchers
+    term_version = Column(Integer, default=0)
 
     terms = parent_to_child_relationship(
         Tablenames.KNOWLEDGE_BASE,
@@ -1004,6 +1075,13 @@ class KnowledgeBase(Base):
 
 class KnowledgeTerm(Base):
     __tablename__ = Tablenames.KNOWLEDGE_TERM.value
+    __table_args__ = (
+        UniqueConstraint(
+            "knowledge_base_id",
+            "value",
+            name="unique_knowledge_term_value",
+        ),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     project_id = Column(
         UUID(as_uuid=True),
@@ -1064,6 +1142,10 @@ class TaskQueue(Base):
         ForeignKey(f"{Tablenames.USER.value}.id", ondelete="SET NULL"),
         index=True,
     )
+    # generated from task_info (NULL for list infos) so project lookups can use an index
+    project_id = Column(
+        String, Computed("task_info->>'project_id'", persisted=True), index=True
+    )
 
 
 # --- COGNITION TABLES
@@ -1210,7 +1292,22 @@ class CognitionStrategyStep(Base):
 
 class CognitionConversation(Base):
     __tablename__ = Tablenames.CONVERSATION.value
-    __table_args__ = {"schema": "cognition"}
+    __table_args__ = (
+        # keyset pagination in both directions (see util.get_keyset_order_by)
+        Index(
+            "idx_conversation_project_id_created_at_id",
+            "project_id",
+            "created_at",
+            "id",
+        ),
+        Index(
+            "idx_conversation_project_id_created_at_id_desc",
+            "project_id",
+            sql.text("created_at DESC NULLS LAST"),
+            sql.text("id DESC"),
+        ),
+        {"schema": "cognition"},
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     project_id = Column(
         UUID(as_uuid=True),
@@ -1228,11 +1325,16 @@ class CognitionConversation(Base):
     error = Column(String)
     has_tmp_files = Column(Boolean, default=False)
     archived = Column(Boolean, default=False)
+    message_count = Column(Integer, default=0)  # maintained by message create/delete
 
 
 class CognitionMessage(Base):
     __tablename__ = Tablenames.MESSAGE.value
-    __table_args__ = {"schema": "cognition"}
+    __table_args__ = (
+        # analytics rollups are refreshed per project & hour
+        Index("idx_message_project_id_created_at", "project_id", "created_at"),
+        {"schema": "cognition"},
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     project_id = Column(
         UUID(as_uuid=True),
@@ -1306,6 +1408,47 @@ class CognitionPipelineLogs(Base):
     iteration_number = Column(Integer)
 
 
+class CognitionMessagePipelineSummary(Base):
+    # maintained on pipeline log creation so overviews don't need to probe the pipeline logs per message
+    __tablename__ = Tablenames.MESSAGE_PIPELINE_SUMMARY.value
+    __table_args__ = {"schema": "cognition"}
+    message_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(f"cognition.{Tablenames.MESSAGE.value}.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    project_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(f"cognition.{Tablenames.PROJECT.value}.id", ondelete="CASCADE"),
+        index=True,
+    )
+    last_log_at = Column(DateTime)
+    has_error = Column(Boolean)  # of the most recent log
+    error_count = Column(Integer, default=0)
+    last_error_content = Column(ARRAY(String))  # of the most recent log with error
+    time_elapsed = Column(Float, default=0)
+    step_count = Column(Integer, default=0)
+
+
+class CognitionMessageRollup(Base):
+    # hourly analytics buckets per project, coarser groups are aggregated from them
+    __tablename__ = Tablenames.MESSAGE_ROLLUP.value
+    __table_args__ = {"schema": "cognition"}
+    project_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(f"cognition.{Tablenames.PROJECT.value}.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    bucket_start = Column(DateTime, primary_key=True)
+    message_count = Column(Integer, default=0)
+    feedback_counts = Column(JSON)  # {feedback_value: count}
+    # {feedback_category: count} of negative feedback
+    feedback_category_counts = Column(JSON)
+    # {rounded seconds: count}, fixed 0.5 second bins so buckets can be merged by summing
+    response_time_histogram = Column(JSON)
+    updated_at = Column(DateTime, default=sql.func.now())
+
+
 class CognitionConsumptionLog(Base):
     __tablename__ = Tablenames.CONSUMPTION_LOG.value
     __table_args__ = {"schema": "cognition"}
@@ -1429,7 +1572,16 @@ class CognitionPersonalAccessToken(Base):
 
 class CognitionMarkdownDataset(Base):
     __tablename__ = Tablenames.MARKDOWN_DATASET.value
-    __table_args__ = {"schema": "cognition"}
+    __table_args__ = (
+        # keyset pagination (see util.get_keyset_order_by_sql)
+        Index(
+            "idx_markdown_dataset_organization_id_created_at_id",
+            "organization_id",
+            "created_at",
+            "id",
+        ),
+        {"schema": "cognition"},
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     organization_id = Column(
         UUID(as_uuid=True),
@@ -1458,7 +1610,16 @@ class CognitionMarkdownDataset(Base):
 
 class CognitionMarkdownFile(Base):
     __tablename__ = Tablenames.MARKDOWN_FILE.value
-    __table_args__ = {"schema": "cognition"}
+    __table_args__ = (
+        # keyset pagination newest first (see util.get_keyset_order_by_sql)
+        Index(
+            "idx_markdown_file_dataset_id_created_at_id_desc",
+            "dataset_id",
+            sql.text("created_at DESC NULLS LAST"),
+            sql.text("id DESC"),
+        ),
+        {"schema": "cognition"},
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     organization_id = Column(
         UUID(as_uuid=True),
@@ -1535,6 +1696,8 @@ class CognitionMacro(Base):
     state = Column(String)  # enums.MacroState
     name = Column(String)
     description = Column(String)
+    # incremented on node/edge changes, used to invalidate cached graphs
+    graph_version = Column(Integer, default=0)
 
 
 class CognitionMacroNode(Base):
@@ -1623,6 +1786,10 @@ class CognitionMacroExecution(Base):
     execution_group_id = Column(UUID(as_uuid=True), index=True, default=uuid.uuid4)
     # additional data for the execution, e.g. file name or project id if applicable
     meta_info = Column(JSON)
+    # generated from meta_info so message queue overviews can join & filter projects via index
+    project_id = Column(
+        String, Computed("meta_info->>'project_id'", persisted=True), index=True
+    )
 
 
 class CognitionMacroExecutionLink(Base):
@@ -1689,6 +1856,13 @@ class FileReference(Base):
             "file_size_bytes",
             name="unique_file_reference",
         ),
+        # keyset pagination by last usage (see util.get_keyset_order_by)
+        Index(
+            "idx_file_reference_organization_id_last_used_id_desc",
+            "organization_id",
+            sql.text("last_used DESC NULLS LAST"),
+            sql.text("id DESC"),
+        ),
         {"schema": "cognition"},
     )
 
@@ -1,19 +1,33 @@
 import os
-from typing import Tuple, Any, Union, List, Dict, Optional, Iterable
+import base64
+import json
+from typing import Tuple, Any, Union, List, Dict, Optional, Iterable, Set
 from pydantic import BaseModel
-import collections
+import collections.abc
 from re import sub, match, compile
 import sqlalchemy
 from uuid import UUID
-from datetime import datetime
+from datetime import date, datetime, time
+from decimal import Decimal
 
 
+from sqlalchemy import and_, tuple_
 from sqlalchemy.sql import text as sql_text
 from sqlalchemy.engine.row import Row
 from .models import Base
 from .business_objects import general
 
+try:
+    # optional, to_frontend_json falls back to the json module
+    import orjson
+except ImportError:
+    orjson = None
+
 CAMEL_CASE_PATTERN = compile(r"^([a-z]+[A-Z]?)*$")
+# keys are mostly column names but can come from json data as well => bounded
+CAMEL_CASE_CACHE_MAX_ENTRIES = 10000
+
+__camel_case_cache = {}
 
 
 def collect_engine_variables() -> Tuple[int, int, bool, bool]:
@@ -151,8 +165,11 @@ def __sql_alchemy_to_dict(
             if not column_whitelist or k in column_whitelist
         }
     elif isinstance(sql_alchemy_object, Base):
+        deferred = __get_deferred_unloaded(sql_alchemy_object)
         return {
-            c.name: getattr(sql_alchemy_object, c.name)
+            c.name: (
+                None if c.name in deferred else getattr(sql_alchemy_object, c.name)
+            )
             for c in sql_alchemy_object.__table__.columns
             if not column_whitelist or c.name in column_whitelist
         }
@@ -160,6 +177,17 @@ def __sql_alchemy_to_dict(
         return sql_alchemy_object
 
 
+def __get_deferred_unloaded(sql_alchemy_object: Any) -> Set[str]:
+    # columns left out by the loading query (defer/load_only) are serialized as None
+    # => no query per object & no DetachedInstanceError, expired columns are still refreshed as usual
+    state = sqlalchemy.inspect(sql_alchemy_object)
+    if state.runid is None:
+        # not loaded by a query (e.g. created & flushed here) => nothing was deferred
+        # unassigned columns of such objects are unloaded too but need the usual access
+        return set()
+    return state.unloaded - state.expired_attributes
+
+
 def to_frontend_obj(value: Union[List, Dict]):
     if isinstance(value, dict):
         return {__to_camel_case(k): to_frontend_obj(v) for k, v in value.items()}
@@ -178,6 +206,131 @@ def to_frontend_obj_raw(value: Union[List, Dict]):
         return __to_json_serializable(value)
 
 
+# same output as sql_alchemy_to_dict(..., for_frontend=True) / to_frontend_obj but meant for large results
+# dispatches on exact types, caches camelCase keys & builds one converter per row shape/model
+def sql_alchemy_to_frontend_obj(
+    sql_alchemy_object: Any, column_whitelist: Optional[Iterable[str]] = None
+):
+    if column_whitelist:
+        column_whitelist = set(column_whitelist)
+    return __sql_alchemy_to_frontend_obj(sql_alchemy_object, column_whitelist, {})
+
+
+def to_frontend_obj_fast(value: Any):
+    converter = __FAST_CONVERTERS.get(type(value))
+    if converter is None:
+        # e.g. subclasses or generators, rare enough for the generic version
+        return to_frontend_obj(value)
+    return converter(value)
+
+
+def to_frontend_json(
+    value: Any, column_whitelist: Optional[Iterable[str]] = None
+) -> bytes:
+    # json encoded frontend object, uses orjson if installed
+    frontend_obj = sql_alchemy_to_frontend_obj(value, column_whitelist)
+    if orjson is not None:
+        return orjson.dumps(
+            frontend_obj, default=__json_default, option=orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(
+        frontend_obj, default=__json_default, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def __sql_alchemy_to_frontend_obj(
+    sql_alchemy_object: Any,
+    column_whitelist: Optional[set],
+    converters: Dict[Any, List[Tuple[Any, str]]],
+):
+    if isinstance(sql_alchemy_object, list):
+        return [
+            __sql_alchemy_to_frontend_obj(x, column_whitelist, converters)
+            for x in sql_alchemy_object
+        ]
+    elif isinstance(sql_alchemy_object, Row):
+        # all rows of a result share their fields => index & camelCase key only resolved once
+        fields = sql_alchemy_object._fields
+        converter = converters.get(fields)
+        if converter is None:
+            converter = [
+                (idx, __to_camel_case_cached(k))
+                for idx, k in enumerate(fields)
+                if not column_whitelist or k in column_whitelist
+            ]
+            converters[fields] = converter
+        return {
+            k: to_frontend_obj_fast(sql_alchemy_object[idx]) for idx, k in converter
+        }
+    elif isinstance(sql_alchemy_object, Base):
+        model = type(sql_alchemy_object)
+        converter = converters.get(model)
+        if converter is None:
+            converter = [
+                (c.name, __to_camel_case_cached(c.name))
+                for c in sql_alchemy_object.__table__.columns
+                if not column_whitelist or c.name in column_whitelist
+            ]
+            converters[model] = converter
+        deferred = __get_deferred_unloaded(sql_alchemy_object)
+        return {
+            k: (
+                None
+                if name in deferred
+                else to_frontend_obj_fast(getattr(sql_alchemy_object, name))
+            )
+            for name, k in converter
+        }
+    return to_frontend_obj_fast(sql_alchemy_object)
+
+
+def __fast_dict_to_frontend_obj(value: Dict) -> Dict:
+    return {
+        __to_camel_case_cached(k): to_frontend_obj_fast(v) for k, v in value.items()
+    }
+
+
+def __fast_list_to_frontend_obj(value: Union[List, Tuple]) -> List:
+    return [to_frontend_obj_fast(x) for x in value]
+
+
+def __fast_identity(value: Any) -> Any:
+    return value
+
+
+__FAST_CONVERTERS = {
+    dict: __fast_dict_to_frontend_obj,
+    list: __fast_list_to_frontend_obj,
+    tuple: __fast_list_to_frontend_obj,
+    str: __fast_identity,
+    int: __fast_identity,
+    float: __fast_identity,
+    bool: __fast_identity,
+    type(None): __fast_identity,
+    datetime: datetime.isoformat,
+    UUID: str,
+}
+
+
+def __to_camel_case_cached(name: str) -> str:
+    camel_case = __camel_case_cache.get(name)
+    if camel_case is None:
+        camel_case = __to_camel_case(name)
+        if len(__camel_case_cache) >= CAMEL_CASE_CACHE_MAX_ENTRIES:
+            __camel_case_cache.clear()
+        __camel_case_cache[name] = camel_case
+    return camel_case
+
+
+def __json_default(x: Any):
+    # types the frontend objects can still contain (e.g. NUMERIC columns)
+    if isinstance(x, Decimal):
+        return float(x)
+    elif isinstance(x, (date, time)):
+        return x.isoformat()
+    raise TypeError(f"Object of type {type(x).__name__} is not JSON serializable")
+
+
 def __to_json_serializable(x: Any):
     if isinstance(x, datetime):
         return x.isoformat()
@@ -196,7 +349,7 @@ def __to_camel_case(name: str):
 
 def is_list_like(value: Any) -> bool:
     return (
-        isinstance(value, collections.Iterable)
+        isinstance(value, collections.abc.Iterable)
         and not isinstance(value, str)
         and not isinstance(value, dict)
         and not isinstance(value, Row)
@@ -244,5 +397,83 @@ def __mask_sql_str(sql_str: str, remove_quotes: bool) -> str:
     return value
 
 
+# opaque continuation token for keyset pagination over (sort value, id)
+# the frontend only passes it back so the content isn't part of any contract
+# sort value can be None (e.g. unused files), those rows are ordered last (see get_keyset_order_by)
+def encode_keyset_cursor(sort_value: Optional[datetime], id: Any) -> str:
+    raw = json.dumps(
+        [sort_value.isoformat() if sort_value is not None else None, str(id)]
+    )
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_keyset_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    try:
+        sort_value, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if sort_value is not None:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, str(UUID(id))
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+def get_keyset_filter(
+    sort_column: Any,
+    id_column: Any,
+    sort_value: Optional[datetime],
+    id: str,
+    order_asc: bool = True,
+) -> Any:
+    # rows after the cursor for the order of get_keyset_order_by (NULLS LAST in both directions)
+    # plain row comparison so it can be used as index seek, it doesn't include the NULL part
+    # => for nullable sort columns continue with get_keyset_null_filter once the non NULL rows are used up
+    if sort_value is None:
+        return get_keyset_null_filter(sort_column, id_column, id, order_asc)
+    key = tuple_(sort_column, id_column)
+    return key > (sort_value, id) if order_asc else key < (sort_value, id)
+
+
+def get_keyset_null_filter(
+    sort_column: Any,
+    id_column: Any,
+    id: Optional[str] = None,
+    order_asc: bool = True,
+) -> Any:
+    # rows with a NULL sort value (after id if given)
+    if id is None:
+        return sort_column.is_(None)
+    return and_(sort_column.is_(None), id_column > id if order_asc else id_column < id)
+
+
+def get_keyset_order_by(
+    sort_column: Any, id_column: Any, order_asc: bool = True
+) -> List[Any]:
+    if order_asc:
+        return [sort_column.asc().nullslast(), id_column.asc()]
+    return [sort_column.desc().nullslast(), id_column.desc()]
+
+
+def get_keyset_filter_sql(
+    sort_column: str,
+    id_column: str,
+    sort_value: Optional[datetime],
+    id: str,
+    order_asc: bool = True,
+) -> str:
+    # raw sql version of get_keyset_filter, values need to come from decode_keyset_cursor (validated)
+    # only meant for sort columns that are always set (e.g. created_at)
+    operator = ">" if order_asc else "<"
+    if sort_value is None:
+        return f"({sort_column} IS NULL AND {id_column} {operator} '{id}'::UUID)"
+    return f"""({sort_column}, {id_column}) {operator} ('{sort_value.isoformat()}'::TIMESTAMP, '{id}'::UUID)"""
+
+
+def get_keyset_order_by_sql(
+    sort_column: str, id_column: str, order_asc: bool = True
+) -> str:
+    direction = "ASC" if order_asc else "DESC"
+    return f"{sort_column} {direction} NULLS LAST, {id_column} {direction}"
+
+
 def ensure_sql_text(sql: str) -> str:
     return sql_text(sql)